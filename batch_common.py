@@ -0,0 +1,170 @@
+import os
+import shutil
+from multiprocessing import cpu_count
+
+from meta_data import load_meta_data, meta_str, filter_meta_data, parse_meta_filters
+from platform_map import build_platform_map, save_platform_map, load_platform_map
+from cohort_store import create_cohort_store, cohort_store_matches
+from batch_scheduler import report_failures
+from batch_manifest import file_signature, is_up_to_date, record_output, compact_manifest
+from batch_stats import record_stats, summarize_stats
+
+# setup & bookkeeping shared by the batch drivers (batch_meth_data.py,
+# batch_pipeline.py, batch_hilbert_img.py). parameter errors print a [~]
+# line and exit(-1) like the checks of the single-file scripts
+
+def check_inputs(folder_input, filename_meta, filename_index = None) :
+	if not os.path.isdir(folder_input) :
+		print('[~] "{0}" input does not exist!'.format(folder_input))
+		exit(-1)
+
+	if not os.path.isfile(filename_meta) :
+		print('[~] meta file "{0}" does not exist!'.format(filename_meta))
+		exit(-1)
+
+	if filename_index != None and not os.path.exists(filename_index) :
+		print("[~] CG index .cgidx file \"{0}\" does not exist!".format(filename_index))
+		exit(-1)
+
+# the output folder is rebuilt unless the run is incremental
+
+def prepare_output_folder(folder_output, incremental) :
+	if os.path.isdir(folder_output) and not incremental :
+		shutil.rmtree(folder_output, ignore_errors = True)
+	if not os.path.isdir(folder_output) :
+		os.makedirs(folder_output)
+
+def process_count(n_p) :
+	if n_p == None :
+		n_p = cpu_count()
+		print('[!] missing parallel parameters, using CPU count {0}'.format(n_p))
+		if n_p <= 0 :
+			n_p = 1
+			print('[!] undetected CPU count, using 1')
+
+	return n_p
+
+# filters : the -f field=values arguments, None or empty keeps every row
+
+def load_run_meta_data(filename_meta, filters) :
+	print('[*] parsing meta file')
+	meta_data = load_meta_data(filename_meta)
+	if filters :
+		try :
+			meta_data = filter_meta_data(meta_data, parse_meta_filters(filters))
+		except ValueError as e :
+			print('[~] {0}'.format(e))
+			exit(-1)
+		print('[*] {0} samples match the meta filters'.format(len(meta_data)))
+
+	return meta_data
+
+def meth_filename_of(meta, folder_input) :
+	return os.path.join(folder_input, meta_str(meta['file_id']), meta_str(meta['file_name']))
+
+def load_or_build_platform_map(filename_platform, cg_index, meta_data, folder_input) :
+	if os.path.isfile(filename_platform) :
+		print('[*] loading platform map')
+		return load_platform_map(filename_platform)
+
+	for meta in meta_data:
+		filename_meth = meth_filename_of(meta, folder_input)
+		if os.path.isfile(filename_meth) :
+			print('[*] building platform map from {0}'.format(filename_meth))
+			platform_map = build_platform_map(cg_index, filename_meth)
+			save_platform_map(platform_map, filename_platform)
+			return platform_map
+
+	return None
+
+# platform map of the run, None without -P or when no methylation file
+# exists to build it from
+
+def load_run_platform_map(filename_platform, cg_index, meta_data, folder_input) :
+	if filename_platform == None :
+		return None
+
+	platform_map = load_or_build_platform_map(filename_platform, cg_index, meta_data, folder_input)
+	if platform_map != None and platform_map.cg_count != len(cg_index.positions) :
+		print('[~] platform map "{0}" was built with a different cg index!'.format(filename_platform))
+		exit(-1)
+
+	return platform_map
+
+# an incremental run keeps a cohort store with the same rows & width,
+# otherwise the store is created anew
+
+def prepare_cohort_store(folder_store, meta_data, cg_count, incremental) :
+	if incremental and cohort_store_matches(folder_store, meta_data['file_id'], cg_count) :
+		print('[*] reusing cohort store {0}'.format(folder_store))
+		return
+
+	if os.path.isdir(folder_store) :
+		shutil.rmtree(folder_store, ignore_errors = True)
+	create_cohort_store(folder_store, meta_data['file_id'], meta_data['file_name'], cg_count)
+	print('[*] cohort store {0} created'.format(folder_store))
+
+# parameters the cg data of a sample depends on, a new cohort store
+# changes the store signature and so makes every sample stale
+
+def meth_params(filename_index, filename_platform, platform_map, folder_store) :
+	return {
+		'index' : [os.path.abspath(filename_index), file_signature(filename_index)],
+		'platform' : [os.path.abspath(filename_platform), file_signature(filename_platform)] if platform_map != None else None,
+		'store' : [os.path.abspath(folder_store), file_signature(os.path.join(folder_store, 'version.npy'))] if folder_store != None else None}
+
+# rows of the samples to process and their input sizes. a sample is
+# skipped when input_signature gives its inputs and the manifest has an
+# output of them with the same params
+
+def stale_samples(meta_data, manifest, params, input_signature, input_size) :
+	rows = []
+	sizes = []
+	for row, meta in enumerate(meta_data) :
+		inputs = input_signature(meta)
+		if inputs != None and is_up_to_date(manifest.get(meta_str(meta['file_id'])), inputs, params) :
+			continue
+		rows += [(row, meta)]
+		sizes += [input_size(meta)]
+
+	if len(rows) < len(meta_data) :
+		print('[*] {0} of {1} samples up to date, skipped'.format(len(meta_data) - len(rows), len(meta_data)))
+
+	return rows, sizes
+
+def meth_input_signature(folder_input) :
+	def input_signature(meta) :
+		filename_meth = meth_filename_of(meta, folder_input)
+		return {'meth' : file_signature(filename_meth)} if os.path.isfile(filename_meth) else None
+	return input_signature
+
+def meth_input_size(folder_input) :
+	def input_size(meta) :
+		filename_meth = meth_filename_of(meta, folder_input)
+		return os.path.getsize(filename_meth) if os.path.isfile(filename_meth) else 0
+	return input_size
+
+# worker side, the output folder of a sample and its manifest & stats
+# records once all its outputs are written
+
+def sample_folder(folder_output, meta) :
+	folder_meta = os.path.join(folder_output, meta_str(meta['file_id']))
+	if not os.path.isdir(folder_meta) :
+		os.makedirs(folder_meta, exist_ok = True)
+
+	return folder_meta
+
+def record_sample(folder_output, meta, inputs, params, outputs, stats) :
+	record_output(folder_output, meta_str(meta['file_id']), inputs, params, outputs)
+	record_stats(folder_output, stats)
+
+# end of a run, exits 1 when a task failed
+
+def finish_run(folder_output, failures, task_count) :
+	compact_manifest(folder_output)
+	failure_count = report_failures(failures, task_count, folder_output)
+	summarize_stats(folder_output)
+
+	print('[*] complete')
+	if failure_count :
+		exit(1)
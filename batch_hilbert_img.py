@@ -4,84 +4,253 @@
 import argparse
 import os
 import sys
-import shutil
 import numpy as np
-from numpy import genfromtxt
-from multiprocessing import Process
-from multiprocessing import Pool
-from multiprocessing import cpu_count, current_process
-
-import matplotlib as mpl
-if os.environ.get('DISPLAY','') == '':
-    print('[!] No display found, using non-interactive Agg backend')
-    mpl.use('Agg')
-import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
-import matplotlib.cm as cm
+from multiprocessing import current_process
 
 import hilbert as hb
-
-def load_meta_data(filename_meta) :
-	meta_data = genfromtxt(filename_meta, delimiter = ',',
-		autostrip = True,
-		dtype = ('|S64', '|S128', '|S32', '|S64', 'b1', '<f8', '|S16', 'b1', '<i4', '|S32', 'b1'),
-		names = ('file_id', 'file_name', 'primary_site', 'disease_type', 'gender', 'age', 'race', 'is_tumor', 'sample_type_id', 'sample_type', 'is_alive'))
-	return meta_data
+import hilbert_render as hr
+from image_io import IMAGE_FORMATS, image_extension, save_hilbert_image
+from cohort_store import is_cohort_store, open_cohort_store, read_cohort_sample
+from meta_data import meta_str
+from batch_scheduler import run_tasks
+from batch_manifest import file_signature, load_manifest, record_output
+from batch_stats import new_stats, timed, add_read, add_written, file_size, reset_stats, record_stats
+from batch_common import check_inputs, prepare_output_folder, process_count, load_run_meta_data, stale_samples
+from batch_common import sample_folder, record_sample, finish_run
 
 def load_cg_meth(filename_cg_meth) :
 	cg_meth = np.load(filename_cg_meth)
 	return cg_meth['meth']
 
-def generate_hilbert_map(v, r, N, filename) :
-	plt_data = np.array(hb.hilbert_plot(v, r))
-	x = plt_data[:, 0]
-	y = plt_data[:, 1]
-	z = plt_data[:, 2]
-
-	dmax = 2**r
-	xs, ys = np.mgrid[0:dmax:N, 0:dmax:N]
-	zs = griddata((x, y), z, (xs, ys))
-	plt.imsave(filename, zs.T, cmap = cm.gray_r, vmin = 0, vmax = 1)
+def filename_cg_meth_of(meta, folder_input) :
+	return os.path.join(folder_input, meta_str(meta['file_id']), os.path.splitext(meta_str(meta['file_name']))[0] + '.cg.meth.npz')
 
-def process_hilbert(meta, r, N, folder_input, folder_output, total_count, current_count) :
-	proc_name = current_process().name
-	print('[*] processing meta {0} on process {1} ({2}/{3})'.format(meta['file_id'], proc_name, current_count, total_count))
+# cg data comes from a cohort store when the input folder is one, otherwise
+# from the per-sample .cg.meth.npz files, None if the sample is missing
 
-	# mkdir & clean meth data
-		
-	folder_meta = os.path.join(folder_output, meta['file_id'])
-	try:
-		os.stat(folder_meta)
-	except:
-		os.mkdir(folder_meta)
+_cohort_stores = {}
 
-	# load meth data
+def load_sample_cg_meth(meta, folder_input) :
+	if is_cohort_store(folder_input) :
+		if folder_input not in _cohort_stores :
+			_cohort_stores[folder_input] = open_cohort_store(folder_input)
+		cg_meth = read_cohort_sample(_cohort_stores[folder_input], meta['file_id'])
+		if cg_meth is None :
+			print('[!] methylation data of {0} is not in cohort store "{1}", skip'.format(meta_str(meta['file_id']), folder_input))
+		return cg_meth
 
-	filename_cg_meth = os.path.join(folder_input, meta['file_id'], os.path.splitext(meta['file_name'])[0] + '.cg.meth.npz')
+	filename_cg_meth = filename_cg_meth_of(meta, folder_input)
 	if not os.path.isfile(filename_cg_meth) :
 		print('[!] methylation data file "{0}" does not exist, skip'.format(filename_cg_meth))
-		pass
+		return None
+	return load_cg_meth(filename_cg_meth)
+
+# bytes read for the cg data of a sample, a cohort store row or .cg.meth.npz
+
+def sample_input_size(meta, folder_input, cg_meth) :
+	if is_cohort_store(folder_input) :
+		return _cohort_stores[folder_input].meth.dtype.itemsize * len(cg_meth)
+	return file_size(filename_cg_meth_of(meta, folder_input))
+
+# signature of the cg data of a sample for the output manifest
+
+def sample_input_signature(meta, folder_input) :
+	if is_cohort_store(folder_input) :
+		if folder_input not in _cohort_stores :
+			_cohort_stores[folder_input] = open_cohort_store(folder_input)
+		store = _cohort_stores[folder_input]
+		row = store.rows.get(meta_str(meta['file_id']))
+		if row == None or not store.status[row] :
+			return None
+		return {'cohort' : [os.path.abspath(folder_input), float(store.status[row])]}
+
+	filename_cg_meth = filename_cg_meth_of(meta, folder_input)
+	if not os.path.isfile(filename_cg_meth) :
+		return None
+	return {'cg_meth' : file_signature(filename_cg_meth)}
+
+# render modes, 'interp' interpolates onto an N x N mesh, the binning
+# statistics write one point per curve cell, a (2**r, 2**r) image. counts
+# are scaled by the most values a cell can hold so images stay in [0, 1]
+
+RENDER_MODES = ('interp', ) + hb.HILBERT_STATS
+
+def scale_cell_image(zs, n, r, render) :
+	if render == 'count' :
+		return zs / float(-(-n // 4 ** r))
+	return zs
+
+def render_hilbert_image(v, r, N, render = 'interp') :
+	if render == 'interp' :
+		return hr.render_hilbert_map(v, r, N)
+	return scale_cell_image(hb.hilbert_bin(v, r, render), len(v), r, render)
 
-	cg_meth_data = load_cg_meth(filename_cg_meth)
+def image_size_of(r, N, render) :
+	return N if render == 'interp' else 2 ** r
+
+# images are written by image_io, matplotlib is only loaded for the 'mpl'
+# format and scipy only for interpolated renders. render & write times and
+# written bytes go into stats when given
+
+def generate_hilbert_map(v, r, N, filename, render = 'interp', image_format = 'png', stats = None) :
+	with timed(stats, 'render') :
+		zs = render_hilbert_image(v, r, N, render)
+	with timed(stats, 'write') :
+		save_hilbert_image(filename, zs, image_format)
+	add_written(stats, file_size(filename))
+
+# pyramid mode, binned images of resolutions r, r - 1, ... from one pass,
+# level k is written as <name>.r<k>.png (.npy) with 2**k points per side
+
+def generate_hilbert_pyramid(v, r, levels, filename_base, stat = 'mean', image_format = 'png', stats = None) :
+	filenames = []
+	with timed(stats, 'render') :
+		images = hb.hilbert_pyramid(v, r, levels, stat)
+	for k, zs in zip(range(r, -1, -1), images) :
+		filename = '{0}.r{1}{2}'.format(filename_base, k, image_extension(image_format))
+		with timed(stats, 'write') :
+			zs = scale_cell_image(zs, len(v), k, stat)
+			save_hilbert_image(filename, zs, image_format)
+		add_written(stats, file_size(filename))
+		filenames += [filename]
+
+	return filenames
+
+def process_hilbert(meta, r, N, folder_input, folder_output, params, total_count, current_count) :
+	proc_name = current_process().name
+	print('[*] processing meta {0} on process {1} ({2}/{3})'.format(meta_str(meta['file_id']), proc_name, current_count, total_count))
+
+	folder_meta = sample_folder(folder_output, meta)
+
+	# load meth data
+
+	stats = new_stats(meta_str(meta['file_id']))
+	inputs = sample_input_signature(meta, folder_input)
+	with timed(stats, 'parse') :
+		cg_meth_data = load_sample_cg_meth(meta, folder_input)
+	if cg_meth_data is None :
+		raise IOError('methylation data of {0} does not exist'.format(meta_str(meta['file_id'])))
+	add_read(stats, sample_input_size(meta, folder_input, cg_meth_data))
 
 	# generate hilbert map
 
-	filename_hilbert = os.path.join(folder_meta, os.path.splitext(meta['file_name'])[0] + '.png')
-	generate_hilbert_map(cg_meth_data, r, N, filename_hilbert)
-	print('[*] meta {0} on process {1} complete (#{2})'.format(meta['file_id'], proc_name, current_count))
-	print('[*] {0} written'.format(filename_hilbert))
+	filename_base = os.path.join(folder_meta, os.path.splitext(meta_str(meta['file_name']))[0])
+	if params.get('pyramid') :
+		stat = params['render'] if params['render'] != 'interp' else 'mean'
+		filenames_hilbert = generate_hilbert_pyramid(cg_meth_data, r, params['pyramid'], filename_base, stat, params['format'], stats)
+	else :
+		filenames_hilbert = [filename_base + image_extension(params['format'])]
+		generate_hilbert_map(cg_meth_data, r, N, filenames_hilbert[0], params['render'], params['format'], stats)
+	record_sample(folder_output, meta, inputs, params, filenames_hilbert, stats)
+	print('[*] meta {0} on process {1} complete (#{2})'.format(meta_str(meta['file_id']), proc_name, current_count))
+	print('[*] {0} written'.format(', '.join(filenames_hilbert)))
 	sys.stdout.flush()
 	sys.stderr.flush()
 
+def image_store_matches(filename_store, meta_data, N, dtype) :
+	filename_ids = os.path.splitext(filename_store)[0] + '.ids.csv'
+	if not os.path.isfile(filename_store) or not os.path.isfile(filename_ids) :
+		return False
+	store = np.load(filename_store, mmap_mode = 'r')
+	if store.shape != (len(meta_data), N, N) or store.dtype != np.dtype(dtype) :
+		return False
+	with open(filename_ids, 'r') as ids_file :
+		file_ids = [line.split(',')[1] for line in ids_file]
+	return file_ids == [meta_str(meta['file_id']) for meta in meta_data]
+
+# image store, a (samples x N x N) .npy of float32 images (nan where
+# nothing is drawn) or uint8 images of beta * 254 with 255 where nothing is
+# drawn, see hilbert_render.to_image_dtype / from_image_dtype. rows of
+# samples not rendered yet hold only the missing value
+
+def create_image_store(filename_store, meta_data, N, dtype) :
+	store = np.lib.format.open_memmap(filename_store, mode = 'w+', dtype = dtype, shape = (len(meta_data), N, N))
+	store[:] = hr.image_missing_value(dtype)
+	store.flush()
+	del store
+
+	# sample id sidecar, row i of the store is sample i of the meta file
+
+	filename_ids = os.path.splitext(filename_store)[0] + '.ids.csv'
+	with open(filename_ids, 'w') as ids_file :
+		for row, meta in enumerate(meta_data) :
+			ids_file.write('{0},{1},{2}\n'.format(row, meta_str(meta['file_id']), meta_str(meta['file_name'])))
+
+	return filename_ids
+
+def process_hilbert_block(block, r, N, folder_input, folder_output, filename_store, folder_png, params) :
+	proc_name = current_process().name
+	rows = [row for row, meta in block]
+	print('[*] processing samples {0} on process {1}'.format(','.join(str(row) for row in rows), proc_name))
+
+	# the block is rendered together, its stats are one record
+
+	stats = new_stats('samples {0}'.format(','.join(str(row) for row in rows)))
+
+	# load the block into a (samples x CpGs) matrix
+
+	rows_loaded = []
+	inputs_loaded = []
+	cg_meth_block = []
+	failures = []
+	for row, meta in block :
+		inputs = sample_input_signature(meta, folder_input)
+		with timed(stats, 'parse') :
+			cg_meth = load_sample_cg_meth(meta, folder_input)
+		if cg_meth is None :
+			failures += [(meta_str(meta['file_id']), 'methylation data does not exist')]
+			continue
+		add_read(stats, sample_input_size(meta, folder_input, cg_meth))
+		rows_loaded += [row]
+		inputs_loaded += [inputs]
+		cg_meth_block += [np.asarray(cg_meth, dtype = np.float32)]
+
+	if not rows_loaded :
+		return failures
+
+	with timed(stats, 'render') :
+		if params['render'] == 'interp' :
+			zs = hr.render_hilbert_maps(np.vstack(cg_meth_block), r, N)
+		else :
+			zs = np.stack([render_hilbert_image(cg_meth, r, N, params['render']) for cg_meth in cg_meth_block])
+
+	# write rows in place
+
+	with timed(stats, 'write') :
+		store = np.load(filename_store, mmap_mode = 'r+')
+		store[rows_loaded] = hr.to_image_dtype(zs, store.dtype)
+		store.flush()
+		add_written(stats, len(rows_loaded) * store[0].nbytes)
+		del store
+
+	for i, row in enumerate(rows_loaded) :
+		meta = block[rows.index(row)][1]
+		outputs = [filename_store]
+		if folder_png != None :
+			folder_meta = sample_folder(folder_png, meta)
+			filename_hilbert = os.path.join(folder_meta, os.path.splitext(meta_str(meta['file_name']))[0] + image_extension(params['format']))
+			with timed(stats, 'write') :
+				save_hilbert_image(filename_hilbert, zs[i], params['format'])
+			add_written(stats, file_size(filename_hilbert))
+			outputs += [filename_hilbert]
+		record_output(folder_output, meta_str(meta['file_id']), inputs_loaded[i], params, outputs)
+	record_stats(folder_output, stats)
+
+	print('[*] samples {0} on process {1} complete'.format(','.join(str(row) for row in rows), proc_name))
+	sys.stdout.flush()
+	sys.stderr.flush()
+
+	return failures
+
 if __name__ == "__main__":
 
 	# command line arguments
 
 	parser = argparse.ArgumentParser(description = "batch generating hilbert image")
 	parser.add_argument("-i", "--input", dest = "input", required = True,
-		help = "input data folder", metavar = "FOLDER")
+		help = "input data folder or cohort store folder", metavar = "FOLDER")
 	parser.add_argument("-m", "--meta", dest = "meta", required = True,
-		help = "cleaned meta filename", metavar = "FILE")
+		help = "cleaned meta .csv or .npy table filename", metavar = "FILE")
 	parser.add_argument("-o", "--output", dest = "output", required = False,
 		help = "output folder", metavar = "FOLDER")
 	parser.add_argument("-p", "--process", dest = "process", required = False, type = int,
@@ -89,53 +258,126 @@ if __name__ == "__main__":
 	parser.add_argument("-r", "--resolution", dest = "resolution", required = False, type = int, default = 10,
 		help = "hilbert resolution", metavar = "INTEGER")
 	parser.add_argument("-N", "--image-point", dest = "N", required = False, type = int, default = 300,
-		help = "image point in imaginary form", metavar = "INTEGER")
+		help = "image points per side of interpolated images", metavar = "INTEGER")
+	parser.add_argument("-c", "--cache", dest = "cache", required = False,
+		help = "hilbert map and render plan cache folder", metavar = "FOLDER")
+	parser.add_argument("-s", "--store", dest = "store", required = False,
+		help = "render all samples into a single (samples x N x N) .npy store", metavar = "FILE")
+	parser.add_argument("-t", "--store-type", dest = "store_type", required = False, default = 'float32',
+		choices = ['float32', 'uint8'], help = "image store data type, uint8 stores beta * 254 and 255 for pixels without data")
+	parser.add_argument("-b", "--block", dest = "block", required = False, type = int, default = 8,
+		help = "samples rendered together per task in store mode", metavar = "INTEGER")
+	parser.add_argument("--png", dest = "png", required = False, action = 'store_true',
+		help = "also write images in store mode")
+	parser.add_argument("-F", "--format", dest = "format", required = False, default = 'png',
+		choices = IMAGE_FORMATS, help = "image format, 8 or 16-bit grayscale png, raw float32 .npy, or matplotlib rgba png")
+	parser.add_argument("-R", "--render", dest = "render", required = False, default = 'interp',
+		choices = RENDER_MODES, help = "interpolate onto an N x N mesh, or bin values into a 2**r x 2**r image by per-cell mean, max or count")
+	parser.add_argument("-L", "--pyramid", dest = "pyramid", required = False, type = int,
+		help = "write a pyramid of per-cell mean images at resolutions r down to r - LEVELS + 1 instead of one N x N image", metavar = "LEVELS")
+	parser.add_argument("-f", "--filter", dest = "filter", required = False, action = 'append',
+		help = "only process samples whose meta field matches, e.g. is_tumor=True or primary_site=Lung,Kidney, repeatable", metavar = "FIELD=VALUES")
+	parser.add_argument("-I", "--incremental", dest = "incremental", required = False, action = 'store_true',
+		help = "keep the output folder and only render missing or stale samples")
 
 	args = parser.parse_args()
 	folder_input = args.input
 	filename_meta = args.meta
 	folder_output = args.output
 	n_p = args.process
-	image_size = complex(args.N)
+	image_size = args.N
 	resolution = args.resolution
+	folder_cache = args.cache
+	filename_store = args.store
+	store_type = args.store_type
+	block_size = max(args.block, 1)
+	write_png = args.png
+	incremental = args.incremental
+	filters = args.filter
+	pyramid_levels = args.pyramid
+	render = args.render
+	image_format = args.format
 
-	if not os.path.isdir(folder_input) :
-		print('[~] "{0}" input does not exist!'.format(folder_input))
+	check_inputs(folder_input, filename_meta)
+
+	if pyramid_levels != None and (pyramid_levels < 1 or pyramid_levels > resolution + 1) :
+		print('[~] pyramid levels must be between 1 and {0}!'.format(resolution + 1))
 		exit(-1)
 
-	if not os.path.isfile(filename_meta) :
-		print('[~] meta file "{0}" does not exist!'.format(filename_meta))
+	if pyramid_levels != None and filename_store != None :
+		print('[~] pyramid mode writes png images only, it cannot be used with an image store!')
 		exit(-1)
 
 	if folder_output == None :
 		folder_output = os.path.basename(os.path.normpath(folder_input)) + '_hilbert'
+	prepare_output_folder(folder_output, incremental)
+	n_p = process_count(n_p)
 
-	if os.path.isdir(folder_output) :
-		shutil.rmtree(folder_output, ignore_errors = True)
-	os.makedirs(folder_output)
-
-	if n_p == None :
-		n_p = cpu_count()
-		print('[!] missing parallel parameters, using CPU count {0}'.format(n_p))
-		if n_p <= 0 :
-			n_p = 1
-			print('[!] undetected CPU count, using 1')
+	if folder_cache != None :
+		hb.set_cache_dir(folder_cache)
 
 	# read & parse meta file
 
-	print('[*] parsing meta file')
-	meta_data = load_meta_data(filename_meta)
+	meta_data = load_run_meta_data(filename_meta, filters)
+
+	# build the render plan once in the parent so all workers share it,
+	# binning needs none
+
+	image_size = image_size_of(resolution, image_size, render)
+	for meta in (meta_data if pyramid_levels == None and render == 'interp' else []) :
+		cg_meth = load_sample_cg_meth(meta, folder_input)
+		if cg_meth is not None :
+			print('[*] preparing render plan')
+			hr.get_render_plan(len(cg_meth), resolution, image_size)
+			break
+
+	if filename_store != None :
+		if incremental and image_store_matches(filename_store, meta_data, image_size, store_type) :
+			print('[*] reusing image store {0}'.format(filename_store))
+		else :
+			filename_ids = create_image_store(filename_store, meta_data, image_size, store_type)
+			print('[*] image store {0} ({1}) created'.format(filename_store, filename_ids))
+
+	# parameters an image depends on, a new image store changes the store
+	# signature and so makes every sample stale
+
+	params = {
+		'resolution' : resolution,
+		'N' : image_size,
+		'store' : [os.path.abspath(filename_store), store_type, hr.UINT8_MISSING, file_signature(os.path.splitext(filename_store)[0] + '.ids.csv')] if filename_store != None else None,
+		'png' : write_png or filename_store == None,
+		'pyramid' : pyramid_levels,
+		'render' : render,
+		'format' : image_format}
+
+	manifest = load_manifest(folder_output) if incremental else {}
+
+	# processing meta data, largest inputs first
 
-	# processing meta data
+	def input_size(meta) :
+		filename_cg_meth = filename_cg_meth_of(meta, folder_input)
+		return os.path.getsize(filename_cg_meth) if os.path.isfile(filename_cg_meth) else 0
 
-	p = Pool(n_p)
 	total_count = len(meta_data)
-	current_count = 0
-	for meta in meta_data:
-		current_count += 1
-		p.apply_async(process_hilbert, (meta, resolution, image_size, folder_input, folder_output, total_count, current_count, ))
+	rows, sizes = stale_samples(meta_data, manifest, params, lambda meta : sample_input_signature(meta, folder_input), input_size)
 
-	p.close()
-	p.join()
+	reset_stats(folder_output)
+	if filename_store != None :
+		folder_png = folder_output if write_png else None
+		order = sorted(range(len(rows)), key = lambda i : sizes[i], reverse = True)
+		rows = [rows[i] for i in order]
+		sizes = [sizes[i] for i in order]
+		tasks = []
+		task_sizes = []
+		for i in range(0, len(rows), block_size) :
+			block = rows[i:i + block_size]
+			tasks += [('samples {0}'.format(','.join(str(row) for row, meta in block)),
+				(block, resolution, image_size, folder_input, folder_output, filename_store, folder_png, params, ))]
+			task_sizes += [sum(sizes[i:i + block_size])]
+		failures = run_tasks(process_hilbert_block, tasks, n_p, sizes = task_sizes)
+	else :
+		tasks = [(meta_str(meta['file_id']), (meta, resolution, image_size, folder_input, folder_output, params, total_count, row + 1, ))
+			for row, meta in rows]
+		failures = run_tasks(process_hilbert, tasks, n_p, sizes = sizes)
 
-	print('[*] complete')
\ No newline at end of file
+	finish_run(folder_output, failures, len(rows))
@@ -0,0 +1,70 @@
+import os
+import json
+
+# output manifest of the batch scripts
+#
+# every finished sample appends one json line to manifest.jsonl in the
+# output folder, recording the signatures of its inputs, the parameters of
+# the run and the outputs it wrote. lines are only appended after all
+# outputs are complete, so a run killed half way leaves no record for the
+# samples it did not finish and a rerun picks them up again. the last
+# record of a key wins.
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+# (size, mtime) signature of a file, a folder is signed by all its files
+
+def file_signature(filename) :
+	if os.path.isdir(filename) :
+		return [[name] + file_signature(os.path.join(filename, name)) for name in sorted(os.listdir(filename))]
+
+	st = os.stat(filename)
+	return [st.st_size, st.st_mtime_ns]
+
+def load_manifest(folder_output) :
+	manifest = {}
+	filename_manifest = os.path.join(folder_output, MANIFEST_NAME)
+	if not os.path.isfile(filename_manifest) :
+		return manifest
+
+	with open(filename_manifest, 'r') as manifest_file :
+		for line in manifest_file :
+
+			# a line cut short by a crash is ignored
+
+			try :
+				record = json.loads(line)
+			except ValueError :
+				continue
+			manifest[record['key']] = record
+
+	return manifest
+
+def is_up_to_date(record, inputs, params) :
+	if record == None :
+		return False
+	if record['params'] != params or record['inputs'] != inputs :
+		return False
+	return all(os.path.exists(filename) for filename in record['outputs'])
+
+def record_output(folder_output, key, inputs, params, outputs) :
+	line = json.dumps({'key' : key, 'inputs' : inputs, 'params' : params, 'outputs' : outputs}) + '\n'
+
+	# one write on an O_APPEND file, records of concurrent workers do not interleave
+
+	fd = os.open(os.path.join(folder_output, MANIFEST_NAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+	try :
+		os.write(fd, line.encode())
+	finally :
+		os.close(fd)
+
+# rewrite the manifest with only the last record of every key
+
+def compact_manifest(folder_output) :
+	manifest = load_manifest(folder_output)
+	filename_manifest = os.path.join(folder_output, MANIFEST_NAME)
+	filename_tmp = filename_manifest + '.tmp'
+	with open(filename_tmp, 'w') as manifest_file :
+		for record in manifest.values() :
+			manifest_file.write(json.dumps(record) + '\n')
+	os.replace(filename_tmp, filename_manifest)
@@ -3,66 +3,40 @@
 
 import argparse
 import os
-import sys
-import shutil
 import numpy as np
-from numpy import genfromtxt
-from multiprocessing import Process
-from multiprocessing import Pool
-from multiprocessing import cpu_count, current_process
+from multiprocessing import current_process
+
+from meth_io import METH_DTYPE, iter_meth_data, filter_meth_data, write_clean_meth_data
+from cg_index import load_cg_index, generate_cg_meth
+from platform_map import load_platform_map, load_meth_betas, find_platform_rows, apply_platform_map
+from cohort_store import write_cohort_row
+from meta_data import meta_str
+from batch_scheduler import run_tasks
+from batch_manifest import file_signature, load_manifest
+from batch_stats import new_stats, timed, add_read, add_written, file_size, reset_stats
+from batch_common import check_inputs, prepare_output_folder, process_count, load_run_meta_data, load_run_platform_map
+from batch_common import prepare_cohort_store, meth_params, stale_samples, meth_input_signature, meth_input_size
+from batch_common import meth_filename_of, sample_folder, record_sample, finish_run
 
 def load_cg_indexes(filename_index) :
-	cg_indexes_file = np.load(filename_index)
-	cg_indexes = cg_indexes_file['indexes']
-	dict_cg_indexes = cg_indexes.item()
+	cg_index = load_cg_index(filename_index)
 
-	return dict_cg_indexes
+	return cg_index
 
-def load_meta_data(filename_meta) :
-	meta_data = genfromtxt(filename_meta, delimiter = ',',
-		autostrip = True,
-		dtype = ('|S64', '|S128', '|S32', '|S64', 'b1', '<f8', '|S16', 'b1', '<i4', '|S32', 'b1'),
-		names = ('file_id', 'file_name', 'primary_site', 'disease_type', 'gender', 'age', 'race', 'is_tumor', 'sample_type_id', 'sample_type', 'is_alive'))
-	return meta_data
+# cleaned meth data is written as binary .clean.npz, or as text when the
+# filename ends with .csv
 
-def load_meth_data(filename_meth) :
-	meth_data = genfromtxt(filename_meth, delimiter = '\t', skip_header = 1,
-		usecols = (0, 1, 2, 3), autostrip = True,
-		dtype = ('|S12', '<f8', '|S8', '<u8'), 
-		names = ('ref', 'beta', 'chr', 'pos'))
-
-	# filter out all unknown chrs
-
-	meth_data = meth_data[meth_data['chr'] != '*']
-
-	# filter out all nan beta values
+def write_meth_data(meth_data, filename_output) :
+	write_clean_meth_data(meth_data, filename_output)
 
-	meth_data = meth_data[~np.isnan(meth_data['beta'])]
+def clean_extension(as_csv) :
+	return '.clean.csv' if as_csv else '.clean.npz'
 
-	return meth_data
+def generate_cg_data(meth_data, cg_index, filename_output) :
+	cg_meth = generate_cg_meth(cg_index, meth_data)
+	write_cg_data(cg_meth, filename_output)
 
-def write_meth_data(meth_data, filename_output) :
-	np.savetxt(filename_output, 
-		meth_data, 
-		fmt=('%s, %f, %s, %ld'), 
-		delimiter = ',')
-
-def generate_cg_data(meth_data, dict_cg_indexes, filename_output) :
-	cg_meth = np.array([], dtype = '<f8')
-	# genome_meth = np.array([], dtype = '<f8')
-	for chrname in dict_cg_indexes :
-		chrdata = dict_cg_indexes[chrname]
-		chr_size = chrdata[1]
-		chr_cg_index = chrdata[2]
-
-		meth = np.zeros(chr_size)
-		chr_meth_data = meth_data[meth_data['chr'] == chrname]
-		meth[chr_meth_data['pos'] - 1] = chr_meth_data['beta']
-		cg = meth[chr_cg_index - 1]
-
-		cg_meth = np.append(cg_meth, cg)
-		# genome_meth = np.append(genome_meth, meth)
-	
+def write_cg_data(cg_meth, filename_output) :
 	filename_cg_meth = filename_output + '.cg.meth'
 	# filename_genome_meth = filename_output + '.genome.meth'
 	np.savez(filename_cg_meth, meth = cg_meth)
@@ -70,34 +44,122 @@ def generate_cg_data(meth_data, dict_cg_indexes, filename_output) :
 	# print('    {0} written'.format(filename_cg_meth + '.npz'))
 	# print(' {0} written'.format(filename_genome_meth))
 
-def process_meta_data(meta, dict_cg_indexes, folder_input, folder_output, total_count, current_count) :
+# the cg index & platform map are shared by all workers instead of being
+# pickled into every task: the parent sets them with set_worker_state
+# before the pool forks so workers inherit them copy-on-write, where
+# workers are spawned instead the pool initializer maps them from their
+# files
+
+_cg_index = None
+_platform_map = None
+
+def set_worker_state(cg_index, platform_map) :
+	global _cg_index, _platform_map
+	_cg_index = cg_index
+	_platform_map = platform_map
+
+def init_worker(filename_index, filename_platform) :
+	global _cg_index, _platform_map
+	if _cg_index is None :
+		_cg_index = load_cg_indexes(filename_index)
+	if _platform_map is None and filename_platform != None :
+		_platform_map = load_platform_map(filename_platform)
+
+# cleaned meth data & cg vector of one methylation file, the parse, filter
+# & map stages are timed into stats when given. the platform map filters
+# while gathering, so with a platform its filter time is part of map
+
+def generate_sample_data(filename_meth, stats = None) :
+	add_read(stats, file_size(filename_meth))
+	if _platform_map != None :
+
+		# fixed-array platform, only ref & beta are read and gathered
+
+		with timed(stats, 'parse') :
+			refs, betas = load_meth_betas(filename_meth)
+		with timed(stats, 'map') :
+			rows, off_layout_count = find_platform_rows(_platform_map, refs)
+			meth_data, cg_meth = apply_platform_map(_platform_map, rows, betas)
+		if off_layout_count :
+			print('[!] {0} probes of "{1}" differ from the platform map layout, {2} of them unknown'.format(
+				off_layout_count, filename_meth, np.count_nonzero(rows < 0)))
+	else :
+
+		# parsed & filtered per chunk, the seconds of every chunk go to the
+		# parse & filter stages. joining the chunks is left untimed
+
+		chunks = []
+		meth_chunks = iter_meth_data(filename_meth, clean = False)
+		while True :
+			with timed(stats, 'parse') :
+				chunk = next(meth_chunks, None)
+			if chunk is None :
+				break
+			with timed(stats, 'filter') :
+				chunks += [filter_meth_data(chunk)]
+		meth_data = np.concatenate(chunks) if chunks else np.zeros(0, dtype = METH_DTYPE)
+
+		# generate cg data
+
+		with timed(stats, 'map') :
+			cg_meth = generate_cg_meth(_cg_index, meth_data)
+
+	return meth_data, cg_meth
+
+# methylation file of a sample and its manifest inputs, in a worker
+
+def sample_meth_input(meta, folder_input) :
+	filename_meth = meth_filename_of(meta, folder_input)
+	if not os.path.isfile(filename_meth) :
+		raise IOError('methylation file "{0}" does not exist'.format(filename_meth))
+
+	return filename_meth, {'meth' : file_signature(filename_meth)}
+
+# write the outputs of a sample next to filename_base: the cleaned meth
+# data unless clean_ext is None, the .cg.meth.npz when write_cg is set and
+# the cohort store row when folder_store is given. returns the outputs
+
+def write_sample_data(meth_data, cg_meth, filename_base, clean_ext, write_cg, folder_store, row, stats = None) :
+	outputs = []
+	with timed(stats, 'write') :
+		if clean_ext != None :
+			filename_meth_clean = filename_base + clean_ext
+			write_meth_data(meth_data, filename_meth_clean)
+			outputs += [filename_meth_clean]
+			add_written(stats, file_size(filename_meth_clean))
+		if write_cg :
+			write_cg_data(cg_meth, filename_base)
+			outputs += [filename_base + '.cg.meth.npz']
+			add_written(stats, file_size(outputs[-1]))
+		if folder_store != None :
+			add_written(stats, write_cohort_row(folder_store, row, cg_meth))
+			outputs += [os.path.join(folder_store, 'meth.npy')]
+
+	return outputs
+
+def process_meta_data(meta, folder_input, folder_output, folder_store, params, total_count, current_count) :
 	proc_name = current_process().name
-	print('[*] processing meta {0} on process {1} ({2}/{3})'.format(meta['file_id'], proc_name, current_count, total_count))
-
-	# mkdir & clean meth data
-		
-	folder_meta = os.path.join(folder_output, meta['file_id'])
-	try:
-		os.stat(folder_meta)
-	except:
-		os.mkdir(folder_meta)
+	print('[*] processing meta {0} on process {1} ({2}/{3})'.format(meta_str(meta['file_id']), proc_name, current_count, total_count))
 
 	# load meth data
 
-	filename_meth = os.path.join(folder_input, meta['file_id'], meta['file_name'])
-	if not os.path.isfile(filename_meth) :
-		print('[!] methylation file "{0}" does not exist, skip'.format(filename_meth))
-		pass
-	filename_meth_clean = os.path.join(folder_meta, os.path.splitext(meta['file_name'])[0] + '.clean.csv')
+	folder_meta = sample_folder(folder_output, meta)
+	filename_meth, inputs = sample_meth_input(meta, folder_input)
+	filename_base = os.path.join(folder_meta, os.path.splitext(meta_str(meta['file_name']))[0])
+
+	stats = new_stats(meta_str(meta['file_id']))
+	meth_data, cg_meth = generate_sample_data(filename_meth, stats)
 
-	meth_data = load_meth_data(filename_meth)
-	write_meth_data(meth_data, filename_meth_clean)
+	# write cleaned meth data & cg data, into the cohort store row of the
+	# sample in store mode
 
-	# generate cg data
+	outputs = write_sample_data(meth_data, cg_meth, filename_base, clean_extension(params['csv']),
+		folder_store == None, folder_store, current_count - 1, stats)
 
-	filename_cg_meth = os.path.join(folder_meta, os.path.splitext(meta['file_name'])[0])
-	generate_cg_data(meth_data, dict_cg_indexes, filename_cg_meth)
-	print('[*] meta {0} on process {1} complete (#{2})'.format(meta['file_id'], proc_name, current_count))
+	# record the sample in the manifest once all its outputs are written
+
+	record_sample(folder_output, meta, inputs, params, outputs, stats)
+	print('[*] meta {0} on process {1} complete (#{2})'.format(meta_str(meta['file_id']), proc_name, current_count))
 
 if __name__ == "__main__":
 
@@ -107,13 +169,23 @@ if __name__ == "__main__":
 	parser.add_argument("-i", "--input", dest = "input", required = True,
 		help = "input data folder", metavar = "FOLDER")
 	parser.add_argument("-d", "--index", dest = "index", required = True,
-		help = "cg index cgidx.npz file", metavar = "FILE")
+		help = "cg index .cgidx folder or legacy .cgidx.npz file", metavar = "FILE")
 	parser.add_argument("-m", "--meta", dest = "meta", required = True,
-		help = "cleaned meta filename", metavar = "FILE")
+		help = "cleaned meta .csv or .npy table filename", metavar = "FILE")
 	parser.add_argument("-o", "--output", dest = "output", required = False,
 		help = "output folder", metavar = "FOLDER")
 	parser.add_argument("-p", "--process", dest = "process", required = False, type = int,
 		help = "number of parallel processes", metavar = "INTEGER")
+	parser.add_argument("-P", "--platform", dest = "platform", required = False,
+		help = "platform map .npz file, built from the first methylation file if missing. probes are matched by ref and take the map's chr & pos, all files must share one manifest build", metavar = "FILE")
+	parser.add_argument("-s", "--store", dest = "store", required = False,
+		help = "write all cg data into a single (samples x CpGs) cohort store folder", metavar = "FOLDER")
+	parser.add_argument("--csv", dest = "csv", required = False, action = 'store_true',
+		help = "write the cleaned meth data as .clean.csv text instead of binary .clean.npz")
+	parser.add_argument("-f", "--filter", dest = "filter", required = False, action = 'append',
+		help = "only process samples whose meta field matches, e.g. is_tumor=True or primary_site=Lung,Kidney, repeatable", metavar = "FIELD=VALUES")
+	parser.add_argument("-I", "--incremental", dest = "incremental", required = False, action = 'store_true',
+		help = "keep the output folder and only process missing or stale samples")
 
 	args = parser.parse_args()
 	folder_input = args.input
@@ -121,51 +193,48 @@ if __name__ == "__main__":
 	filename_index = args.index
 	folder_output = args.output
 	n_p = args.process
+	filename_platform = args.platform
+	if filename_platform != None and not filename_platform.endswith('.npz') :
+		filename_platform += '.npz'
+	folder_store = args.store
+	incremental = args.incremental
+	filters = args.filter
+	as_csv = args.csv
 
-	if not os.path.isdir(folder_input) :
-		print('[~] "{0}" input does not exist!'.format(folder_input))
-		exit(-1)
-
-	if not os.path.isfile(filename_meta) :
-		print('[~] meta file "{0}" does not exist!'.format(filename_meta))
-		exit(-1)
-
-	if not os.path.isfile(filename_index) :
-		print("[~] CG index .cgidx.npz file \"{0}\" does not exist!".format(filename_index))
-		exit(-1)
+	check_inputs(folder_input, filename_meta, filename_index)
 
 	if folder_output == None :
 		folder_output = os.path.basename(os.path.normpath(folder_input)) + '_meth'
-
-	if os.path.isdir(folder_output) :
-		shutil.rmtree(folder_output, ignore_errors = True)
-	os.makedirs(folder_output)
-
-	if n_p == None :
-		n_p = cpu_count()
-		print('[!] missing parallel parameters, using CPU count {0}'.format(n_p))
-		if n_p <= 0 :
-			n_p = 1
-			print('[!] undetected CPU count, using 1')
+	prepare_output_folder(folder_output, incremental)
+	n_p = process_count(n_p)
 
 	# read & parse meta file
 
-	print('[*] parsing meta file')
-	meta_data = load_meta_data(filename_meta)
+	meta_data = load_run_meta_data(filename_meta, filters)
 
 	print('[*] loading cg indexes')
-	dict_cg_indexes = load_cg_indexes(filename_index)
+	cg_index = load_cg_indexes(filename_index)
+
+	platform_map = load_run_platform_map(filename_platform, cg_index, meta_data, folder_input)
+	set_worker_state(cg_index, platform_map)
+
+	if folder_store != None :
+		prepare_cohort_store(folder_store, meta_data, len(cg_index.positions), incremental)
+
+	params = meth_params(filename_index, filename_platform, platform_map, folder_store)
+	params['csv'] = as_csv
+
+	manifest = load_manifest(folder_output) if incremental else {}
 
-	# processing meta data
+	# processing meta data, largest methylation files first
 
-	p = Pool(n_p)
 	total_count = len(meta_data)
-	current_count = 0
-	for meta in meta_data:
-		current_count += 1
-		p.apply_async(process_meta_data, (meta, dict_cg_indexes, folder_input, folder_output, total_count, current_count, ))
+	rows, sizes = stale_samples(meta_data, manifest, params, meth_input_signature(folder_input), meth_input_size(folder_input))
+	tasks = [(meta_str(meta['file_id']), (meta, folder_input, folder_output, folder_store, params, total_count, row + 1, ))
+		for row, meta in rows]
 
-	p.close()
-	p.join()
+	reset_stats(folder_output)
+	failures = run_tasks(process_meta_data, tasks, n_p, sizes = sizes,
+		initializer = init_worker, initargs = (filename_index, filename_platform if platform_map != None else None, ))
 
-	print('[*] complete')
\ No newline at end of file
+	finish_run(folder_output, failures, len(tasks))
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import sys
+from multiprocessing import current_process
+
+import hilbert as hb
+import hilbert_render as hr
+import batch_meth_data as bmd
+import batch_hilbert_img as bhi
+from image_io import IMAGE_FORMATS, image_extension
+from meta_data import meta_str
+from batch_scheduler import run_tasks
+from batch_manifest import load_manifest
+from batch_stats import new_stats, reset_stats
+from batch_common import check_inputs, prepare_output_folder, process_count, load_run_meta_data, load_run_platform_map
+from batch_common import prepare_cohort_store, meth_params, stale_samples, meth_input_signature, meth_input_size
+from batch_common import sample_folder, record_sample, finish_run
+
+# fused pipeline, a worker takes a sample from the raw methylation.txt
+# to its hilbert image in one pass: parse & filter, map to CpG slots and
+# render. the cleaned meth data, the .cg.meth.npz and the cohort store row
+# are only written when asked for
+
+def process_sample(meta, folder_input, folder_output, folder_store, options, params, total_count, current_count) :
+	proc_name = current_process().name
+	print('[*] processing meta {0} on process {1} ({2}/{3})'.format(meta_str(meta['file_id']), proc_name, current_count, total_count))
+
+	folder_meta = sample_folder(folder_output, meta)
+	filename_meth, inputs = bmd.sample_meth_input(meta, folder_input)
+	filename_base = os.path.join(folder_meta, os.path.splitext(meta_str(meta['file_name']))[0])
+
+	# parse, filter & map to CpG slots
+
+	stats = new_stats(meta_str(meta['file_id']))
+	meth_data, cg_meth = bmd.generate_sample_data(filename_meth, stats)
+
+	# opt-in intermediates
+
+	clean_ext = bmd.clean_extension(options['csv']) if options['clean'] else None
+	outputs = bmd.write_sample_data(meth_data, cg_meth, filename_base, clean_ext, options['cg'], folder_store, current_count - 1, stats)
+
+	# render
+
+	filename_hilbert = filename_base + image_extension(options['format'])
+	bhi.generate_hilbert_map(cg_meth, options['resolution'], options['N'], filename_hilbert, image_format = options['format'], stats = stats)
+	outputs += [filename_hilbert]
+
+	record_sample(folder_output, meta, inputs, params, outputs, stats)
+	print('[*] meta {0} on process {1} complete (#{2})'.format(meta_str(meta['file_id']), proc_name, current_count))
+	sys.stdout.flush()
+
+if __name__ == "__main__":
+
+	# command line arguments
+
+	parser = argparse.ArgumentParser(description = "batch generate hilbert images from raw methylation data in one pass")
+	parser.add_argument("-i", "--input", dest = "input", required = True,
+		help = "input data folder", metavar = "FOLDER")
+	parser.add_argument("-d", "--index", dest = "index", required = True,
+		help = "cg index .cgidx folder or legacy .cgidx.npz file", metavar = "FILE")
+	parser.add_argument("-m", "--meta", dest = "meta", required = True,
+		help = "cleaned meta .csv or .npy table filename", metavar = "FILE")
+	parser.add_argument("-o", "--output", dest = "output", required = False,
+		help = "output folder", metavar = "FOLDER")
+	parser.add_argument("-p", "--process", dest = "process", required = False, type = int,
+		help = "number of parallel processes", metavar = "INTEGER")
+	parser.add_argument("-P", "--platform", dest = "platform", required = False,
+		help = "platform map .npz file, built from the first methylation file if missing. probes are matched by ref and take the map's chr & pos, all files must share one manifest build", metavar = "FILE")
+	parser.add_argument("-r", "--resolution", dest = "resolution", required = False, type = int, default = 10,
+		help = "hilbert resolution", metavar = "INTEGER")
+	parser.add_argument("-N", "--image-point", dest = "N", required = False, type = int, default = 300,
+		help = "image points per side", metavar = "INTEGER")
+	parser.add_argument("-F", "--format", dest = "format", required = False, default = 'png',
+		choices = IMAGE_FORMATS, help = "image format, 8 or 16-bit grayscale png, raw float32 .npy, or matplotlib rgba png")
+	parser.add_argument("-c", "--cache", dest = "cache", required = False,
+		help = "hilbert map and render plan cache folder", metavar = "FOLDER")
+	parser.add_argument("-s", "--store", dest = "store", required = False,
+		help = "also write cg data into a (samples x CpGs) cohort store folder", metavar = "FOLDER")
+	parser.add_argument("--clean", dest = "clean", required = False, action = 'store_true',
+		help = "also write the cleaned .clean.npz of every sample")
+	parser.add_argument("--csv", dest = "csv", required = False, action = 'store_true',
+		help = "with --clean, write .clean.csv text instead of binary .clean.npz")
+	parser.add_argument("--cg", dest = "cg", required = False, action = 'store_true',
+		help = "also write the .cg.meth.npz of every sample")
+	parser.add_argument("-f", "--filter", dest = "filter", required = False, action = 'append',
+		help = "only process samples whose meta field matches, e.g. is_tumor=True or primary_site=Lung,Kidney, repeatable", metavar = "FIELD=VALUES")
+	parser.add_argument("-I", "--incremental", dest = "incremental", required = False, action = 'store_true',
+		help = "keep the output folder and only process missing or stale samples")
+
+	args = parser.parse_args()
+	folder_input = args.input
+	filename_meta = args.meta
+	filename_index = args.index
+	folder_output = args.output
+	n_p = args.process
+	filename_platform = args.platform
+	if filename_platform != None and not filename_platform.endswith('.npz') :
+		filename_platform += '.npz'
+	folder_cache = args.cache
+	folder_store = args.store
+	incremental = args.incremental
+	filters = args.filter
+	options = {
+		'resolution' : args.resolution,
+		'N' : args.N,
+		'format' : args.format,
+		'clean' : args.clean,
+		'csv' : args.csv,
+		'cg' : args.cg}
+
+	check_inputs(folder_input, filename_meta, filename_index)
+
+	if folder_output == None :
+		folder_output = os.path.basename(os.path.normpath(folder_input)) + '_pipeline'
+	prepare_output_folder(folder_output, incremental)
+	n_p = process_count(n_p)
+
+	if folder_cache != None :
+		hb.set_cache_dir(folder_cache)
+
+	# read & parse meta file
+
+	meta_data = load_run_meta_data(filename_meta, filters)
+
+	print('[*] loading cg indexes')
+	cg_index = bmd.load_cg_indexes(filename_index)
+
+	platform_map = load_run_platform_map(filename_platform, cg_index, meta_data, folder_input)
+	bmd.set_worker_state(cg_index, platform_map)
+
+	# the CpG vector length is known from the index, build the render plan
+	# once in the parent so all workers share it
+
+	print('[*] preparing render plan')
+	hr.get_render_plan(len(cg_index.positions), options['resolution'], options['N'])
+
+	if folder_store != None :
+		prepare_cohort_store(folder_store, meta_data, len(cg_index.positions), incremental)
+
+	params = meth_params(filename_index, filename_platform, platform_map, folder_store)
+	params['options'] = options
+
+	manifest = load_manifest(folder_output) if incremental else {}
+
+	# processing meta data, largest methylation files first
+
+	total_count = len(meta_data)
+	rows, sizes = stale_samples(meta_data, manifest, params, meth_input_signature(folder_input), meth_input_size(folder_input))
+	tasks = [(meta_str(meta['file_id']), (meta, folder_input, folder_output, folder_store, options, params, total_count, row + 1, ))
+		for row, meta in rows]
+
+	reset_stats(folder_output)
+	failures = run_tasks(process_sample, tasks, n_p, sizes = sizes,
+		initializer = bmd.init_worker, initargs = (filename_index, filename_platform if platform_map != None else None, ))
+
+	finish_run(folder_output, failures, len(tasks))
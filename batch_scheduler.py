@@ -0,0 +1,173 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+from multiprocessing import Pool
+
+# task scheduler of the batch scripts
+#
+# tasks are submitted largest input first to cut the tail of a run, at
+# most chunk_size of them are in flight at once, workers are recycled
+# every MAX_TASKS_PER_CHILD tasks to cap leaked memory, and every failure
+# (an exception, or a (key, reason) list returned by the task) is
+# collected for the summary instead of vanishing in the pool.
+#
+# a worker killed outright (oom killer, SIGKILL) never reports back and the
+# pool would wait for its task forever. workers announce the task they
+# start with their pid, a task whose worker is gone for more than
+# LOST_TASK_SECONDS without a result is failed as lost and the pool is
+# terminated once the other tasks are done
+
+MAX_TASKS_PER_CHILD = 32
+
+POLL_SECONDS = 0.5
+
+LOST_TASK_SECONDS = 2.0
+
+FAILURES_NAME = 'failures.csv'
+
+def _remote_reason(e) :
+	# the pool attaches the worker traceback as the cause of the exception
+
+	if e.__cause__ != None :
+		return '{0}: {1}\n{2}'.format(type(e).__name__, e, e.__cause__)
+	return '{0}: {1}'.format(type(e).__name__, e)
+
+_started = None
+
+def _init_worker(started, initializer, initargs) :
+	global _started
+	_started = started
+	if initializer != None :
+		initializer(*initargs)
+
+def _run_task(index, func, args) :
+	_started.put((index, os.getpid()))
+	return func(*args)
+
+def _pid_alive(pid) :
+	try :
+		os.kill(pid, 0)
+	except ProcessLookupError :
+		return False
+	except PermissionError :
+		pass
+	return True
+
+def run_tasks(func, tasks, n_p, sizes = None, chunk_size = None, max_tasks_per_child = MAX_TASKS_PER_CHILD, initializer = None, initargs = ()) :
+	# tasks : [(key, args), ...], returns [(key, reason), ...] of failures
+
+	if sizes != None :
+		order = sorted(range(len(tasks)), key = lambda i : sizes[i], reverse = True)
+		tasks = [tasks[i] for i in order]
+
+	if chunk_size == None :
+		chunk_size = 4 * n_p
+
+	failures = []
+	lost = []
+	done = threading.Condition()
+	slots = threading.BoundedSemaphore(chunk_size)
+	started = multiprocessing.SimpleQueue()
+
+	# index -> [key, worker pid, time the worker was first seen gone]
+
+	pending = {}
+
+	def finish(index, items) :
+		with done :
+			if index not in pending :
+				return
+			del pending[index]
+			failures.extend(items)
+			done.notify_all()
+		slots.release()
+
+	def on_result(index) :
+		def callback(result) :
+			finish(index, result or [])
+		return callback
+
+	def on_error(index, key) :
+		def callback(e) :
+			finish(index, [(key, _remote_reason(e))])
+		return callback
+
+	# the pids are read as tasks are submitted too, workers would block on a
+	# full pipe otherwise
+
+	def read_started() :
+		while not started.empty() :
+			index, pid = started.get()
+			with done :
+				if index in pending :
+					pending[index][1] = pid
+
+	def check_workers() :
+		read_started()
+		now = time.time()
+		gone = []
+		with done :
+			for index, item in pending.items() :
+				key, pid, gone_since = item
+				if pid == None or _pid_alive(pid) :
+					continue
+				if gone_since == None :
+					item[2] = now
+				elif now - gone_since > LOST_TASK_SECONDS :
+					gone += [(index, key, pid)]
+
+		for index, key, pid in gone :
+			lost.append(index)
+			finish(index, [(key, 'worker process {0} died while running the task'.format(pid))])
+
+	p = Pool(n_p, initializer = _init_worker, initargs = (started, initializer, initargs), maxtasksperchild = max_tasks_per_child)
+	try :
+		for index, (key, args) in enumerate(tasks) :
+			while not slots.acquire(timeout = POLL_SECONDS) :
+				check_workers()
+			with done :
+				pending[index] = [key, None, None]
+			p.apply_async(_run_task, (index, func, args), callback = on_result(index), error_callback = on_error(index, key))
+			read_started()
+		p.close()
+
+		while True :
+			with done :
+				if not pending :
+					break
+				done.wait(POLL_SECONDS)
+			check_workers()
+
+		# the pool still waits for the result of a lost task
+
+		if lost :
+			p.terminate()
+		p.join()
+	except KeyboardInterrupt :
+		p.terminate()
+		p.join()
+		raise
+
+	return failures
+
+def report_failures(failures, total_count, folder_output) :
+	filename_failures = os.path.join(folder_output, FAILURES_NAME)
+	if not failures :
+		if os.path.isfile(filename_failures) :
+			os.unlink(filename_failures)
+		print('[*] {0} tasks, no failures'.format(total_count))
+		return 0
+
+	with open(filename_failures, 'w') as failures_file :
+		for key, reason in failures :
+			failures_file.write('{0},"{1}"\n'.format(key, reason.replace('"', '""')))
+
+	print('[!] {0} tasks, {1} failed:'.format(total_count, len(failures)))
+	for key, reason in failures :
+		print('    {0}: {1}'.format(key, reason.strip().splitlines()[0] if reason.strip() else ''))
+	print('[!] failure details written to {0}'.format(filename_failures))
+	sys.stdout.flush()
+
+	return len(failures)
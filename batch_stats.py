@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import resource
+import contextlib
+import numpy as np
+from multiprocessing import current_process
+
+# per-sample stage statistics of the batch scripts
+#
+# a worker fills one stats dict per sample (or store block): wall seconds
+# per stage (parse, filter, map, render, write, ...), bytes read & written
+# and the peak rss of the worker process so far, and appends it as one
+# json line to stats.jsonl in the output folder. the file is reset at the
+# start of every run, the parent summarizes it with percentiles at the end.
+
+STATS_NAME = 'stats.jsonl'
+
+PERCENTILES = (50, 90, 99)
+
+def new_stats(key) :
+	return {'key' : key, 'stages' : {}, 'bytes_read' : 0, 'bytes_written' : 0}
+
+# time a stage of a sample, stats None times nothing
+
+@contextlib.contextmanager
+def timed(stats, stage) :
+	start = time.perf_counter()
+	try :
+		yield
+	finally :
+		if stats != None :
+			stats['stages'][stage] = stats['stages'].get(stage, 0.0) + time.perf_counter() - start
+
+def add_read(stats, nbytes) :
+	if stats != None :
+		stats['bytes_read'] += int(nbytes)
+
+def add_written(stats, nbytes) :
+	if stats != None :
+		stats['bytes_written'] += int(nbytes)
+
+def file_size(filename) :
+	return os.path.getsize(filename) if os.path.isfile(filename) else 0
+
+def reset_stats(folder_output) :
+	filename_stats = os.path.join(folder_output, STATS_NAME)
+	if os.path.isfile(filename_stats) :
+		os.unlink(filename_stats)
+
+def record_stats(folder_output, stats) :
+	stats['total'] = sum(stats['stages'].values())
+
+	# ru_maxrss is in KiB on linux, the peak of the worker over all its tasks
+
+	stats['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+	stats['process'] = current_process().name
+	line = json.dumps(stats) + '\n'
+
+	# one write on an O_APPEND file, like the output manifest
+
+	fd = os.open(os.path.join(folder_output, STATS_NAME), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+	try :
+		os.write(fd, line.encode())
+	finally :
+		os.close(fd)
+
+def load_stats(folder_output) :
+	records = []
+	filename_stats = os.path.join(folder_output, STATS_NAME)
+	if not os.path.isfile(filename_stats) :
+		return records
+
+	with open(filename_stats, 'r') as stats_file :
+		for line in stats_file :
+			try :
+				records += [json.loads(line)]
+			except ValueError :
+				continue
+
+	return records
+
+def _size_str(nbytes) :
+	for unit in ('B', 'KiB', 'MiB', 'GiB') :
+		if nbytes < 1024 or unit == 'GiB' :
+			return '{0:.1f} {1}'.format(nbytes, unit)
+		nbytes /= 1024.0
+
+def summarize_stats(folder_output, slowest = 5) :
+	records = load_stats(folder_output)
+	if not records :
+		return
+
+	stages = []
+	for record in records :
+		for stage in record['stages'] :
+			if stage not in stages :
+				stages += [stage]
+
+	print('[*] stage seconds over {0} records ({1})'.format(len(records), os.path.join(folder_output, STATS_NAME)))
+	print('    {0:<10} {1}'.format('stage', ' '.join('{0:>9}'.format(name) for name in ['p{0}'.format(p) for p in PERCENTILES] + ['max', 'sum'])))
+	for stage in stages + ['total'] :
+		if stage == 'total' :
+			values = np.array([record['total'] for record in records])
+		else :
+			values = np.array([record['stages'][stage] for record in records if stage in record['stages']])
+		columns = list(np.percentile(values, PERCENTILES)) + [values.max(), values.sum()]
+		print('    {0:<10} {1}'.format(stage, ' '.join('{0:>9.3f}'.format(value) for value in columns)))
+
+	bytes_read = sum(record['bytes_read'] for record in records)
+	bytes_written = sum(record['bytes_written'] for record in records)
+	peak_rss = np.array([record['peak_rss'] for record in records])
+	print('    read {0}, written {1}, worker peak rss p50 {2}, max {3}'.format(_size_str(bytes_read), _size_str(bytes_written),
+		_size_str(np.percentile(peak_rss, 50)), _size_str(peak_rss.max())))
+
+	print('    slowest: {0}'.format(', '.join('{0} {1:.3f}s'.format(record['key'], record['total'])
+		for record in sorted(records, key = lambda record : record['total'], reverse = True)[:slowest])))
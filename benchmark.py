@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import resource
+import contextlib
+import numpy as np
+from multiprocessing import Process, Pipe, cpu_count
+
+import hilbert as hb
+import hilbert_render as hr
+from build_cg_index import build_cg_index
+from cg_index import load_cg_index, generate_cg_meth
+from meth_io import read_meth_data
+from meta_data import read_meta_csv
+from image_io import save_hilbert_image
+from synthetic_data import write_synthetic_fasta, synthetic_platform, write_synthetic_methylation, write_synthetic_metadata, parse_chromosome_sizes
+
+# throughput of every pipeline stage on synthetic data
+#
+# each stage runs in its own forked process, so its peak rss is its own
+# (plus what it inherits from the parent at fork) and caches of one stage
+# do not warm the next. a stage returns the counts it processed, the
+# report holds the best time of the repeats and the counts per second:
+#   rows_per_s   : methylation or meta rows
+#   cpgs_per_s   : CpG vector slots (index CpGs for build_cg_index)
+#   images_per_s : rendered & written images
+
+# stages, each returns {count name : count}
+
+def stage_build_cg_index(filename_fasta, folder_index, n_p) :
+	if os.path.isdir(folder_index) :
+		shutil.rmtree(folder_index)
+	build_cg_index(filename_fasta, folder_index, n_p)
+	return {'cpgs' : len(load_cg_index(folder_index).positions)}
+
+def stage_load_meta_data(filename_meta) :
+	return {'rows' : len(read_meta_csv(filename_meta))}
+
+def stage_load_meth_data(filename_meth) :
+	return {'rows' : len(read_meth_data(filename_meth))}
+
+def stage_generate_cg_data(folder_index, filename_meth, filename_output) :
+	cg_index = load_cg_index(folder_index)
+	meth_data = read_meth_data(filename_meth)
+	start = time.perf_counter()
+	cg_meth = generate_cg_meth(cg_index, meth_data)
+	np.savez(filename_output, meth = cg_meth)
+
+	# only the mapping & write are timed, parsing is load_meth_data
+
+	return {'rows' : len(meth_data), 'cpgs' : len(cg_meth), '_seconds' : time.perf_counter() - start}
+
+def stage_hilbert_map(n, r) :
+	hb.clear_cache()
+	hb.hilbert_map(n, r)
+	return {'cpgs' : n}
+
+def stage_render_plan(n, r, N) :
+	hr.build_render_plan(n, r, N)
+	return {'cpgs' : n}
+
+def stage_generate_hilbert_map(n, r, N, render, images, folder_output) :
+	v = np.random.default_rng(0).random((images, n))
+	if render == 'interp' :
+		plan = hr.build_render_plan(n, r, N)
+	else :
+		hb.cached_hilbert_indexes(r)
+	start = time.perf_counter()
+	for i in range(images) :
+		if render == 'interp' :
+			zs = hr.render_hilbert_map(v[i], r, N, plan)
+		else :
+			zs = hb.hilbert_bin(v[i], r, render)
+		save_hilbert_image(os.path.join(folder_output, 'bench.{0}.png'.format(i)), zs)
+
+	# the plan and coordinate table are built once per run, the plan is
+	# timed by render_plan
+
+	return {'images' : images, 'cpgs' : images * n, '_seconds' : time.perf_counter() - start}
+
+def _stage_process(conn, func, args) :
+	try :
+		with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull) :
+			start = time.perf_counter()
+			counts = func(*args)
+			seconds = time.perf_counter() - start
+		seconds = counts.pop('_seconds', seconds)
+
+		# ru_maxrss is in KiB on linux
+
+		peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+		conn.send((seconds, counts, peak_rss, None))
+	except Exception as e :
+		conn.send((None, None, None, '{0}: {1}'.format(type(e).__name__, e)))
+	finally :
+		conn.close()
+
+# a stage that raises, or whose process dies before it reports (killed by
+# the oom killer, a crash in numpy), fails with a StageError, exitcode is
+# that of the dead process
+
+class StageError(RuntimeError) :
+	def __init__(self, message, exitcode = None) :
+		RuntimeError.__init__(self, message)
+		self.exitcode = exitcode
+
+def run_stage(func, args, repeat = 1) :
+	best = None
+	for i in range(repeat) :
+		parent_conn, child_conn = Pipe(duplex = False)
+		p = Process(target = _stage_process, args = (child_conn, func, args, ))
+		p.start()
+		child_conn.close()
+		try :
+			result = parent_conn.recv()
+		except EOFError :
+			p.join()
+			raise StageError('stage process died with exit code {0}'.format(p.exitcode), p.exitcode)
+		finally :
+			parent_conn.close()
+		p.join()
+		if result[3] != None :
+			raise StageError(result[3])
+		if best == None or result[0] < best[0] :
+			best = result
+
+	return best
+
+def stage_record(stage, params, result) :
+	seconds, counts, peak_rss, _ = result
+	record = {'stage' : stage, 'params' : params, 'seconds' : seconds, 'peak_rss' : peak_rss}
+	for name, count in counts.items() :
+		record[name] = count
+		record[name + '_per_s'] = count / seconds if seconds > 0 else None
+	return record
+
+def environment() :
+	return {
+		'python' : platform.python_version(),
+		'numpy' : np.__version__,
+		'platform' : platform.platform(),
+		'cpu_count' : cpu_count(),
+		'time' : time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+def parse_int_list(value) :
+	return [int(float(item)) for item in value.split(',') if item]
+
+if __name__ == "__main__":
+
+	# command line arguments
+
+	parser = argparse.ArgumentParser(description = "Benchmark every pipeline stage on synthetic data")
+	parser.add_argument("-o", "--output", dest = "output", required = False, default = 'benchmark.json',
+		help = "json report filename", metavar = "FILE")
+	parser.add_argument("-w", "--work", dest = "work", required = False,
+		help = "work folder for the synthetic inputs, a temporary folder if not given", metavar = "FOLDER")
+	parser.add_argument("--chromosomes", dest = "chromosomes", required = False, default = 'chr1:8e6,chr2:4e6,chrX:2e6',
+		help = "chromosome sizes of the synthetic reference", metavar = "CHR:LEN,...")
+	parser.add_argument("--cg-density", dest = "cg_density", required = False, type = float, default = 0.01,
+		help = "CpGs per base of the synthetic reference", metavar = "FLOAT")
+	parser.add_argument("--probes", dest = "probes", required = False, default = '25000,100000',
+		help = "probes per methylation file, one set of stages per size", metavar = "N,...")
+	parser.add_argument("--samples", dest = "samples", required = False, type = int, default = 10000,
+		help = "rows of the synthetic metadata csv", metavar = "INTEGER")
+	parser.add_argument("-r", "--resolutions", dest = "resolutions", required = False, default = '8,10',
+		help = "hilbert resolutions", metavar = "R,...")
+	parser.add_argument("-N", "--image-points", dest = "N", required = False, default = '300',
+		help = "image points per side of interpolated images", metavar = "N,...")
+	parser.add_argument("--images", dest = "images", required = False, type = int, default = 8,
+		help = "images rendered per render stage", metavar = "INTEGER")
+	parser.add_argument("--repeat", dest = "repeat", required = False, type = int, default = 1,
+		help = "runs per stage, the fastest is reported", metavar = "INTEGER")
+	parser.add_argument("-p", "--process", dest = "process", required = False, type = int, default = 1,
+		help = "processes of build_cg_index", metavar = "INTEGER")
+	parser.add_argument("--seed", dest = "seed", required = False, type = int, default = 0,
+		help = "random seed", metavar = "INTEGER")
+
+	args = parser.parse_args()
+	chromosome_sizes = parse_chromosome_sizes(args.chromosomes)
+	probe_counts = parse_int_list(args.probes)
+	resolutions = parse_int_list(args.resolutions)
+	image_sizes = parse_int_list(args.N)
+	repeat = max(args.repeat, 1)
+
+	folder_work = args.work if args.work != None else tempfile.mkdtemp(prefix = 'hilbert_bench_')
+	if not os.path.isdir(folder_work) :
+		os.makedirs(folder_work)
+
+	results = []
+
+	def run(stage, params, func, stage_args) :
+		print('[*] {0} {1}'.format(stage, ' '.join('{0}={1}'.format(name, value) for name, value in params.items())))
+		sys.stdout.flush()
+		try :
+			record = stage_record(stage, params, run_stage(func, stage_args, repeat))
+		except StageError as e :
+			print('[!] {0} failed: {1}'.format(stage, e))
+			record = {'stage' : stage, 'params' : params, 'error' : str(e), 'exitcode' : e.exitcode}
+		results.append(record)
+		return record
+
+	try :
+
+		# reference & cg index
+
+		print('[*] generating synthetic inputs in {0}'.format(folder_work))
+		filename_fasta = os.path.join(folder_work, 'ref.fa')
+		write_synthetic_fasta(filename_fasta, chromosome_sizes, args.cg_density, args.seed, write_fai = True)
+		folder_index = os.path.join(folder_work, 'ref.cgidx')
+		run('build_cg_index', {'bases' : sum(length for _, length in chromosome_sizes), 'processes' : args.process},
+			stage_build_cg_index, (filename_fasta, folder_index, args.process, ))
+		cg_index = load_cg_index(folder_index)
+		n = len(cg_index.positions)
+		del cg_index
+
+		# metadata
+
+		filename_meta = os.path.join(folder_work, 'meta.csv')
+		write_synthetic_metadata(filename_meta, args.samples, args.seed)
+		run('load_meta_data', {'samples' : args.samples}, stage_load_meta_data, (filename_meta, ))
+
+		# methylation files by size
+
+		for probe_count in probe_counts :
+			filename_meth = os.path.join(folder_work, 'meth.{0}.txt'.format(probe_count))
+			write_synthetic_methylation(filename_meth, synthetic_platform(load_cg_index(folder_index), probe_count, args.seed), args.seed + 1)
+			run('load_meth_data', {'probes' : probe_count}, stage_load_meth_data, (filename_meth, ))
+			run('generate_cg_data', {'probes' : probe_count, 'cpgs' : n}, stage_generate_cg_data,
+				(folder_index, filename_meth, os.path.join(folder_work, 'meth.{0}'.format(probe_count)), ))
+
+		# hilbert maps & images by resolution, over the CpG vector length
+
+		for r in resolutions :
+			run('hilbert_map', {'cpgs' : n, 'r' : r}, stage_hilbert_map, (n, r, ))
+			for N in image_sizes :
+				run('render_plan', {'cpgs' : n, 'r' : r, 'N' : N}, stage_render_plan, (n, r, N, ))
+				run('generate_hilbert_map', {'cpgs' : n, 'r' : r, 'N' : N, 'render' : 'interp', 'images' : args.images},
+					stage_generate_hilbert_map, (n, r, N, 'interp', args.images, folder_work, ))
+			run('generate_hilbert_map', {'cpgs' : n, 'r' : r, 'N' : 2 ** r, 'render' : 'mean', 'images' : args.images},
+				stage_generate_hilbert_map, (n, r, None, 'mean', args.images, folder_work, ))
+	finally :
+		if args.work == None :
+			shutil.rmtree(folder_work, ignore_errors = True)
+
+	report = {
+		'environment' : environment(),
+		'config' : vars(args),
+		'results' : results}
+	with open(args.output, 'w') as report_file :
+		json.dump(report, report_file, indent = 2)
+
+	# summary
+
+	for record in results :
+		rates = ', '.join('{0} {1:,.0f}'.format(name, value) for name, value in record.items() if name.endswith('_per_s') and value != None)
+		if 'error' in record :
+			rates = 'error'
+		print('    {0:<22} {1}'.format(record['stage'], json.dumps(record['params'])))
+		if 'error' not in record :
+			rates += ', {0:.3f}s, peak rss {1:.0f} MiB'.format(record['seconds'], record['peak_rss'] / 2.0 ** 20)
+		print('        {0}'.format(rates))
+	print('[*] report written to {0}'.format(args.output))
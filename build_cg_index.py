@@ -3,56 +3,193 @@
 
 import argparse
 import os
+import shutil
 import numpy as np
-import re
+import mmap
 import collections
+from multiprocessing import Pool
+from multiprocessing import cpu_count
 
-def build_cg_index(filename_ref_seq, filename_cg_index) :
-	# load sequence file
-	print('[*] loading reference sequence')
-	list_ref_seq = []
-	with open(filename_ref_seq, 'r') as ref_seq_file :
-		chrname = ''
-		seq = ''
+from cg_index import make_cg_index, save_cg_index
+
+# convert a raw sequence buffer to an upper case uint8 array
+
+def to_upper_seq(seq) :
+	seq = np.frombuffer(seq, dtype = np.uint8)
+	lower = (seq >= ord('a')) & (seq <= ord('z'))
+	if lower.any() :
+		seq = np.where(lower, seq - 32, seq).astype(np.uint8)
+	return seq
+
+# stream a fasta file one record at a time, each record is accumulated
+# in a bytearray so memory is bounded by the largest chromosome
+
+def read_fasta(filename_ref_seq) :
+	with open(filename_ref_seq, 'rb') as ref_seq_file :
+		chrname = None
+		seq = bytearray()
 		for line in ref_seq_file:
-			if(line[0] == '>'):
-				
-				# save current seq for current chr
-
-				if(chrname != ''):
-					list_ref_seq += [(chrname, seq)]
-				
-				# new chrname & seq
-
-				chrname = line[1:].strip()
-				seq = ''
-				print('    loading reference sequence: {0}'.format(chrname))
-			else:
-				seq += line.strip().upper()
-		
-		# write the last chr
+			if line[:1] == b'>':
+
+				# yield current seq for current chr
 
-		if(chrname != ''):
-			list_ref_seq += [(chrname, seq)]
-	ref_seq_file.close()
+				if chrname != None:
+					yield chrname, to_upper_seq(seq)
 
-	# build cg indexes
+				# new chrname & seq, the name is the first word of the
+				# header like in a samtools .fai index
 
+				fields = line[1:].split()
+				chrname = fields[0].decode() if fields else ''
+				seq = bytearray()
+			else:
+				seq += line.rstrip()
+
+		# yield the last chr
+
+		if chrname != None:
+			yield chrname, to_upper_seq(seq)
+
+# read a fasta file through its samtools .fai index, every record is
+# sliced out of a memory map of the fasta file
+
+def load_fasta_index(filename_fai) :
+	fasta_index = []
+	with open(filename_fai, 'r') as fai_file :
+		for line in fai_file :
+			fields = line.rstrip('\n').split('\t')
+			if len(fields) < 5 :
+				continue
+			fasta_index += [(fields[0], int(fields[1]), int(fields[2]), int(fields[3]), int(fields[4]))]
+	return fasta_index
+
+def read_fasta_record(ref_seq_map, fasta_index_item) :
+	chrname, chrlen, offset, line_bases, line_width = fasta_index_item
+	if chrlen == 0 :
+		return np.zeros(0, dtype = np.uint8)
+	size = (chrlen // line_bases) * line_width + chrlen % line_bases
+	seq = np.frombuffer(ref_seq_map, dtype = np.uint8, count = min(size, len(ref_seq_map) - offset), offset = offset)
+	seq = seq[(seq != ord('\n')) & (seq != ord('\r'))][:chrlen]
+	return to_upper_seq(seq)
+
+# 1-based positions of all CG dinucleotides of an upper case uint8 sequence
+
+def find_cg_indexes(seq) :
+	indexes = np.flatnonzero((seq[:-1] == ord('C')) & (seq[1:] == ord('G'))).astype(np.uint32)
+	indexes += 1
+	return indexes
+
+def find_cg_indexes_indexed(filename_ref_seq, fasta_index_item) :
+	with open(filename_ref_seq, 'rb') as ref_seq_file :
+		ref_seq_map = mmap.mmap(ref_seq_file.fileno(), 0, access = mmap.ACCESS_READ)
+		try :
+			seq = read_fasta_record(ref_seq_map, fasta_index_item)
+			return len(seq), find_cg_indexes(seq)
+		finally :
+			ref_seq_map.close()
+
+# byte ranges [seq_start, seq_end) of the sequence lines of every record
+# of a fasta file without a .fai index. only the headers are searched for,
+# the sequence lines are left to the workers
+
+def scan_fasta_records(filename_ref_seq) :
+	records = []
+	if os.path.getsize(filename_ref_seq) == 0 :
+		return records
+
+	with open(filename_ref_seq, 'rb') as ref_seq_file :
+		ref_seq_map = mmap.mmap(ref_seq_file.fileno(), 0, access = mmap.ACCESS_READ)
+		try :
+			header = 0 if ref_seq_map[:1] == b'>' else ref_seq_map.find(b'\n>') + 1
+			while header > 0 or ref_seq_map[:1] == b'>' :
+				header_end = ref_seq_map.find(b'\n', header)
+				if header_end < 0 :
+					header_end = len(ref_seq_map)
+				fields = ref_seq_map[header + 1 : header_end].split()
+				chrname = fields[0].decode() if fields else ''
+				next_header = ref_seq_map.find(b'\n>', header_end) + 1
+				records += [(chrname, min(header_end + 1, len(ref_seq_map)), next_header if next_header > 0 else len(ref_seq_map))]
+				if next_header == 0 :
+					break
+				header = next_header
+		finally :
+			ref_seq_map.close()
+
+	return records
+
+# the sequence of a scanned record, line breaks & other whitespace dropped
+# like read_fasta does
+
+def find_cg_indexes_range(filename_ref_seq, seq_start, seq_end) :
+	with open(filename_ref_seq, 'rb') as ref_seq_file :
+		ref_seq_map = mmap.mmap(ref_seq_file.fileno(), 0, access = mmap.ACCESS_READ)
+		try :
+			seq = np.frombuffer(ref_seq_map, dtype = np.uint8, count = seq_end - seq_start, offset = seq_start)
+			seq = to_upper_seq(seq[seq > ord(' ')].tobytes())
+		finally :
+			ref_seq_map.close()
+
+	return len(seq), find_cg_indexes(seq)
+
+# submit cg index tasks for all chromosomes, yields (chrname, result) where
+# result is (chrlen, cg positions), or an AsyncResult of it when a pool is
+# used. pool workers read their chromosome from the fasta file themselves,
+# through the .fai index or a byte range found by scan_fasta_records, so no
+# sequence is pickled to them
+
+def submit_cg_index_tasks(filename_ref_seq, p) :
+	filename_fai = filename_ref_seq + '.fai'
+	if os.path.isfile(filename_fai) :
+		print('[*] using fasta index {0}'.format(filename_fai))
+		for fasta_index_item in load_fasta_index(filename_fai) :
+			chrname = fasta_index_item[0]
+			print('    building cg indexes for reference sequence: {0}'.format(chrname))
+			if p != None :
+				yield chrname, p.apply_async(find_cg_indexes_indexed, (filename_ref_seq, fasta_index_item, ))
+			else :
+				yield chrname, find_cg_indexes_indexed(filename_ref_seq, fasta_index_item)
+	elif p != None :
+		for chrname, seq_start, seq_end in scan_fasta_records(filename_ref_seq) :
+			print('    building cg indexes for reference sequence: {0}'.format(chrname))
+			yield chrname, p.apply_async(find_cg_indexes_range, (filename_ref_seq, seq_start, seq_end, ))
+	else :
+		for chrname, seq in read_fasta(filename_ref_seq) :
+			print('    building cg indexes for reference sequence: {0}'.format(chrname))
+			yield chrname, (len(seq), find_cg_indexes(seq))
+			del seq
+
+def build_cg_index(filename_ref_seq, filename_cg_index, n_p = 1) :
 	print('[*] building cg indexes')
-	dict_cg_indexes = collections.OrderedDict()
+	list_cg_indexes = []
+	p = Pool(n_p) if n_p > 1 else None
+
+	# at most n_p chromosomes are in flight, results are collected in
+	# fasta order so offsets stay the same as a sequential run
+
+	pending = collections.deque()
 	offset = 0
-	for ref_seq in list_ref_seq:
-		chrname = ref_seq[0]
-		seq = ref_seq[1]
-		print('    building cg indexes for reference sequence: {0}'.format(chrname))
-		chrlen = len(seq)
-		indexes = [m.start() + 1 for m in re.finditer("CG", seq)]
-		dict_cg_indexes[chrname] = [offset, chrlen, np.array(indexes)]
+	tasks = submit_cg_index_tasks(filename_ref_seq, p)
+	while True :
+		task = next(tasks, None)
+		if task != None :
+			pending.append(task)
+		if not pending :
+			break
+		if task != None and len(pending) <= n_p :
+			continue
+
+		chrname, result = pending.popleft()
+		chrlen, indexes = result.get() if p != None else result
+		list_cg_indexes += [(chrname, offset, chrlen, indexes)]
 		offset += chrlen
+
+	if p != None :
+		p.close()
+		p.join()
 	
 	if filename_cg_index == None :
 		filename_cg_index = os.path.splitext(os.path.basename(filename_ref_seq))[0] + '.cgidx'
-	np.savez(filename_cg_index, indexes = dict_cg_indexes)
+	save_cg_index(make_cg_index(list_cg_indexes), filename_cg_index)
 
 	return filename_cg_index
 
@@ -64,11 +201,14 @@ if __name__ == "__main__":
 	parser.add_argument("-i", "--input", dest = "input", required = True,
 		help = "reference genome file", metavar = "FILE")
 	parser.add_argument("-o", "--output", dest = "output", required = False,
-		help = "output cg index file name .cgidx", metavar = "FILE")
+		help = "output cg index folder name .cgidx", metavar = "FOLDER")
+	parser.add_argument("-p", "--process", dest = "process", required = False, type = int,
+		help = "number of parallel processes", metavar = "INTEGER")
 
 	args = parser.parse_args()
 	filename_input = args.input
 	filename_output = args.output
+	n_p = args.process
 
 	# parameter check
 
@@ -76,8 +216,21 @@ if __name__ == "__main__":
 		print("[~] reference genome .fa file \"" + filename_input + "\" does not exist!")
 		exit(-1)
 
-	if filename_output != None and os.path.isfile(filename_output) :
-		os.unlink(filename_output)
+	# only an earlier cg index folder is replaced, anything else at the
+	# output path is left alone
+
+	if filename_output != None and os.path.exists(filename_output) :
+		if not os.path.isfile(os.path.join(filename_output, 'version.npy')) :
+			print("[~] output \"{0}\" exists and is not a cg index folder!".format(filename_output))
+			exit(-1)
+		shutil.rmtree(filename_output)
+
+	if n_p == None :
+		n_p = cpu_count()
+		print('[!] missing parallel parameters, using CPU count {0}'.format(n_p))
+		if n_p <= 0 :
+			n_p = 1
+			print('[!] undetected CPU count, using 1')
 
-	filename_output = build_cg_index(filename_input, filename_output)
+	filename_output = build_cg_index(filename_input, filename_output, n_p)
 	print('[*] cg index file "' + filename_output + '" write complete.')
\ No newline at end of file
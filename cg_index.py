@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import collections
+import numpy as np
+
+# CpG index format
+#
+# a .cgidx folder holding plain .npy files which can be opened with
+# np.load(mmap_mode = 'r') without unpickling anything
+#   version.npy     : format version
+#   chromosomes.npy : one row per chromosome in reference order
+#                     (name, offset, length, cg_start, cg_count)
+#   positions.npy   : 1-based CpG positions of all chromosomes as one flat
+#                     uint32 array, chromosome i owns
+#                     positions[cg_start : cg_start + cg_count]
+#
+# the legacy .cgidx.npz (a pickled OrderedDict of
+# chrname -> [offset, length, positions]) is format version 1
+
+CG_INDEX_VERSION = 2
+
+CHROMOSOME_DTYPE = np.dtype([
+	('name', 'U64'),
+	('offset', '<u8'),
+	('length', '<u8'),
+	('cg_start', '<u8'),
+	('cg_count', '<u8')])
+
+CgIndex = collections.namedtuple('CgIndex', ['chromosomes', 'positions', 'version'])
+
+def is_legacy_cg_index(filename_index) :
+	return os.path.isfile(filename_index)
+
+def make_cg_index(list_cg_indexes) :
+	# list_cg_indexes : [(chrname, offset, length, positions), ...]
+
+	chromosomes = np.zeros(len(list_cg_indexes), dtype = CHROMOSOME_DTYPE)
+	cg_start = 0
+	for i, (chrname, offset, chrlen, indexes) in enumerate(list_cg_indexes) :
+		chromosomes[i] = (chrname, offset, chrlen, cg_start, len(indexes))
+		cg_start += len(indexes)
+
+	positions = np.zeros(cg_start, dtype = np.uint32)
+	for chromosome, (chrname, offset, chrlen, indexes) in zip(chromosomes, list_cg_indexes) :
+		positions[chromosome['cg_start'] : chromosome['cg_start'] + chromosome['cg_count']] = indexes
+
+	return CgIndex(chromosomes, positions, CG_INDEX_VERSION)
+
+def save_cg_index(cg_index, folder_index) :
+	if not os.path.isdir(folder_index) :
+		os.makedirs(folder_index)
+
+	np.save(os.path.join(folder_index, 'chromosomes.npy'), cg_index.chromosomes)
+	np.save(os.path.join(folder_index, 'positions.npy'), cg_index.positions)
+
+	# the version is written last, an index folder without it is incomplete
+
+	np.save(os.path.join(folder_index, 'version.npy'), np.array(CG_INDEX_VERSION, dtype = np.uint32))
+
+	return folder_index
+
+def load_legacy_cg_index(filename_index) :
+	cg_indexes_file = np.load(filename_index, allow_pickle = True)
+	dict_cg_indexes = cg_indexes_file['indexes'].item()
+
+	return make_cg_index([(chrname, chrdata[0], chrdata[1], chrdata[2]) for chrname, chrdata in dict_cg_indexes.items()])
+
+def load_cg_index(filename_index, mmap_mode = 'r') :
+	if is_legacy_cg_index(filename_index) :
+		return load_legacy_cg_index(filename_index)
+
+	filename_version = os.path.join(filename_index, 'version.npy')
+	if not os.path.isfile(filename_version) :
+		raise ValueError('"{0}" is not a cg index'.format(filename_index))
+
+	version = int(np.load(filename_version))
+	if version != CG_INDEX_VERSION :
+		raise ValueError('unsupported cg index version {0} in "{1}"'.format(version, filename_index))
+
+	chromosomes = np.load(os.path.join(filename_index, 'chromosomes.npy'))
+	positions = np.load(os.path.join(filename_index, 'positions.npy'), mmap_mode = mmap_mode)
+
+	return CgIndex(chromosomes, positions, version)
+
+# chrname -> [offset, length, positions] view of an index, the positions
+# are slices of the flat array and are not copied
+
+def cg_index_to_dict(cg_index) :
+	dict_cg_indexes = collections.OrderedDict()
+	for chromosome in cg_index.chromosomes :
+		cg_start = int(chromosome['cg_start'])
+		dict_cg_indexes[str(chromosome['name'])] = [int(chromosome['offset']), int(chromosome['length']),
+			cg_index.positions[cg_start : cg_start + int(chromosome['cg_count'])]]
+
+	return dict_cg_indexes
+
+# map (chr, pos) probes to CpG vector slots with a sorted position join,
+# in exact mode probes not on a CpG of the index are mapped to -1
+
+def _search_cg_slots(cg_index, chrnames, positions, exact) :
+	positions = np.asarray(positions)
+	slots = np.full(len(positions), -1, dtype = np.int64)
+	if len(positions) == 0 :
+		return slots
+
+	dict_chromosomes = dict((str(name), i) for i, name in enumerate(cg_index.chromosomes['name']))
+
+	# group probes by chromosome with one stable sort
+
+	names, inverse = np.unique(chrnames, return_inverse = True)
+	order = np.argsort(inverse, kind = 'stable')
+	bounds = np.searchsorted(inverse[order], np.arange(len(names) + 1))
+
+	for i, name in enumerate(names) :
+		if isinstance(name, bytes) :
+			name = name.decode()
+		if str(name) not in dict_chromosomes :
+			continue
+
+		chromosome = cg_index.chromosomes[dict_chromosomes[str(name)]]
+		cg_start = int(chromosome['cg_start'])
+		cg_count = int(chromosome['cg_count'])
+		if cg_count == 0 :
+			continue
+
+		rows = order[bounds[i] : bounds[i + 1]]
+		chr_positions = cg_index.positions[cg_start : cg_start + cg_count]
+		chr_slots = np.searchsorted(chr_positions, positions[rows])
+		if not exact :
+			slots[rows] = cg_start + chr_slots
+			continue
+		chr_slots[chr_slots >= cg_count] = cg_count - 1
+		matched = chr_positions[chr_slots] == positions[rows]
+		slots[rows[matched]] = cg_start + chr_slots[matched]
+
+	return slots
+
+# probes not on a CpG of the index are mapped to -1
+
+def find_cg_slots(cg_index, chrnames, positions) :
+	return _search_cg_slots(cg_index, chrnames, positions, True)
+
+# slot of the first CpG at or after each position, cg_start + cg_count of
+# the chromosome past its last CpG, -1 for unknown chromosomes
+
+def locate_cg_slots(cg_index, chrnames, positions) :
+	return _search_cg_slots(cg_index, chrnames, positions, False)
+
+# (chromosome names, positions) of CpG slots
+
+def cg_slot_coordinates(cg_index, slots) :
+	slots = np.asarray(slots, dtype = np.int64)
+	chromosomes = np.searchsorted(cg_index.chromosomes['cg_start'], slots, side = 'right') - 1
+
+	return cg_index.chromosomes['name'][chromosomes], cg_index.positions[slots]
+
+# CpG methylation vector of a sample, CpGs without a probe are 0
+
+def generate_cg_meth(cg_index, meth_data, dtype = np.float64) :
+	cg_meth = np.zeros(len(cg_index.positions), dtype = dtype)
+	slots = find_cg_slots(cg_index, meth_data['chr'], meth_data['pos'])
+	matched = slots >= 0
+	cg_meth[slots[matched]] = meth_data['beta'][matched]
+
+	return cg_meth
+
+def convert_cg_index(filename_legacy, folder_index) :
+	if folder_index == None :
+		folder_index = os.path.splitext(filename_legacy)[0]
+		if not folder_index.endswith('.cgidx') :
+			folder_index += '.cgidx'
+
+	return save_cg_index(load_legacy_cg_index(filename_legacy), folder_index)
+
+if __name__ == "__main__":
+
+	# command line arguments
+
+	parser = argparse.ArgumentParser(description = "Convert legacy .cgidx.npz CpG indexes to the .cgidx format")
+	parser.add_argument("-i", "--input", dest = "input", required = True,
+		help = "legacy cg index .cgidx.npz file", metavar = "FILE")
+	parser.add_argument("-o", "--output", dest = "output", required = False,
+		help = "output cg index folder .cgidx", metavar = "FOLDER")
+
+	args = parser.parse_args()
+	filename_input = args.input
+	folder_output = args.output
+
+	# parameter check
+
+	if not os.path.isfile(filename_input) :
+		print("[~] CG index .cgidx.npz file \"{0}\" does not exist!".format(filename_input))
+		exit(-1)
+
+	folder_output = convert_cg_index(filename_input, folder_output)
+	print('[*] cg index "{0}" write complete.'.format(folder_output))
@@ -6,31 +6,23 @@ import argparse
 import os
 import shutil
 import numpy as np
-from numpy import genfromtxt
+
+from meth_io import read_meth_data, write_clean_meth_data
 
 
 # script_path = os.path.abspath(os.path.dirname(sys.argv[0]))
 # clean_meth_script = os.path.join(script_path, 'clean_meth_data.py')
 
-def clean_meth_data(filename_input, filename_output) :
-	methy_data = genfromtxt(filename_input, delimiter = '\t', skip_header = 1,
-		usecols = (0, 1, 2, 3), autostrip = True,
-		dtype = ('|S12', '<f8', '|S8', '<u8'), 
-		names = ('ref', 'beta', 'chr', 'pos'))
-
-	# filter out all unknown chrs
+def clean_meth_data(filename_input, filename_output, as_csv = False) :
+	# unknown chrs & nan beta values are filtered out while reading
 
-	methy_data = methy_data[methy_data['chr'] != '*']
+	methy_data = read_meth_data(filename_input)
+	if filename_output == None :
+		filename_output = os.path.splitext(os.path.basename(filename_input))[0] + ('.clean.csv' if as_csv else '.clean.npz')
 
-	# filter out all nan beta values
+	# binary .clean.npz, or text when the output filename ends with .csv
 
-	methy_data = methy_data[~np.isnan(methy_data['beta'])]
-	if filename_output == None :
-		filename_output = os.path.splitext(os.path.basename(filename_input))[0] + '.clean.csv'
-	np.savetxt(filename_output, 
-		methy_data, 
-		fmt=('%s, %f, %s, %ld'), 
-		delimiter = ',')
+	write_clean_meth_data(methy_data, filename_output)
 
 	return filename_output
 
@@ -42,11 +34,14 @@ if __name__ == "__main__":
 	parser.add_argument("-i", "--input", dest = "input", required = True,
 		help = "methylation.txt with betavalue downloaded from TCGA data repository", metavar = "FILE")
 	parser.add_argument("-o", "--output", dest = "output", required = False,
-		help = "output filename", metavar = "FILE")
+		help = "output filename, .clean.npz binary unless it ends with .csv", metavar = "FILE")
+	parser.add_argument("--csv", dest = "csv", required = False, action = 'store_true',
+		help = "default to a .clean.csv text output")
 
 	args = parser.parse_args()
 	filename_input = args.input
 	filename_output = args.output
+	as_csv = args.csv
 
 	# parameter check
 
@@ -57,5 +52,5 @@ if __name__ == "__main__":
 	# read & parse input file
 
 	print('[*] parsing methylation data file ...')
-	filename_output = clean_meth_data(filename_input, filename_output)
+	filename_output = clean_meth_data(filename_input, filename_output, as_csv)
 	print('[*] {0} written complete'.format(filename_output))
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import time
+import collections
+import numpy as np
+
+# cohort store, all CpG methylation vectors of a cohort in one folder
+#   meth.npy   : (samples x CpGs) float32 matrix, row i is sample i of the
+#                meta file, columns are the CpG slots of the cg index
+#   status.npy : (samples) float64, time the row of a sample was last
+#                written, 0 while it has not been written
+#   rows.csv   : row, file_id, file_name manifest
+#   version.npy: format version
+#
+# rows are filled in place by the workers through a memory map, readers
+# can slice any sample or CpG range without loading the whole cohort
+
+COHORT_STORE_VERSION = 2
+
+CohortStore = collections.namedtuple('CohortStore', ['meth', 'status', 'file_ids', 'file_names', 'rows'])
+
+def _str(value) :
+	if isinstance(value, bytes) :
+		return value.decode()
+	return str(value)
+
+def is_cohort_store(folder_store) :
+	return os.path.isfile(os.path.join(folder_store, 'version.npy'))
+
+def create_cohort_store(folder_store, file_ids, file_names, cg_count, dtype = np.float32) :
+	_writable_stores.pop(os.path.abspath(folder_store), None)
+	if not os.path.isdir(folder_store) :
+		os.makedirs(folder_store)
+
+	# the matrix file is created sparse, rows of missing samples read as 0
+
+	meth = np.lib.format.open_memmap(os.path.join(folder_store, 'meth.npy'), mode = 'w+',
+		dtype = dtype, shape = (len(file_ids), cg_count))
+	del meth
+	np.save(os.path.join(folder_store, 'status.npy'), np.zeros(len(file_ids), dtype = np.float64))
+
+	with open(os.path.join(folder_store, 'rows.csv'), 'w') as rows_file :
+		for row, (file_id, file_name) in enumerate(zip(file_ids, file_names)) :
+			rows_file.write('{0},{1},{2}\n'.format(row, _str(file_id), _str(file_name)))
+
+	np.save(os.path.join(folder_store, 'version.npy'), np.array(COHORT_STORE_VERSION, dtype = np.uint32))
+
+	return folder_store
+
+def open_cohort_store(folder_store, mode = 'r') :
+	version = int(np.load(os.path.join(folder_store, 'version.npy')))
+	if version != COHORT_STORE_VERSION :
+		raise ValueError('unsupported cohort store version {0} in "{1}"'.format(version, folder_store))
+
+	meth = np.load(os.path.join(folder_store, 'meth.npy'), mmap_mode = mode)
+	status = np.load(os.path.join(folder_store, 'status.npy'), mmap_mode = mode)
+
+	file_ids = []
+	file_names = []
+	with open(os.path.join(folder_store, 'rows.csv'), 'r') as rows_file :
+		for line in rows_file :
+			row, file_id, file_name = line.rstrip('\n').split(',', 2)
+			file_ids += [file_id]
+			file_names += [file_name]
+
+	rows = dict((file_id, row) for row, file_id in enumerate(file_ids))
+
+	return CohortStore(meth, status, file_ids, file_names, rows)
+
+# an existing store can be reused when it has the same rows & width
+
+def cohort_store_matches(folder_store, file_ids, cg_count) :
+	if not is_cohort_store(folder_store) :
+		return False
+	try :
+		store = open_cohort_store(folder_store)
+	except (IOError, ValueError) :
+		return False
+	return store.file_ids == [_str(file_id) for file_id in file_ids] and store.meth.shape[1] == cg_count
+
+# writable (meth, status) maps of a store, opened once per process and
+# folder instead of once per row, rows.csv is not needed to write a row.
+# creating a store drops the maps this process holds of the folder
+
+_writable_stores = {}
+
+def _writable_store(folder_store) :
+	key = os.path.abspath(folder_store)
+	if key not in _writable_stores :
+		version = int(np.load(os.path.join(folder_store, 'version.npy')))
+		if version != COHORT_STORE_VERSION :
+			raise ValueError('unsupported cohort store version {0} in "{1}"'.format(version, folder_store))
+		_writable_stores[key] = (np.load(os.path.join(folder_store, 'meth.npy'), mmap_mode = 'r+'),
+			np.load(os.path.join(folder_store, 'status.npy'), mmap_mode = 'r+'))
+
+	return _writable_stores[key]
+
+# fill one row in place, the status flag is only set once the row is on
+# disk, returns the bytes written
+
+def write_cohort_row(folder_store, row, cg_meth) :
+	meth, status = _writable_store(folder_store)
+	if len(cg_meth) != meth.shape[1] :
+		raise ValueError('cg vector length {0} does not match cohort store width {1}'.format(len(cg_meth), meth.shape[1]))
+
+	meth[row] = cg_meth
+	meth.flush()
+	status[row] = time.time()
+	status.flush()
+
+	return meth[row].nbytes
+
+# CpG vector (or the [cg_start, cg_end) range of it) of one sample, None if
+# the sample is not in the store or its row has not been written
+
+def read_cohort_sample(store, file_id, cg_start = 0, cg_end = None) :
+	row = store.rows.get(_str(file_id))
+	if row == None or not store.status[row] :
+		return None
+
+	return store.meth[row, cg_start : cg_end]
@@ -1,93 +1,160 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-def extract_tcga_metadata(metadata, output_file) :
+import re
+import json
+import collections
+
+# the top-level array of metadata.json is decoded one item at a time, only
+# the current item and one read buffer are held in memory
+
+READ_SIZE = 1 << 16
+
+_SEPARATORS = re.compile(r'[\s,]*')
+
+def iter_json_array(json_file, read_size = READ_SIZE) :
+	decoder = json.JSONDecoder()
+	buffer = json_file.read(read_size).lstrip()
+	while not buffer :
+		chunk = json_file.read(read_size)
+		if not chunk :
+			break
+		buffer = chunk.lstrip()
+	if not buffer.startswith('[') :
+		raise ValueError('metadata is not a json array')
+
+	# items are decoded in place from offset idx, the buffer is only cut
+	# when a read appends to it
+
+	idx = 1
+	eof = False
+	while True :
+		idx = _SEPARATORS.match(buffer, idx).end()
+		if buffer.startswith(']', idx) :
+			return
+		try :
+			if idx == len(buffer) :
+				raise ValueError('buffer end')
+			item, idx = decoder.raw_decode(buffer, idx)
+		except ValueError :
+
+			# item cut by the buffer end, read on. the read grows with the
+			# buffer so a large item is decoded a bounded number of times
+
+			if eof :
+				raise ValueError('metadata json array is truncated or malformed')
+			buffer = buffer[idx:]
+			idx = 0
+			chunk = json_file.read(max(read_size, len(buffer)))
+			eof = not chunk
+			buffer += chunk
+			continue
+		yield item
+
+# csv row of one metadata item, or the reason it is skipped
+
+def extract_metadata_row(metadata_item) :
+	file_id = metadata_item.get('file_id')
+	file_name = metadata_item.get('file_name')
+	if not file_id or not file_name :
+		return None, 'file id or name missing'
+
+	# case info
+
+	cases = metadata_item.get('cases')
+	if not cases :
+		return None, 'cases info missing'
+	case_info = cases[0]
+
+	primary_site = case_info.get('primary_site')
+	disease_type = case_info.get('disease_type')
+
+	# demographic info
+
+	demographic_info = case_info.get('demographic')
+	if not demographic_info :
+		return None, 'demographic info missing'
+	gender = (demographic_info.get('gender') == 'male')
+	race = demographic_info.get('race')
+
+	# diagnosis info
+
+	diagnoses = case_info.get('diagnoses')
+	if not diagnoses :
+		return None, 'diagnosis info missing'
+	age = diagnoses[0].get('age_at_diagnosis')
+
+	# sample info, the GDC gives sample type ids as strings ("01")
+
+	samples = case_info.get('samples')
+	if not samples :
+		return None, 'sample info missing'
+	sample_info = samples[0]
+	try :
+		sample_type_id = int(sample_info['sample_type_id'])
+	except (KeyError, TypeError, ValueError) :
+		return None, 'sample type id missing'
+	is_tumor = (sample_type_id > 0 and sample_type_id < 10)
+	sample_type = sample_info.get('sample_type')
+	is_alive = (sample_info.get('state') == 'live')
+
+	return [
+		file_id,
+		file_name,
+		primary_site,
+		disease_type,
+		gender,
+		age,
+		race,
+		is_tumor,
+		sample_type_id,
+		sample_type,
+		is_alive], None
+
+# metadata : iterable of metadata items, rows go to the csv writer and/or
+# the table rows list as they are extracted
+
+def extract_tcga_metadata(metadata, metadata_writer = None, table_rows = None) :
 	total_count = 0
 	success_count = 0
-	error_count = 0
-	metadata_writer = csv.writer(output_file, delimiter = ',')
-	for metadata_item in metadata : 
-		file_id = metadata_item['file_id']
-		file_name = metadata_item['file_name']
-		total_count += 1 
-
-		# check file existence
-
-		# if not os.path.isfile('./' + file_id + '/' + file_name) :
-		# 	print("warning: file {0} does not exist, please download again".format(file_id))
-		# 	error_count += 1
-		# 	continue
-		
-		# case info 
-
-		cases = metadata_item['cases']
-		if len(cases) :
-			case_info = cases[0]
-		else :
-			print("[!]: cases info of file {0} is missing, skipped".format(file_id))
-			error_count += 1
-			continue
-
-		primary_site = case_info['primary_site']
-		disease_type = case_info['disease_type']
-
-		# demographic info
-
-		if 'demographic' in case_info:
-			demographic_info = case_info['demographic']
-			gender = (demographic_info['gender'] == 'male')
-			race = demographic_info['race']
-		else :
-			print("[!]: demographic info of file {0} is missing, skipped".format(file_id))
-			error_count += 1
+	skipped = collections.Counter()
+	for metadata_item in metadata :
+		total_count += 1
+
+		row, reason = extract_metadata_row(metadata_item)
+		if row == None :
+			print("[!]: {0} of file {1}, skipped".format(reason, metadata_item.get('file_id')))
+			skipped[reason] += 1
 			continue
 
-		# diagnosis info
-
-		diagnosis_info = case_info['diagnoses'][0]
-		age = diagnosis_info['age_at_diagnosis']
-
-		# sample info 
-
-		sample_info = case_info['samples'][0]
-		is_tumor = (sample_info['sample_type_id'] > 0 and sample_info['sample_type_id'] < 10)
-		sample_type_id = sample_info['sample_type_id']
-		sample_type = sample_info['sample_type']
-		is_alive = (sample_info['state'] == 'live')
-
-		metadata_writer.writerow([
-			file_id,
-			file_name,
-			primary_site,
-			disease_type,
-			gender,
-			age,
-			race,
-			is_tumor,
-			sample_type_id,
-			sample_type,
-			is_alive])
+		if metadata_writer != None :
+			metadata_writer.writerow(row)
+		if table_rows != None :
+			table_rows += [row]
 		success_count += 1
 
-	return total_count, success_count, error_count
+	return total_count, success_count, skipped
 
 if __name__ == "__main__":
 	import argparse
 	import os
-	import json
 	import csv
+	from meta_data import make_meta_table, save_meta_table
 
 	# command line arguments
 
 	parser = argparse.ArgumentParser(description = "Extract TCGA metadata")
 	parser.add_argument("-m", "--metadata", dest = "metadata", required = True,
 		help = "metadata.json downloaded from TCGA data repository", metavar = "FILE")
-	parser.add_argument("-o", "--output", dest = "output", required = True,
+	parser.add_argument("-o", "--output", dest = "output", required = False,
 		help = "output csv filename", metavar = "FILE")
+	parser.add_argument("-t", "--table", dest = "table", required = False,
+		help = "output typed .npy meta table filename", metavar = "FILE")
 
 	args = parser.parse_args()
 	filename_metadata = args.metadata
 	filename_output = args.output
+	filename_table = args.table
 
 	# check files existence
 
@@ -95,17 +162,25 @@ if __name__ == "__main__":
 		print("[*] TCGA metadata.json file \"{0}\" does not exist!".format(filename_metadata))
 		exit(-1)
 
-	# open files
-
-	with open(filename_metadata, "r") as file_metadata, \
-		 open(filename_output, "wb") as file_output :
-		metadata = json.load(file_metadata)
-		total_count, success_count, error_count = extract_tcga_metadata(metadata, file_output)
-
-	print("[*] complete: {0} items scanned, {1} items extracted, {2} item failed.".format(total_count, success_count, error_count))
-
-
+	if filename_output == None and filename_table == None :
+		print("[~] no csv or table output given!")
+		exit(-1)
 
+	# open files
 
+	table_rows = [] if filename_table != None else None
+	with open(filename_metadata, "r") as file_metadata :
+		if filename_output != None :
+			with open(filename_output, "w", newline = '') as file_output :
+				metadata_writer = csv.writer(file_output, delimiter = ',')
+				total_count, success_count, skipped = extract_tcga_metadata(iter_json_array(file_metadata), metadata_writer, table_rows)
+		else :
+			total_count, success_count, skipped = extract_tcga_metadata(iter_json_array(file_metadata), None, table_rows)
 
+	if filename_table != None :
+		save_meta_table(make_meta_table(table_rows), filename_table)
+		print("[*] meta table {0} written".format(filename_table))
 
+	print("[*] complete: {0} items scanned, {1} items extracted, {2} item failed.".format(total_count, success_count, sum(skipped.values())))
+	for reason, count in skipped.most_common() :
+		print("    {0}: {1}".format(reason, count))
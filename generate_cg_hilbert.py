@@ -5,26 +5,16 @@ import argparse
 import os
 import shutil
 import numpy as np
-import matplotlib as mpl
-if os.environ.get('DISPLAY','') == '':
-    print('[!] No display found, using non-interactive Agg backend')
-    mpl.use('Agg')
-import matplotlib.pyplot as plt
-from scipy.interpolate import griddata
-import matplotlib.cm as cm
 
 import hilbert as hb
+from cg_index import load_cg_index, generate_cg_meth
+from meth_io import read_clean_meth_data
+import hilbert_render as hr
+from image_io import save_hilbert_image
 
 def generate_hilbert_map(v, r, N, filename) :
-	plt_data = np.array(hb.hilbert_plot(v, r))
-	x = plt_data[:, 0]
-	y = plt_data[:, 1]
-	z = plt_data[:, 2]
-
-	dmax = 2**r
-	xs, ys = np.mgrid[0:dmax:N, 0:dmax:N]
-	zs = griddata((x, y), z, (xs, ys))
-	plt.imsave(filename, zs.T, cmap = cm.gray_r, vmin = 0, vmax = 1)
+	zs = hr.render_hilbert_map(v, r, N)
+	save_hilbert_image(filename, zs)
 
 if __name__ == "__main__":
 
@@ -32,22 +22,25 @@ if __name__ == "__main__":
 
 	parser = argparse.ArgumentParser(description = "Generate CG hilbert maps")
 	parser.add_argument("-i", "--input", dest = "input", required = True,
-		help = "methylation.txt with betavalue downloaded from TCGA data repository", metavar = "FILE")
+		help = "cleaned methylation .clean.npz or .clean.csv file", metavar = "FILE")
 	parser.add_argument("-d", "--index", dest = "index", required = True,
-		help = "cg index cgidx.npz file", metavar = "FILE")
+		help = "cg index .cgidx folder or legacy .cgidx.npz file", metavar = "FILE")
 	parser.add_argument("-o", "--output", dest = "output", required = False,
 		help = "output filename", metavar = "FILE")
 	parser.add_argument("-r", "--resolution", dest = "resolution", required = False, type = int, default = 10,
 		help = "hilbert resolution", metavar = "INTEGER")
 	parser.add_argument("-N", "--image-point", dest = "N", required = False, type = int, default = 300,
-		help = "image point in imaginary form", metavar = "INTEGER")
+		help = "image points per side", metavar = "INTEGER")
+	parser.add_argument("-c", "--cache", dest = "cache", required = False,
+		help = "hilbert map and render plan cache folder", metavar = "FOLDER")
 
 	args = parser.parse_args()
 	filename_input = args.input
 	filename_index = args.index
 	filename_output = args.output
-	image_size = complex(args.N)
+	image_size = args.N
 	resolution = args.resolution
+	folder_cache = args.cache
 
 	# parameter check
 
@@ -55,45 +48,29 @@ if __name__ == "__main__":
 		print("[~] cleaned methylation file \"{0}\" does not exist!".format(filename_input))
 		exit(-1)
 
-	if not os.path.isfile(filename_index) :
-		print("[~] CG index .cgidx.npz file \"{0}\" does not exist!".format(filename_index))
+	if not os.path.exists(filename_index) :
+		print("[~] CG index .cgidx file \"{0}\" does not exist!".format(filename_index))
 		exit(-1)
 
 	if filename_output == None :
 		filename_output = os.path.splitext(os.path.basename(filename_input))[0]
+
+	if folder_cache != None :
+		hb.set_cache_dir(folder_cache)
 	
 	# load indexes
 
 	print('[*] loading cg indexes')
-	cg_indexes_file = np.load(filename_index)
-	cg_indexes = cg_indexes_file['indexes']
-	dict_cg_indexes = cg_indexes.item()
+	cg_index = load_cg_index(filename_index)
 
 	# load methylation data
 
 	print('[*] loading methyaltion data')
-	meth_data = np.genfromtxt(filename_input, delimiter = ',', autostrip = True,
-		dtype = ('|S12', '<f8', '|S8', '<u8'),
-		names = ('ref', 'beta', 'chr', 'pos'))
+	meth_data = read_clean_meth_data(filename_input)
 
 	print('[*] building methylation data list')
-	cg_meth = np.array([], dtype = '<f8')
-	genome_meth = np.array([], dtype = '<f8')
-	for chrname in dict_cg_indexes :
-		print('    parsing: {0}'.format(chrname))
-		chrdata = dict_cg_indexes[chrname]
-		chr_size = chrdata[1]
-		chr_cg_index = chrdata[2]
-
-		meth = np.zeros(chr_size)
-		chr_meth_data = meth_data[meth_data['chr'] == chrname]
-		meth[chr_meth_data['pos'] - 1] = chr_meth_data['beta']
-		cg = meth[chr_cg_index - 1]
-
-		cg_meth = np.append(cg_meth, cg)
-
-		genome_meth = np.append(genome_meth, meth)
-	
+	cg_meth = generate_cg_meth(cg_index, meth_data)
+
 	# generate hilbert curve
 
 	# print('[*] generating hilbert map')
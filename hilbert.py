@@ -1,96 +1,101 @@
-import math
+import os
+import collections
+import numpy as np
 
-def hilbert_index_to_xy(z, r):    
+# vectorized hilbert index -> (x, y) transform of resolution r
+# z can be a scalar or an integer array, x and y are returned as int64 arrays
+
+def hilbert_index_to_xy_array(z, r) :
+    z = np.asarray(z, dtype = np.int64)
     if r <= 0 :
-        return -1, -1
-    
+        return np.full(z.shape, -1, dtype = np.int64), np.full(z.shape, -1, dtype = np.int64)
+
     # positions of resolution r = 1 hilbert curve
-    
-    positions = (
+
+    positions = np.array([
         [0, 0], # quadrant 0
         [0, 1], # quadrant 1
         [1, 1], # quadrant 2
         [1, 0]  # quadrant 3
-    )
-    
-    # the last two bits of hibert index z represents 
-    # the quadrant of the index
-    
+    ], dtype = np.int64)
+
+    # process at least r quadrant digits, leading zero digits only swap x, y
+    # which keeps the result identical to the scalar version
+
+    levels = r
+    if z.size :
+        levels = max(levels, (int(z.max()).bit_length() + 1) >> 1)
+
     quadrant = z & 0x03
-    z >>= 2
-    rmin = 1
+    x = positions[quadrant, 0]
+    y = positions[quadrant, 1]
     w = 2
-    x, y = positions[quadrant]
-    while z > 0:
-        quadrant = z & 0x03
-        if quadrant == 0 : # left bottom 
-                x, y = y, x
-        elif quadrant == 1 : # left top
-                x, y = x, y + w
-        elif quadrant == 2 : # right top
-                x, y = x + w, y + w
-        elif quadrant == 3 : # right bottom
-                x, y = w * 2 - y - 1, w - x - 1
-        
-        z >>= 2
-        rmin += 1
+    for level in range(1, levels) :
+        quadrant = (z >> (2 * level)) & 0x03
+        q0 = quadrant == 0 # left bottom
+        q1 = quadrant == 1 # left top
+        q2 = quadrant == 2 # right top
+        q3 = quadrant == 3 # right bottom
+        x, y = (
+            np.where(q0, y, np.where(q3, w * 2 - y - 1, x + w * q2)),
+            np.where(q0, x, np.where(q3, w - x - 1, y + w * (q1 | q2))))
         w <<= 1
-        
-    if((rmin ^ r) & 0x01) :
+
+    if (levels ^ r) & 0x01 :
         x, y = y, x
-    
+
     return x, y
 
-def xy_to_hilbert_index(x, y, r) :
-    # quadrants
-    
-    quadrants = [
-        0, # (0, 0) 
+# vectorized (x, y) -> hilbert index transform of resolution r
+# coordinates out of the 2**r x 2**r square are mapped to -1
+
+def xy_to_hilbert_index_array(x, y, r) :
+    x, y = np.broadcast_arrays(np.asarray(x, dtype = np.int64), np.asarray(y, dtype = np.int64))
+    z = np.zeros(x.shape, dtype = np.int64)
+    if r <= 0 :
+        return z - 1
+
+    valid = (x >= 0) & (y >= 0) & (x < (1 << r)) & (y < (1 << r))
+    x = np.where(valid, x, 0)
+    y = np.where(valid, y, 0)
+
+    # quadrants of (x >= w, y >= w)
+
+    quadrants = np.array([
+        0, # (0, 0)
         1, # (0, 1)
         3, # (1, 0)
         2  # (1, 1)
-    ]
-    
-    # determin the minimum resolution rmin, 
-    # the index of rmin will be the same with r
-    
-    rmin = int(math.floor(math.log(max(x, y), 2))) + 1
-    if r < rmin :
-        return -1
-    
-    # check the parities of rmin with r, 
-    # exchange x, y if they are different
-    
-    if((rmin ^ r) & 0x01) :
-        x, y = y, x
-    
-    w = 1 << (rmin - 1)
-    z = 0
-    while rmin > 0 :
-        quadrant = quadrants[(int(x / w) << 1) | int(y / w)]
-        if quadrant == 0 : # left bottom 
-            x, y = y, x
-        elif quadrant == 1 : # left top
-            x, y = x, y - w
-        elif quadrant == 2 : # right top
-            x, y = x - w, y - w
-        elif quadrant == 3 : # right bottom
-            x, y = w - y - 1, w * 2 - x -1
+    ], dtype = np.int64)
+
+    w = 1 << (r - 1)
+    while w > 0 :
+        quadrant = quadrants[((x >= w).astype(np.int64) << 1) | (y >= w)]
+        q0 = quadrant == 0 # left bottom
+        q1 = quadrant == 1 # left top
+        q2 = quadrant == 2 # right top
+        q3 = quadrant == 3 # right bottom
+        x, y = (
+            np.where(q0, y, np.where(q3, w - y - 1, x - w * q2)),
+            np.where(q0, x, np.where(q3, w * 2 - x - 1, y - w * (q1 | q2))))
+        z = (z << 2) | quadrant
         w >>= 1
-        z <<= 2
-        z |= quadrant
-        rmin -= 1
-    
-    return z
+
+    return np.where(valid, z, -1)
+
+def hilbert_index_to_xy(z, r) :
+    x, y = hilbert_index_to_xy_array(z, r)
+    return int(x), int(y)
+
+def xy_to_hilbert_index(x, y, r) :
+    return int(xy_to_hilbert_index_array(x, y, r))
 
 # generate a hilbert point list of resolution r
 
 def hilbert_indexes(r) :
-    n = 4 ** r
-    coordinates = []
-    for i in range(n) :
-        coordinates += [(hilbert_index_to_xy(i, r))]
-        
+    x, y = hilbert_index_to_xy_array(np.arange(4 ** r, dtype = np.int64), r)
+    coordinates = np.stack((x, y), axis = 1)
+
     return coordinates
 
 # generate a hilbert map list of length n vector with resolution r
@@ -116,30 +121,225 @@ def stair_map(coordinates, index_start, index_end, x) :
             return x1 - offset, y1 
     return -1, -1
     
+def stair_map_array(coordinates, index_start, index_end, x) :
+    x1 = coordinates[index_start, 0]
+    y1 = coordinates[index_start, 1]
+
+    # adjacent hilbert points always differ in exactly one coordinate by 1
+
+    dx = coordinates[index_end, 0] - x1
+    dy = coordinates[index_end, 1] - y1
+    offset = x - index_start
+
+    return np.stack((x1 + dx * offset, y1 + dy * offset), axis = 1)
+
 def hilbert_map(n, r) :
     index_count = 4 ** r
     
     # rescale n vector positions
     
-    pos_list = [i * 1.0 * (index_count - 1) / (n - 1) for i in range(n)]
+    pos_list = np.arange(n, dtype = np.float64) * (index_count - 1) / max(n - 1, 1)
     
     # assign hilbert segment start indexe for each position
     
-    pos_list = [(int(math.floor(x)), int(math.ceil(x)), x) for x in pos_list]
+    index_start = np.floor(pos_list).astype(np.int64)
+    index_end = np.ceil(pos_list).astype(np.int64)
     
     # get hilbert index coordinates
     
-    index_coords = hilbert_indexes(r)
+    index_coords = cached_hilbert_indexes(r)
     
     # get the mapped position coordinates
     
-    pos_coords = [(stair_map(index_coords, pos[0], pos[1], pos[2])) for pos in pos_list]
+    pos_coords = stair_map_array(index_coords, index_start, index_end, pos_list)
     
     return pos_coords
 
+# cache of hilbert coordinate tables and position maps
+# maps are keyed by (n, r) and kept in an in-process LRU, when a cache
+# folder is set (set_cache_dir or HILBERT_CACHE_DIR) they are also stored
+# as .npy files so other processes and later runs can reuse them
+
+CACHE_SIZE = 8
+
+_cache_dir = os.environ.get('HILBERT_CACHE_DIR') or None
+_cache = collections.OrderedDict()
+
+def set_cache_dir(folder) :
+    global _cache_dir
+    if folder != None and not os.path.isdir(folder) :
+        os.makedirs(folder)
+    _cache_dir = folder
+
+def get_cache_dir() :
+    return _cache_dir
+
+def clear_cache() :
+    _cache.clear()
+
+def _cache_lookup(key, filename, build) :
+    if key in _cache :
+        _cache.move_to_end(key)
+        return _cache[key]
+
+    value = None
+    filename_cache = None
+    if _cache_dir != None :
+        filename_cache = os.path.join(_cache_dir, filename)
+        if os.path.isfile(filename_cache) :
+            try :
+                value = np.load(filename_cache, mmap_mode = 'r')
+            except (IOError, ValueError) :
+                value = None
+
+    if value is None :
+        value = build()
+        value.setflags(write = False)
+        if filename_cache != None :
+            # write to a temporary file first so concurrent readers
+            # never see a partially written map
+
+            filename_tmp = '{0}.{1}.tmp.npy'.format(filename_cache, os.getpid())
+            np.save(filename_tmp, value)
+            os.replace(filename_tmp, filename_cache)
+
+    _cache[key] = value
+    while len(_cache) > CACHE_SIZE :
+        _cache.popitem(last = False)
+
+    return value
+
+def cached_hilbert_indexes(r) :
+    return _cache_lookup(('indexes', r), 'hilbert.indexes.r{0}.npy'.format(r),
+        lambda : hilbert_indexes(r))
+
+def cached_hilbert_map(n, r) :
+    return _cache_lookup(('map', n, r), 'hilbert.map.n{0}.r{1}.npy'.format(n, r),
+        lambda : hilbert_map(n, r))
+
 def hilbert_plot(v, r) :
     data_len = len(v)
-    data_coords = hilbert_map(data_len, r)
-    data = [(coord[0][0], coord[0][1], coord[1]) for coord in zip(data_coords, v)]
+    data_coords = cached_hilbert_map(data_len, r)
+    data = np.column_stack((data_coords, v))
     
-    return data
\ No newline at end of file
+    return data
+
+# hilbert cells
+# value i of an n vector falls into curve cell i * 4**r // n, so every
+# cell holds a contiguous run of the vector. the 4 cells of a quadrant are
+# consecutive on the curve, a level r - 1 cell is the sum of 4 neighbour
+# cells of level r and coarser levels come exactly from the finer one
+
+def hilbert_cells(n, r, slot_start = 0, slot_end = None) :
+    slot_end = n if slot_end == None else slot_end
+    return (np.arange(slot_start, slot_end, dtype = np.int64) * (4 ** r)) // max(n, 1)
+
+# first vector slot of each cell, cell c holds slots
+# [hilbert_cell_slots(c), hilbert_cell_slots(c + 1))
+
+def hilbert_cell_slots(cells, n, r) :
+    return -(-np.asarray(cells, dtype = np.int64) * n // (4 ** r))
+
+def _cell_sums(v, cells, cell_count) :
+    valid = ~np.isnan(v)
+    sums = np.bincount(cells[valid], weights = v[valid], minlength = cell_count)
+    counts = np.bincount(cells[valid], minlength = cell_count)
+
+    return sums, counts
+
+def hilbert_cell_sums(v, r) :
+    v = np.asarray(v, dtype = np.float64)
+    return _cell_sums(v, hilbert_cells(len(v), r), 4 ** r)
+
+def coarsen_cells(values) :
+    return values.reshape(-1, 4).sum(axis = 1)
+
+# (2**r, 2**r) image of per-cell values in curve order, rows along y
+
+def cells_to_image(values, r) :
+    coords = cached_hilbert_indexes(r)
+    image = np.empty((2 ** r, 2 ** r), dtype = values.dtype)
+    image[coords[:, 1], coords[:, 0]] = values
+
+    return image
+
+def cell_means(sums, counts) :
+    with np.errstate(invalid = 'ignore', divide = 'ignore') :
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+# cells of valid values are non-decreasing, each cell is one run of the
+# vector and its max one reduceat segment
+
+def _cell_max(v, cells, cell_count) :
+    valid = ~np.isnan(v)
+    cells = cells[valid]
+    values = v[valid]
+
+    maxes = np.full(cell_count, np.nan)
+    if len(values) :
+        starts = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1])))
+        maxes[cells[starts]] = np.maximum.reduceat(values, starts)
+
+    return maxes
+
+def hilbert_cell_max(v, r) :
+    v = np.asarray(v, dtype = np.float64)
+    return _cell_max(v, hilbert_cells(len(v), r), 4 ** r)
+
+def coarsen_cell_max(maxes) :
+    return np.fmax.reduce(maxes.reshape(-1, 4), axis = 1)
+
+# binned images of levels r, r - 1, ... r - levels + 1 from one pass over
+# the vector, per-cell mean, max or count of the values, empty cells are
+# nan (0 for count)
+
+HILBERT_STATS = ('mean', 'max', 'count')
+
+# statistic of the values v over cells [0, cell_count), cells must be
+# non-decreasing as they are along a vector
+
+def bin_cells(v, cells, cell_count, stat = 'mean') :
+    if stat not in HILBERT_STATS :
+        raise ValueError('unknown hilbert cell statistic "{0}"'.format(stat))
+
+    v = np.asarray(v, dtype = np.float64)
+    if stat == 'max' :
+        return _cell_max(v, cells, cell_count)
+    sums, counts = _cell_sums(v, cells, cell_count)
+    if stat == 'count' :
+        return counts
+    return cell_means(sums, counts)
+
+def hilbert_pyramid(v, r, levels, stat = 'mean') :
+    if stat not in HILBERT_STATS :
+        raise ValueError('unknown hilbert cell statistic "{0}"'.format(stat))
+
+    levels = min(levels, r + 1)
+    if stat == 'max' :
+        maxes = hilbert_cell_max(v, r)
+    else :
+        sums, counts = hilbert_cell_sums(v, r)
+
+    images = []
+    for k in range(r, r - levels, -1) :
+        if stat == 'max' :
+            values = maxes
+        elif stat == 'count' :
+            values = counts
+        else :
+            values = cell_means(sums, counts)
+        images += [cells_to_image(values, k)]
+
+        if k > 0 and stat == 'max' :
+            maxes = coarsen_cell_max(maxes)
+        elif k > 0 :
+            sums = coarsen_cells(sums)
+            counts = coarsen_cells(counts)
+
+    return images
+
+# exact binning render, a (2**r, 2**r) image of the per-cell statistic in
+# O(n), an alternative to interpolating hilbert_plot points onto a mesh
+
+def hilbert_bin(v, r, stat = 'mean') :
+    return hilbert_pyramid(v, r, 1, stat)[0]
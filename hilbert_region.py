@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import collections
+import numpy as np
+
+import hilbert as hb
+from cg_index import load_cg_index, locate_cg_slots, cg_slot_coordinates
+
+# genomic coordinate <-> pixel lookup
+#
+# slot i of the length n CpG vector is CpG i of the cg index. a binned
+# image (hilbert_bin) puts it in curve cell i * 4**r // n, an interpolated
+# N x N image (hilbert_render) at its hilbert_map point scaled by
+# (N - 1) / 2**r. pixels are (x, y) = (column, row) of the image, -1 where
+# nothing maps. with N = None the binned image is meant.
+
+def slots_to_pixels(slots, n, r, N = None) :
+    slots = np.asarray(slots, dtype = np.int64)
+    valid = (slots >= 0) & (slots < n)
+    x = np.full(len(slots), -1, dtype = np.int64)
+    y = np.full(len(slots), -1, dtype = np.int64)
+
+    if N == None :
+        cells = slots[valid] * (4 ** r) // n
+        x[valid], y[valid] = hb.hilbert_index_to_xy_array(cells, r)
+    else :
+        x[valid], y[valid] = _interp_pixels(n, r, N, slots[valid])
+
+    return x, y
+
+# nearest pixel of the hilbert_map points of slots on the N x N mesh, the
+# mesh spans [0, 2**r] like the render plan
+
+def _interp_pixels(n, r, N, slots = None) :
+    coords = np.asarray(hb.cached_hilbert_map(n, r))
+    if slots is not None :
+        coords = coords[slots]
+    pixels = np.rint(coords * (N - 1) / 2 ** r).astype(np.int64)
+
+    return pixels[:, 0], pixels[:, 1]
+
+# slots of an interpolated image sorted by pixel id y * N + x, the slots
+# of a pixel are one run of it in slot order. only the last (n, r, N)
+# is kept
+
+_pixel_slots = {}
+
+def _interp_pixel_slots(n, r, N) :
+    key = (n, r, N)
+    if key not in _pixel_slots :
+        x, y = _interp_pixels(n, r, N)
+        pixel_ids = y * N + x
+        order = np.argsort(pixel_ids, kind = 'stable')
+        _pixel_slots.clear()
+        _pixel_slots[key] = (pixel_ids[order], order)
+
+    return _pixel_slots[key]
+
+# [slot_start, slot_end) of the CpGs of each pixel. binned pixels hold
+# exactly the slots of their cell. an interpolated pixel spans the first to
+# the last slot slots_to_pixels puts on it, so every slot lies in the range
+# of its own pixel. the curve can leave a pixel and come back, the range
+# then also covers the CpGs drawn in between. pixels no slot is drawn on
+# get an empty range, pixels off the image (-1, -1)
+
+def pixels_to_slots(x, y, n, r, N = None) :
+    x = np.asarray(x, dtype = np.int64)
+    y = np.asarray(y, dtype = np.int64)
+    if N == None :
+        cells = hb.xy_to_hilbert_index_array(x, y, r)
+        valid = cells >= 0
+        slot_start = hb.hilbert_cell_slots(cells, n, r)
+        slot_end = hb.hilbert_cell_slots(cells + 1, n, r)
+    else :
+        valid = (x >= 0) & (x < N) & (y >= 0) & (y < N)
+        sorted_ids, order = _interp_pixel_slots(n, r, N)
+        pixel_ids = y * N + x
+        left = np.searchsorted(sorted_ids, pixel_ids, side = 'left')
+        right = np.searchsorted(sorted_ids, pixel_ids, side = 'right')
+        filled = right > left
+        slot_start = np.where(filled, order[np.minimum(left, n - 1)], 0)
+        slot_end = np.where(filled, order[np.maximum(right - 1, 0)] + 1, 0)
+
+    return np.where(valid, slot_start, -1), np.where(valid, slot_end, -1)
+
+# pixels of genomic positions. a position between CpGs snaps to the next
+# CpG of its chromosome, positions past the last CpG of the chromosome and
+# unknown chromosomes are off the image (-1, -1)
+
+def genome_to_pixels(cg_index, chrnames, positions, r, N = None) :
+    n = len(cg_index.positions)
+    slots = locate_cg_slots(cg_index, chrnames, positions)
+
+    # locate gives cg_start + cg_count past the last CpG, the first slot of
+    # the next chromosome, keep only slots on the chromosome asked for
+
+    chrnames = np.array([name.decode() if isinstance(name, bytes) else str(name) for name in chrnames])
+    inside = (slots >= 0) & (slots < n)
+    slot_chrnames, _ = cg_slot_coordinates(cg_index, slots[inside])
+    inside[inside] = slot_chrnames.astype(str) == chrnames[inside]
+    slots[~inside] = -1
+
+    return slots_to_pixels(slots, n, r, N)
+
+# genomic extent of pixels, the first and last CpG binned into each one,
+# empty pixels have an empty chr and position 0
+
+GENOME_RANGE_DTYPE = np.dtype([('slot_start', '<i8'), ('slot_end', '<i8'),
+    ('chr_start', 'U64'), ('pos_start', '<u8'), ('chr_end', 'U64'), ('pos_end', '<u8')])
+
+def pixels_to_genome(cg_index, x, y, r, N = None) :
+    slot_start, slot_end = pixels_to_slots(x, y, len(cg_index.positions), r, N)
+
+    ranges = np.zeros(len(slot_start), dtype = GENOME_RANGE_DTYPE)
+    ranges['slot_start'] = slot_start
+    ranges['slot_end'] = slot_end
+    filled = slot_end > slot_start
+    if np.any(filled) :
+        ranges['chr_start'][filled], ranges['pos_start'][filled] = cg_slot_coordinates(cg_index, slot_start[filled])
+        ranges['chr_end'][filled], ranges['pos_end'][filled] = cg_slot_coordinates(cg_index, slot_end[filled] - 1)
+
+    return ranges
+
+# region tiles
+#
+# the CpGs of an interval are a contiguous slot range and so a contiguous
+# run of curve cells. the smallest aligned quadrant holding that run is a
+# (2**level, 2**level) square of the full binned image at (x, y), only the
+# slots of that square are binned
+
+RegionTile = collections.namedtuple('RegionTile', ['r', 'level', 'x', 'y', 'slot_start', 'slot_end', 'image'])
+
+def slots_tile(v, slot_start, slot_end, r, stat = 'mean') :
+    n = len(v)
+    if slot_end <= slot_start :
+        raise ValueError('empty slot range [{0}, {1})'.format(slot_start, slot_end))
+
+    cell_first = slot_start * (4 ** r) // n
+    cell_last = (slot_end - 1) * (4 ** r) // n
+    level = 0
+    while (cell_first >> (2 * level)) != (cell_last >> (2 * level)) :
+        level += 1
+
+    cell_start = (cell_first >> (2 * level)) << (2 * level)
+    cell_count = 4 ** level
+    tile_start, tile_end = hb.hilbert_cell_slots([cell_start, cell_start + cell_count], n, r)
+
+    cells = hb.hilbert_cells(n, r, tile_start, tile_end) - cell_start
+    values = hb.bin_cells(v[tile_start : tile_end], cells, cell_count, stat)
+
+    xs, ys = hb.hilbert_index_to_xy_array(np.arange(cell_start, cell_start + cell_count, dtype = np.int64), r)
+    x = int(xs.min())
+    y = int(ys.min())
+    image = np.empty((2 ** level, 2 ** level), dtype = values.dtype)
+    image[ys - y, xs - x] = values
+
+    return RegionTile(r, level, x, y, int(tile_start), int(tile_end), image)
+
+def region_tile(cg_index, v, chrname, start, end, r, stat = 'mean') :
+    slot_start, slot_end = locate_cg_slots(cg_index, [chrname, chrname], [start, end])
+    if slot_start < 0 or slot_end <= slot_start :
+        raise ValueError('no CpG in region {0}:{1}-{2}'.format(chrname, start, end))
+
+    return slots_tile(v, int(slot_start), int(slot_end), r, stat)
+
+# 'chr:start-end' with 1-based positions, end excluded
+
+def parse_region(region) :
+    chrname, sep, interval = region.rpartition(':')
+    start, dash, end = interval.partition('-')
+    if not sep or not dash :
+        raise ValueError('bad region "{0}", expected chr:start-end'.format(region))
+
+    return chrname, int(start.replace(',', '')), int(end.replace(',', ''))
+
+if __name__ == "__main__":
+    from cohort_store import is_cohort_store, open_cohort_store, read_cohort_sample
+    from image_io import save_hilbert_image
+
+    # command line arguments
+
+    parser = argparse.ArgumentParser(description = "Look up genomic coordinates and pixels of CG hilbert maps, render region tiles")
+    parser.add_argument("-d", "--index", dest = "index", required = True,
+        help = "cg index .cgidx folder or legacy .cgidx.npz file", metavar = "FILE")
+    parser.add_argument("-r", "--resolution", dest = "resolution", required = False, type = int, default = 10,
+        help = "hilbert resolution", metavar = "INTEGER")
+    parser.add_argument("-N", "--image-point", dest = "N", required = False, type = int,
+        help = "image points per side of interpolated images, binned images if not given", metavar = "INTEGER")
+    parser.add_argument("-l", "--locate", dest = "locate", required = False, action = 'append',
+        help = "print the pixel of a genomic position (snapped to the next CpG, -1,-1 past the last one), repeatable", metavar = "CHR:POS")
+    parser.add_argument("-x", "--pixel", dest = "pixel", required = False, action = 'append',
+        help = "print the CpG range of a pixel, repeatable", metavar = "X,Y")
+    parser.add_argument("-g", "--region", dest = "region", required = False,
+        help = "render the tile covering a genomic interval", metavar = "CHR:START-END")
+    parser.add_argument("-i", "--input", dest = "input", required = False,
+        help = "sample .cg.meth.npz file or cohort store folder to render the region tile from", metavar = "FILE")
+    parser.add_argument("-f", "--file-id", dest = "file_id", required = False,
+        help = "sample file id in the cohort store", metavar = "ID")
+    parser.add_argument("-R", "--render", dest = "render", required = False, default = 'mean',
+        choices = hb.HILBERT_STATS, help = "per-cell statistic of the region tile")
+    parser.add_argument("-o", "--output", dest = "output", required = False,
+        help = "region tile filename, .png or .npy", metavar = "FILE")
+
+    args = parser.parse_args()
+    filename_index = args.index
+    resolution = args.resolution
+    image_size = args.N
+
+    if not os.path.exists(filename_index) :
+        print("[~] CG index .cgidx file \"{0}\" does not exist!".format(filename_index))
+        exit(-1)
+
+    cg_index = load_cg_index(filename_index)
+
+    for locate in args.locate or [] :
+        chrname, _, pos = locate.rpartition(':')
+        x, y = genome_to_pixels(cg_index, [chrname], [int(pos.replace(',', ''))], resolution, image_size)
+        print('{0}\t{1},{2}'.format(locate, x[0], y[0]))
+
+    for pixel in args.pixel or [] :
+        x, y = pixel.split(',')
+        ranges = pixels_to_genome(cg_index, [int(x)], [int(y)], resolution, image_size)
+        item = ranges[0]
+        print('{0}\t{1}:{2}-{3}:{4}\t{5} CpGs'.format(pixel, item['chr_start'], item['pos_start'],
+            item['chr_end'], item['pos_end'], item['slot_end'] - item['slot_start']))
+
+    if args.region != None :
+        if args.input == None or not os.path.exists(args.input) :
+            print('[~] region tiles need a sample -i input!')
+            exit(-1)
+
+        if is_cohort_store(args.input) :
+            v = read_cohort_sample(open_cohort_store(args.input), args.file_id)
+            if v is None :
+                print('[~] sample "{0}" is not in cohort store "{1}"!'.format(args.file_id, args.input))
+                exit(-1)
+        else :
+            v = np.load(args.input)['meth']
+
+        try :
+            tile = region_tile(cg_index, v, *parse_region(args.region), r = resolution, stat = args.render)
+        except ValueError as e :
+            print('[~] {0}'.format(e))
+            exit(-1)
+
+        print('[*] {0}: level {1} tile at {2},{3} of the {4} x {4} image, CpG slots {5}-{6}'.format(
+            args.region, tile.level, tile.x, tile.y, 2 ** resolution, tile.slot_start, tile.slot_end))
+
+        if args.output != None :
+            zs = tile.image
+            if args.render == 'count' :
+                zs = zs / float(-(-len(v) // 4 ** resolution))
+            save_hilbert_image(args.output, zs, 'npy' if args.output.endswith('.npy') else 'png')
+            print('[*] {0} written'.format(args.output))
@@ -0,0 +1,157 @@
+import os
+import collections
+import numpy as np
+
+import hilbert as hb
+
+# a render plan holds the linear interpolation weights from the n hilbert
+# curve points of a length n vector to the N x N image grid, so rendering
+# a sample is a single sparse mat-vec instead of a griddata call
+#   matrix  : (N * N, n) sparse matrix, row k is image pixel k (row major)
+#   outside : (N * N) bool mask of pixels outside the convex hull (nan)
+
+PLAN_VERSION = 1
+
+RenderPlan = collections.namedtuple('RenderPlan', ['n', 'r', 'N', 'matrix', 'outside'])
+
+# scipy is only imported once a plan is built or loaded, binning renders
+# and image writing never pay for it
+
+def build_render_plan(n, r, N) :
+    import scipy.sparse
+    from scipy.spatial import Delaunay
+
+    points = np.asarray(hb.cached_hilbert_map(n, r), dtype = np.float64)
+
+    # image grid, the same mesh generate_hilbert_map used with griddata,
+    # flattened so that reshape(N, N) gives rows along y
+
+    dmax = 2**r
+    xs, ys = np.mgrid[0:dmax:complex(N), 0:dmax:complex(N)]
+    grid = np.column_stack((xs.T.ravel(), ys.T.ravel()))
+
+    # the triangulation griddata(method = 'linear') would build
+
+    tri = Delaunay(points)
+    simplex = tri.find_simplex(grid)
+    outside = simplex < 0
+    simplex[outside] = 0
+
+    # barycentric weights of each grid point in its triangle
+
+    transform = tri.transform[simplex]
+    b = np.einsum('ijk,ik->ij', transform[:, :2, :], grid - transform[:, 2, :])
+    weights = np.column_stack((b, 1 - b.sum(axis = 1)))
+    weights[outside] = 0
+
+    rows = np.repeat(np.arange(len(grid)), 3)
+    matrix = scipy.sparse.csr_matrix((weights.ravel(), (rows, tri.simplices[simplex].ravel())),
+        shape = (len(grid), n))
+    matrix.eliminate_zeros()
+
+    return RenderPlan(n, r, N, matrix, outside)
+
+def save_render_plan(plan, filename) :
+    np.savez(filename,
+        version = PLAN_VERSION,
+        shape = np.array([plan.n, plan.r, plan.N]),
+        data = plan.matrix.data,
+        indices = plan.matrix.indices,
+        indptr = plan.matrix.indptr,
+        outside = plan.outside)
+
+def load_render_plan(filename) :
+    import scipy.sparse
+
+    plan_file = np.load(filename)
+    if int(plan_file['version']) != PLAN_VERSION :
+        raise ValueError('unsupported render plan version {0} in "{1}"'.format(int(plan_file['version']), filename))
+
+    n, r, N = [int(i) for i in plan_file['shape']]
+    matrix = scipy.sparse.csr_matrix((plan_file['data'], plan_file['indices'], plan_file['indptr']),
+        shape = (N * N, n))
+
+    return RenderPlan(n, r, N, matrix, plan_file['outside'])
+
+# render plans are cached like hilbert maps, in process and, when a
+# hilbert cache folder is set, on disk
+
+_plans = {}
+
+def get_render_plan(n, r, N) :
+    key = (n, r, N)
+    if key in _plans :
+        return _plans[key]
+
+    plan = None
+    filename_plan = None
+    folder_cache = hb.get_cache_dir()
+    if folder_cache != None :
+        filename_plan = os.path.join(folder_cache, 'hilbert.plan.n{0}.r{1}.N{2}.npz'.format(n, r, N))
+        if os.path.isfile(filename_plan) :
+            try :
+                plan = load_render_plan(filename_plan)
+            except (IOError, ValueError, KeyError) :
+                plan = None
+
+    if plan is None :
+        plan = build_render_plan(n, r, N)
+        if filename_plan != None :
+            filename_tmp = '{0}.{1}.tmp.npz'.format(filename_plan, os.getpid())
+            save_render_plan(plan, filename_tmp)
+            os.replace(filename_tmp, filename_plan)
+
+    _plans[key] = plan
+
+    return plan
+
+# render a length n vector to an N x N image (rows along y)
+
+def render_hilbert_map(v, r, N, plan = None) :
+    if plan is None :
+        plan = get_render_plan(len(v), r, N)
+
+    zs = plan.matrix.dot(np.asarray(v, dtype = np.float64))
+    zs[plan.outside] = np.nan
+
+    return zs.reshape(plan.N, plan.N)
+
+# render a (samples x n) matrix to a (samples x N x N) image stack in one
+# sparse mat-mat product
+
+def render_hilbert_maps(V, r, N, plan = None) :
+    V = np.atleast_2d(V)
+    if plan is None :
+        plan = get_render_plan(V.shape[1], r, N)
+
+    zs = plan.matrix.dot(V.T)
+    zs[plan.outside, :] = np.nan
+
+    return zs.T.reshape(V.shape[0], plan.N, plan.N)
+
+# convert rendered images to the stored dtype. uint8 maps beta [0, 1] to
+# [0, 254] and keeps 255 for pixels without data (nan), so a missing pixel
+# never reads as beta 0
+
+UINT8_MISSING = 255
+
+def image_missing_value(dtype) :
+    return np.nan if np.dtype(dtype).kind == 'f' else UINT8_MISSING
+
+def to_image_dtype(zs, dtype) :
+    if np.dtype(dtype) == np.uint8 :
+        missing = np.isnan(zs)
+        images = np.rint(np.clip(np.where(missing, 0, zs), 0, 1) * (UINT8_MISSING - 1)).astype(np.uint8)
+        images[missing] = UINT8_MISSING
+        return images
+
+    return zs.astype(dtype)
+
+# stored images back to float beta values, nan where nothing was drawn
+
+def from_image_dtype(images) :
+    images = np.asarray(images)
+    if images.dtype == np.uint8 :
+        return np.where(images == UINT8_MISSING, np.nan, images / float(UINT8_MISSING - 1)).astype(np.float32)
+
+    return images.astype(np.float32)
@@ -0,0 +1,70 @@
+import struct
+import zlib
+import numpy as np
+
+# hilbert image output without matplotlib
+#
+# values in [0, 1] are drawn with the gray_r colormap, 0 white and 1 black,
+# through a NumPy lookup table and written as a grayscale png with zlib
+#   png   : 8-bit grayscale, the same gray levels plt.imsave(cmap = gray_r,
+#           vmin = 0, vmax = 1) writes
+#   png16 : 16-bit grayscale, (1 - v) * 65535
+#   npy   : the raw float32 values, nan kept
+#   mpl   : plt.imsave rgba png as before, matplotlib is imported on first use
+# nan pixels (outside the curve, empty cells) are white in the png formats
+
+IMAGE_FORMATS = ('png', 'png16', 'npy', 'mpl')
+
+# matplotlib's 256 entry gray_r table, index floor(v * 256) clipped to 255
+
+GRAY_R_LUT = ((1 - np.linspace(0, 1, 256)) * 255).astype(np.uint8)
+
+def image_extension(image_format) :
+    return '.npy' if image_format == 'npy' else '.png'
+
+def gray_r_image(zs, depth = 8) :
+    zs = np.asarray(zs, dtype = np.float64)
+    missing = np.isnan(zs)
+    if depth == 16 :
+        return np.rint((1 - np.clip(np.where(missing, 0, zs), 0, 1)) * 65535).astype(np.uint16)
+
+    index = np.clip(np.where(missing, 0, zs) * 256, 0, 255).astype(np.intp)
+    return GRAY_R_LUT[index]
+
+def _png_chunk(tag, data) :
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+# grayscale png of a 2d uint8 or uint16 array, every row with filter 0
+
+def write_png(filename, gray, compress_level = 6) :
+    gray = np.asarray(gray)
+    if gray.ndim != 2 or gray.dtype not in (np.uint8, np.uint16) :
+        raise ValueError('png images must be 2d uint8 or uint16 arrays, not {0} {1}'.format(gray.ndim, gray.dtype))
+
+    height, width = gray.shape
+    depth = 8 * gray.dtype.itemsize
+    rows = gray.astype('>u{0}'.format(gray.dtype.itemsize)).view(np.uint8).reshape(height, -1)
+    raw = np.zeros((height, rows.shape[1] + 1), dtype = np.uint8)
+    raw[:, 1:] = rows
+
+    with open(filename, 'wb') as png_file :
+        png_file.write(b'\x89PNG\r\n\x1a\n')
+        png_file.write(_png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, depth, 0, 0, 0, 0)))
+        png_file.write(_png_chunk(b'IDAT', zlib.compress(raw.tobytes(), compress_level)))
+        png_file.write(_png_chunk(b'IEND', b''))
+
+def save_hilbert_image(filename, zs, image_format = 'png') :
+    if image_format == 'png' :
+        write_png(filename, gray_r_image(zs, 8))
+    elif image_format == 'png16' :
+        write_png(filename, gray_r_image(zs, 16))
+    elif image_format == 'npy' :
+        np.save(filename, np.asarray(zs, dtype = np.float32))
+    elif image_format == 'mpl' :
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        import matplotlib.cm as cm
+        plt.imsave(filename, zs, cmap = cm.gray_r, vmin = 0, vmax = 1)
+    else :
+        raise ValueError('unknown image format "{0}"'.format(image_format))
@@ -0,0 +1,127 @@
+import os
+import csv
+import numpy as np
+
+# cleaned meta data table, one row per methylation file
+#
+# the csv written by extract_tcga_metadata.py has these 11 columns, the
+# same fields are stored as a typed structured .npy table that all batch
+# scripts load & filter
+
+META_NAMES = ('file_id', 'file_name', 'primary_site', 'disease_type', 'gender', 'age', 'race', 'is_tumor', 'sample_type_id', 'sample_type', 'is_alive')
+
+META_DTYPE = np.dtype(list(zip(META_NAMES,
+	('|S64', '|S128', '|S32', '|S64', 'b1', '<f8', '|S16', 'b1', '<i4', '|S32', 'b1'))))
+
+# value of a missing field by dtype kind
+
+_MISSING = {'S' : b'', 'f' : np.nan, 'b' : False, 'i' : -1}
+
+def _field_value(value, kind) :
+	if value is None :
+		return _MISSING[kind]
+	if isinstance(value, str) :
+		return value.encode()
+	return value
+
+# rows are lists of the 11 fields in csv order, a missing age is nan
+
+def make_meta_table(rows) :
+	kinds = [META_DTYPE[name].kind for name in META_NAMES]
+	return np.array([tuple(_field_value(value, kind) for value, kind in zip(row, kinds)) for row in rows], dtype = META_DTYPE)
+
+def save_meta_table(meta_data, filename_table) :
+	with open(filename_table, 'wb') as table_file :
+		np.save(table_file, meta_data)
+
+# the csv is parsed with the csv module, quoted fields may hold commas
+
+def _parse_field(value, kind) :
+	value = value.strip()
+	if kind == 'S' :
+		return value.encode()
+	if kind == 'b' :
+		return value.lower() in ('true', '1')
+	if value == '' or value.lower() == 'none' :
+		return _MISSING[kind]
+	if kind == 'f' :
+		return float(value)
+	return int(float(value))
+
+def read_meta_csv(filename_meta) :
+	kinds = [META_DTYPE[name].kind for name in META_NAMES]
+	rows = []
+	with open(filename_meta, 'r', newline = '') as meta_file :
+		for fields in csv.reader(meta_file) :
+			if not fields :
+				continue
+			rows += [tuple(_parse_field(value, kind) for value, kind in zip(fields, kinds))]
+
+	return np.array(rows, dtype = META_DTYPE)
+
+# the parsed table is cached next to the csv as <csv>.npy, stamped with the
+# mtime of the csv it was parsed from, and mapped instead of re-parsed as
+# long as the csv keeps that mtime. a .npy meta table is mapped directly
+
+def meta_table_cache_name(filename_meta) :
+	return filename_meta + '.npy'
+
+def load_meta_data(filename_meta, mmap_mode = 'r') :
+	if filename_meta.endswith('.npy') :
+		return np.load(filename_meta, mmap_mode = mmap_mode)
+
+	filename_table = meta_table_cache_name(filename_meta)
+	mtime_ns = os.stat(filename_meta).st_mtime_ns
+	if os.path.isfile(filename_table) and os.stat(filename_table).st_mtime_ns == mtime_ns :
+		meta_data = np.load(filename_table, mmap_mode = mmap_mode)
+		if meta_data.dtype == META_DTYPE :
+			return meta_data
+
+	meta_data = read_meta_csv(filename_meta)
+
+	# a read-only folder just goes without the cache
+
+	filename_tmp = '{0}.{1}.tmp'.format(filename_table, os.getpid())
+	try :
+		save_meta_table(meta_data, filename_tmp)
+		os.utime(filename_tmp, ns = (mtime_ns, mtime_ns))
+		os.replace(filename_tmp, filename_table)
+	except OSError :
+		if os.path.isfile(filename_tmp) :
+			os.unlink(filename_tmp)
+
+	return meta_data
+
+def meta_str(value) :
+	if isinstance(value, bytes) :
+		return value.decode()
+	return value
+
+# filters : {field : value or list of values}, a row is kept when every
+# field matches one of its values
+
+def filter_meta_data(meta_data, filters) :
+	mask = np.ones(len(meta_data), dtype = bool)
+	for name, values in filters.items() :
+		if name not in META_NAMES :
+			raise ValueError('unknown meta field "{0}"'.format(name))
+		if not isinstance(values, (list, tuple)) :
+			values = [values]
+		values = [value.encode() if isinstance(value, str) else value for value in values]
+		mask &= np.isin(meta_data[name], np.array(values, dtype = META_DTYPE[name]))
+
+	return meta_data[mask]
+
+# command line filters 'field=value[,value...]', values typed by the field
+
+def parse_meta_filters(filter_args) :
+	filters = {}
+	for filter_arg in filter_args or [] :
+		name, sep, values = filter_arg.partition('=')
+		name = name.strip()
+		if not sep or name not in META_NAMES :
+			raise ValueError('bad meta filter "{0}", expected field=value[,value...] with field one of {1}'.format(filter_arg, ', '.join(META_NAMES)))
+		kind = META_DTYPE[name].kind
+		filters[name] = filters.get(name, []) + [_parse_field(value, kind) for value in values.split(',')]
+
+	return filters
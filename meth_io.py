@@ -0,0 +1,160 @@
+import itertools
+import numpy as np
+
+# reader for TCGA / GDC methylation beta value .txt files
+#
+# the four used columns (ref, beta, chr, pos) are parsed in bounded-size
+# chunks of lines with the C parser of np.loadtxt, the unknown chr and nan
+# beta filters are applied per chunk so memory stays flat while reading
+
+METH_DTYPE = np.dtype([('ref', '|S12'), ('beta', '<f8'), ('chr', '|S8'), ('pos', '<u8')])
+
+CHUNK_ROWS = 1 << 16
+
+# raw fields are parsed as bytes first, 'NA', empty beta values and '-1'
+# positions of unmapped probes are converted afterwards
+
+_RAW_DTYPE = np.dtype([('ref', '|S12'), ('beta', '|S32'), ('chr', '|S8'), ('pos', '|S24')])
+
+def _parse_beta(beta) :
+	return np.where((beta == b'') | (beta == b'NA') | (beta == b'NaN'), b'nan', beta).astype(np.float64)
+
+def _parse_chunk(lines) :
+	raw = np.loadtxt(lines, delimiter = '\t', usecols = (0, 1, 2, 3), dtype = _RAW_DTYPE,
+		comments = None, encoding = 'latin1', ndmin = 1)
+
+	chunk = np.zeros(len(raw), dtype = METH_DTYPE)
+	chunk['ref'] = raw['ref']
+
+	chunk['beta'] = _parse_beta(raw['beta'])
+
+	chunk['chr'] = raw['chr']
+	pos = raw['pos']
+	pos = np.where((pos == b'') | (pos == b'NA') | (pos == b'*'), b'0', pos).astype(np.int64)
+	chunk['pos'] = np.maximum(pos, 0)
+
+	return chunk
+
+# chunks of non-empty data lines, the header is skipped
+
+def _iter_line_chunks(filename_meth, chunk_rows) :
+	with open(filename_meth, 'r', encoding = 'latin1') as meth_file :
+		next(meth_file, None)
+		while True :
+			lines = list(itertools.islice(meth_file, chunk_rows))
+			if not lines :
+				break
+			lines = [line for line in lines if line.strip()]
+			if lines :
+				yield lines
+
+def iter_meth_data(filename_meth, clean = True, chunk_rows = CHUNK_ROWS) :
+	for lines in _iter_line_chunks(filename_meth, chunk_rows) :
+		chunk = _parse_chunk(lines)
+		if clean :
+			chunk = filter_meth_data(chunk)
+
+		yield chunk
+
+# filter out all unknown chrs & nan beta values
+
+def filter_meth_data(meth_data) :
+	return meth_data[(meth_data['chr'] != b'*') & ~np.isnan(meth_data['beta'])]
+
+def read_meth_data(filename_meth, clean = True, chunk_rows = CHUNK_ROWS) :
+	chunks = list(iter_meth_data(filename_meth, clean, chunk_rows))
+	if not chunks :
+		return np.zeros(0, dtype = METH_DTYPE)
+
+	return np.concatenate(chunks)
+
+# ref & beta columns only, for files of a known platform layout. chr &
+# pos are neither split out nor converted and no row is filtered
+
+_BETA_RAW_DTYPE = np.dtype([('ref', '|S12'), ('beta', '|S32')])
+
+def read_meth_betas(filename_meth, chunk_rows = CHUNK_ROWS) :
+	refs = []
+	betas = []
+	for lines in _iter_line_chunks(filename_meth, chunk_rows) :
+		raw = np.loadtxt(lines, delimiter = '\t', usecols = (0, 1), dtype = _BETA_RAW_DTYPE,
+			comments = None, encoding = 'latin1', ndmin = 1)
+		refs += [raw['ref']]
+		betas += [_parse_beta(raw['beta'])]
+	if not refs :
+		return np.zeros(0, dtype = '|S12'), np.zeros(0, dtype = np.float64)
+
+	return np.concatenate(refs), np.concatenate(betas)
+
+# cleaned methylation data
+#
+# the binary .clean.npz format stores the cleaned rows column by column:
+# ref ids, float32 beta, a chromosome code into a chromosome name table
+# (the smallest unsigned type holding it, uint8 unless there are more
+# than 256 names like unfiltered scaffold contigs) and uint32 positions.
+# the .clean.csv text format stays available for export, the format is
+# chosen by the file extension.
+
+CLEAN_VERSION = 1
+
+def is_clean_csv(filename) :
+	return filename.endswith('.csv')
+
+def write_clean_npz(meth_data, filename_output) :
+	chr_names, chr_code = np.unique(meth_data['chr'], return_inverse = True)
+	chr_code = chr_code.astype(np.min_scalar_type(max(len(chr_names) - 1, 0)))
+	with open(filename_output, 'wb') as output_file :
+		np.savez(output_file,
+			version = CLEAN_VERSION,
+			ref = meth_data['ref'],
+			beta = meth_data['beta'].astype(np.float32),
+			chr_names = chr_names,
+			chr_code = chr_code,
+			pos = meth_data['pos'].astype(np.uint32))
+
+def read_clean_npz(filename_clean) :
+	clean_file = np.load(filename_clean)
+	if int(clean_file['version']) != CLEAN_VERSION :
+		raise ValueError('unsupported cleaned methylation version {0} in "{1}"'.format(int(clean_file['version']), filename_clean))
+
+	meth_data = np.zeros(len(clean_file['ref']), dtype = METH_DTYPE)
+	meth_data['ref'] = clean_file['ref']
+	meth_data['beta'] = clean_file['beta']
+	meth_data['chr'] = clean_file['chr_names'][clean_file['chr_code']]
+	meth_data['pos'] = clean_file['pos']
+
+	return meth_data
+
+def write_clean_csv(meth_data, filename_output) :
+	with open(filename_output, 'w') as output_file :
+		for ref, beta, chrname, pos in zip(meth_data['ref'].astype('U'), meth_data['beta'], meth_data['chr'].astype('U'), meth_data['pos']) :
+			output_file.write('{0}, {1:f}, {2}, {3}\n'.format(ref, beta, chrname, pos))
+
+def read_clean_csv(filename_clean) :
+	raw = np.loadtxt(filename_clean, delimiter = ',', dtype = _RAW_DTYPE, comments = None, encoding = 'latin1', ndmin = 1)
+
+	# older files hold the bytes repr of ref & chr (b'cg00000029')
+
+	def unquote(values) :
+		values = np.char.strip(values)
+		quoted = np.char.startswith(values, b"b'")
+		return np.where(quoted, np.char.strip(np.char.lstrip(values, b'b'), b"'"), values)
+
+	meth_data = np.zeros(len(raw), dtype = METH_DTYPE)
+	meth_data['ref'] = unquote(raw['ref'])
+	meth_data['beta'] = raw['beta'].astype(np.float64)
+	meth_data['chr'] = unquote(raw['chr'])
+	meth_data['pos'] = np.char.strip(raw['pos']).astype(np.uint64)
+
+	return meth_data
+
+def write_clean_meth_data(meth_data, filename_output) :
+	if is_clean_csv(filename_output) :
+		write_clean_csv(meth_data, filename_output)
+	else :
+		write_clean_npz(meth_data, filename_output)
+
+def read_clean_meth_data(filename_clean) :
+	if is_clean_csv(filename_clean) :
+		return read_clean_csv(filename_clean)
+	return read_clean_npz(filename_clean)
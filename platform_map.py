@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import collections
+import numpy as np
+
+from meth_io import read_meth_data, read_meth_betas
+from cg_index import load_cg_index, find_cg_slots
+
+# platform map of a fixed-array methylation platform (450K / EPIC)
+#
+# all files of a platform list the same probes, so the probe -> CpG slot
+# mapping is built once from the first file (or a manifest in the same
+# tab separated ref, beta, chr, pos layout) and every sample afterwards
+# only needs its ref and beta columns. probes are matched by ref alone, the
+# chr & pos of a sample are never read: a map belongs to one manifest
+# build, files annotated against another build (same probes, other
+# coordinates) need a map built from one of them
+#   refs        : probe ids in file order
+#   chrs, pos   : probe locations
+#   slots       : CpG vector slot of each probe, -1 if not on an indexed CpG
+#   cg_count    : CpG vector length of the index the map was built with
+#   order       : argsort of refs, for the lookup of files in another layout
+#   sorted_refs : refs[order]
+# order & sorted_refs are built once when the map is made or loaded, they
+# are not saved
+
+PLATFORM_MAP_VERSION = 1
+
+PlatformMap = collections.namedtuple('PlatformMap', ['refs', 'chrs', 'pos', 'slots', 'cg_count', 'order', 'sorted_refs'])
+
+def make_platform_map(refs, chrs, pos, slots, cg_count) :
+	order = np.argsort(refs, kind = 'stable')
+
+	return PlatformMap(refs, chrs, pos, slots, cg_count, order, refs[order])
+
+def build_platform_map(cg_index, filename_manifest) :
+	manifest = read_meth_data(filename_manifest, clean = False)
+
+	slots = find_cg_slots(cg_index, manifest['chr'], manifest['pos'])
+
+	return make_platform_map(manifest['ref'], manifest['chr'], manifest['pos'], slots, len(cg_index.positions))
+
+def save_platform_map(platform_map, filename_platform) :
+	np.savez(filename_platform,
+		version = PLATFORM_MAP_VERSION,
+		refs = platform_map.refs,
+		chrs = platform_map.chrs,
+		pos = platform_map.pos,
+		slots = platform_map.slots,
+		cg_count = platform_map.cg_count)
+
+def load_platform_map(filename_platform) :
+	platform_file = np.load(filename_platform)
+	if int(platform_file['version']) != PLATFORM_MAP_VERSION :
+		raise ValueError('unsupported platform map version {0} in "{1}"'.format(int(platform_file['version']), filename_platform))
+
+	return make_platform_map(platform_file['refs'], platform_file['chrs'], platform_file['pos'],
+		platform_file['slots'], int(platform_file['cg_count']))
+
+def load_meth_betas(filename_meth) :
+	return read_meth_betas(filename_meth)
+
+# platform rows of the probes of one file, returns the rows (-1 for probes
+# missing from the map) and the number of probes off the platform layout,
+# those whose ref is not the map ref at the same index. the layout is
+# compared by ref only, the locations are taken from the map as the same
+# manifest build is assumed
+
+def find_platform_rows(platform_map, refs) :
+	if len(refs) == len(platform_map.refs) and np.array_equal(refs, platform_map.refs) :
+		return np.arange(len(refs)), 0
+
+	# layout differs, fall back to a lookup by probe id
+
+	rows = np.searchsorted(platform_map.sorted_refs, refs)
+	rows[rows >= len(platform_map.refs)] = 0
+	found = platform_map.sorted_refs[rows] == refs
+	rows = np.where(found, platform_map.order[rows], -1)
+
+	shared = min(len(refs), len(platform_map.refs))
+	off_layout_count = len(refs) - shared + np.count_nonzero(refs[:shared] != platform_map.refs[:shared])
+
+	return rows, int(off_layout_count)
+
+# cleaned (ref, beta, chr, pos) data and CpG vector of one sample
+
+def apply_platform_map(platform_map, rows, betas) :
+	keep = (rows >= 0) & ~np.isnan(betas)
+	rows = rows[keep]
+	betas = betas[keep]
+
+	meth_data = np.zeros(len(rows), dtype = [('ref', '|S12'), ('beta', '<f8'), ('chr', '|S8'), ('pos', '<u8')])
+	meth_data['ref'] = platform_map.refs[rows]
+	meth_data['beta'] = betas
+	meth_data['chr'] = platform_map.chrs[rows]
+	meth_data['pos'] = platform_map.pos[rows]
+	meth_data = meth_data[meth_data['chr'] != b'*']
+
+	cg_meth = np.zeros(platform_map.cg_count, dtype = np.float64)
+	slots = platform_map.slots[rows]
+	matched = slots >= 0
+	cg_meth[slots[matched]] = betas[matched]
+
+	return meth_data, cg_meth
+
+if __name__ == "__main__":
+
+	# command line arguments
+
+	parser = argparse.ArgumentParser(description = "Build a probe to CpG slot platform map")
+	parser.add_argument("-i", "--input", dest = "input", required = True,
+		help = "methylation.txt or manifest listing every probe of the platform", metavar = "FILE")
+	parser.add_argument("-d", "--index", dest = "index", required = True,
+		help = "cg index .cgidx folder or legacy .cgidx.npz file", metavar = "FILE")
+	parser.add_argument("-o", "--output", dest = "output", required = True,
+		help = "output platform map .npz file", metavar = "FILE")
+
+	args = parser.parse_args()
+	filename_input = args.input
+	filename_index = args.index
+	filename_output = args.output
+
+	# parameter check
+
+	if not os.path.isfile(filename_input) :
+		print("[~] manifest file \"{0}\" does not exist!".format(filename_input))
+		exit(-1)
+
+	if not os.path.exists(filename_index) :
+		print("[~] CG index .cgidx file \"{0}\" does not exist!".format(filename_index))
+		exit(-1)
+
+	platform_map = build_platform_map(load_cg_index(filename_index), filename_input)
+	save_platform_map(platform_map, filename_output)
+	print('[*] platform map "{0}" with {1} probes ({2} on CpGs) write complete.'.format(
+		filename_output, len(platform_map.refs), np.count_nonzero(platform_map.slots >= 0)))
@@ -6,29 +6,69 @@ import argparse
 import os
 import shutil
 import numpy as np
-from numpy import genfromtxt
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
 
-def split_methylation_file(filename, output_folder) :
-	methy_data = genfromtxt(filename, delimiter = '\t', skip_header = 1,
-		usecols = (0, 1, 2, 3),
-		dtype = ('S12', '<f8', 'S8', '<u8'), 
-		names = ('ref', 'beta', 'chr', 'pos'))
+from meth_io import read_meth_data, write_clean_meth_data
+from batch_scheduler import run_tasks, report_failures
 
-	# filter out all unknown chrs
+# rows grouped by chr with one stable sort, the original row order is kept
+# inside every group. small chr codes sort as uint8 so numpy takes its
+# radix sort
 
-	methy_data = methy_data[methy_data['chr'] != '*']
+def partition_by_chr(methy_data) :
+	chrs, chr_code = np.unique(methy_data['chr'], return_inverse = True)
+	if len(chrs) <= 256 :
+		chr_code = chr_code.astype(np.uint8)
+	order = np.argsort(chr_code, kind = 'stable')
+	bounds = np.cumsum(np.bincount(chr_code, minlength = len(chrs)))[:-1]
 
-	# filter out all nan beta values
+	return list(zip(chrs, np.split(methy_data[order], bounds)))
 
-	methy_data = methy_data[~np.isnan(methy_data['beta'])]
+def split_methylation_file(filename, output_folder, as_csv = False, n_threads = 1) :
+	# unknown chrs & nan beta values are filtered out while reading
 
-	chrs = np.unique(methy_data['chr'])
-	for chr in chrs:
-		np.savetxt(output_folder + '/' + chr + '.csv', 
-			methy_data[methy_data['chr'] == chr], 
-			fmt=('%s, %f, %s, %ld'),
-			delimiter = ',')
-		print('    {chr}.csv written complete'.format(chr = chr))
+	methy_data = read_meth_data(filename)
+
+	extension = '.csv' if as_csv else '.clean.npz'
+
+	def write_shard(shard) :
+		chr, chr_data = shard
+		chr = chr.decode()
+		write_clean_meth_data(chr_data, os.path.join(output_folder, chr + extension))
+		return chr
+
+	# shard writes are mostly file io, threads overlap them
+
+	shards = partition_by_chr(methy_data)
+	if n_threads > 1 :
+		p = ThreadPool(n_threads)
+		chrs = p.map(write_shard, shards)
+		p.close()
+		p.join()
+	else :
+		chrs = [write_shard(shard) for shard in shards]
+
+	for chr in chrs :
+		print('    {chr}{extension} written complete'.format(chr = chr, extension = extension))
+
+# a whole folder of methylation files, every file split into its own
+# sub folder of the output
+
+def list_methylation_files(folder_input) :
+	filenames = []
+	for folder, _, names in os.walk(folder_input) :
+		for name in sorted(names) :
+			if name.endswith('.txt') :
+				filenames += [os.path.join(folder, name)]
+
+	return sorted(filenames)
+
+def split_methylation_task(filename, output_folder, as_csv) :
+	if not os.path.isdir(output_folder) :
+		os.makedirs(output_folder)
+	print('[*] splitting {0}'.format(filename))
+	split_methylation_file(filename, output_folder, as_csv)
 
 if __name__ == "__main__":
 
@@ -36,17 +76,23 @@ if __name__ == "__main__":
 
 	parser = argparse.ArgumentParser(description = "split methylation data by chr")
 	parser.add_argument("-i", "--input", dest = "input", required = True,
-		help = "methylation.txt with betavalue downloaded from TCGA data repository", metavar = "FILE")
+		help = "methylation.txt with betavalue downloaded from TCGA data repository, or a folder of them", metavar = "FILE")
 	parser.add_argument("-o", "--output", dest = "output", required = True,
 		help = "output foldername", metavar = "FOLDER")
+	parser.add_argument("-p", "--process", dest = "process", required = False, type = int,
+		help = "number of parallel processes", metavar = "INTEGER")
+	parser.add_argument("--csv", dest = "csv", required = False, action = 'store_true',
+		help = "write .csv text shards instead of binary .clean.npz")
 
 	args = parser.parse_args()
 	filename_input = args.input
 	folder_output = args.output
+	n_p = args.process
+	as_csv = args.csv
 
 	# parameter check
 
-	if not os.path.isfile(filename_input) :
+	if not os.path.exists(filename_input) :
 		print("TCGA methylation.text file \"" + filename_input + "\" does not exist!")
 		exit(-1)
 
@@ -54,8 +100,30 @@ if __name__ == "__main__":
 		shutil.rmtree(folder_output, ignore_errors = True)
 	os.makedirs(folder_output)
 
+	if n_p == None :
+		n_p = cpu_count()
+		if n_p <= 0 :
+			n_p = 1
+
 	# read & parse input file
 
-	print('[*] parsing methylation data file ...')
-	split_methylation_file(filename_input, folder_output)
-	print('[*] splite complete')
\ No newline at end of file
+	if os.path.isdir(filename_input) :
+		filenames = list_methylation_files(filename_input)
+		print('[*] splitting {0} methylation data files ...'.format(len(filenames)))
+
+		tasks = []
+		sizes = []
+		for filename in filenames :
+			key = os.path.splitext(os.path.relpath(filename, filename_input))[0]
+			tasks += [(key, (filename, os.path.join(folder_output, key), as_csv, ))]
+			sizes += [os.path.getsize(filename)]
+
+		failures = run_tasks(split_methylation_task, tasks, n_p, sizes = sizes)
+		failure_count = report_failures(failures, len(tasks), folder_output)
+		print('[*] splite complete')
+		if failure_count :
+			exit(1)
+	else :
+		print('[*] parsing methylation data file ...')
+		split_methylation_file(filename_input, folder_output, as_csv, n_p)
+		print('[*] splite complete')
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import os
+import csv
+import numpy as np
+
+# synthetic inputs for benchmarks & smoke runs, no TCGA or hg38 download
+#   fasta           : random reference with a given CpG density, partly
+#                     soft-masked (lower case) like hg38
+#   methylation.txt : 450K-style beta value table of probes on CpGs of a
+#                     cg index, with NA betas and unmapped '*' probes
+#   metadata csv    : the 11 cleaned meta fields of extract_tcga_metadata.py
+# all generators are deterministic for a given seed
+
+BASES = np.frombuffer(b'ACGT', dtype = np.uint8)
+
+FASTA_LINE_WIDTH = 60
+
+# chromosome_sizes : [(chrname, length), ...], cg_density : CpGs per base
+
+def synthetic_sequence(length, cg_density, rng, soft_mask = 0.1) :
+	seq = BASES[rng.integers(0, 4, size = length)]
+
+	# break the random CGs, then place the wanted number of them
+
+	cg = np.flatnonzero((seq[:-1] == ord('C')) & (seq[1:] == ord('G')))
+	seq[cg + 1] = ord('T')
+	if length > 1 :
+		cg = rng.choice(length - 1, size = min(int(length * cg_density), length - 1), replace = False)
+		seq[cg] = ord('C')
+		seq[cg + 1] = ord('G')
+
+	if soft_mask > 0 :
+		masked = rng.random(length) < soft_mask
+		seq[masked] += 32
+
+	return seq
+
+def write_synthetic_fasta(filename_fasta, chromosome_sizes, cg_density = 0.01, seed = 0, write_fai = False) :
+	rng = np.random.default_rng(seed)
+	fasta_index = []
+	with open(filename_fasta, 'wb') as fasta_file :
+		for chrname, length in chromosome_sizes :
+			fasta_file.write('>{0}\n'.format(chrname).encode())
+			offset = fasta_file.tell()
+			seq = synthetic_sequence(length, cg_density, rng)
+
+			# fixed width lines, a newline column appended to every full line
+
+			full = (length // FASTA_LINE_WIDTH) * FASTA_LINE_WIDTH
+			lines = np.empty((length // FASTA_LINE_WIDTH, FASTA_LINE_WIDTH + 1), dtype = np.uint8)
+			lines[:, :FASTA_LINE_WIDTH] = seq[:full].reshape(-1, FASTA_LINE_WIDTH)
+			lines[:, FASTA_LINE_WIDTH] = ord('\n')
+			fasta_file.write(lines.tobytes())
+			if full < length :
+				fasta_file.write(seq[full:].tobytes() + b'\n')
+			fasta_index += [(chrname, length, offset, FASTA_LINE_WIDTH, FASTA_LINE_WIDTH + 1)]
+
+	if write_fai :
+		with open(filename_fasta + '.fai', 'w') as fai_file :
+			for item in fasta_index :
+				fai_file.write('\t'.join(str(field) for field in item) + '\n')
+
+	return filename_fasta
+
+# probes of a 450K-style platform, n_probes CpG slots of the cg index in
+# reference order plus unmapped probes, the same for every sample of a seed
+
+def synthetic_platform(cg_index, n_probes, seed = 0, unmapped = 0.005) :
+	rng = np.random.default_rng(seed)
+	n = len(cg_index.positions)
+	slots = np.sort(rng.choice(n, size = min(n_probes, n), replace = False))
+
+	chromosomes = np.searchsorted(cg_index.chromosomes['cg_start'], slots, side = 'right') - 1
+	chrnames = cg_index.chromosomes['name'][chromosomes].astype('U')
+	positions = cg_index.positions[slots].astype(np.int64)
+
+	off_index = rng.random(len(slots)) < unmapped
+	chrnames[off_index] = '*'
+	positions[off_index] = 0
+
+	refs = np.array(['cg{0:08d}'.format(i) for i in range(len(slots))])
+
+	return refs, chrnames, positions
+
+def write_synthetic_methylation(filename_meth, platform, seed = 0, missing = 0.01) :
+	refs, chrnames, positions = platform
+	rng = np.random.default_rng(seed)
+
+	# bimodal betas like real arrays, mostly near 0 or near 1
+
+	betas = np.where(rng.random(len(refs)) < 0.5, rng.beta(1, 8, len(refs)), rng.beta(8, 1, len(refs)))
+	na = rng.random(len(refs)) < missing
+
+	with open(filename_meth, 'w') as meth_file :
+		meth_file.write('Composite Element REF\tBeta_value\tChromosome\tGenomic_Coordinate\tGene_Symbol\tGene_Type\tTranscript_ID\tPosition_to_TSS\tCGI_Coordinate\tFeature_Type\n')
+		for ref, beta, is_na, chrname, pos in zip(refs, betas, na, chrnames, positions) :
+			meth_file.write('{0}\t{1}\t{2}\t{3}\t.\t.\t.\t.\t.\t.\n'.format(ref, 'NA' if is_na else '{0:.6f}'.format(beta), chrname, pos))
+
+	return filename_meth
+
+PRIMARY_SITES = ('Lung', 'Kidney', 'Breast', 'Brain', 'Colorectal', 'Liver')
+
+def synthetic_meta_rows(n_samples, seed = 0) :
+	rng = np.random.default_rng(seed)
+	rows = []
+	for i in range(n_samples) :
+		sample_type_id = int(rng.choice([1, 1, 1, 11]))
+		rows += [[
+			'{0:08x}-0000-4000-8000-{1:012x}'.format(seed, i),
+			'sample{0:05d}.methylation.txt'.format(i),
+			PRIMARY_SITES[rng.integers(0, len(PRIMARY_SITES))],
+			'Adenomas and Adenocarcinomas',
+			bool(rng.integers(0, 2)),
+			float(rng.integers(20, 90) * 365),
+			'white',
+			sample_type_id < 10,
+			sample_type_id,
+			'Primary Tumor' if sample_type_id < 10 else 'Solid Tissue Normal',
+			bool(rng.integers(0, 2))]]
+
+	return rows
+
+def write_synthetic_metadata(filename_meta, n_samples, seed = 0) :
+	rows = synthetic_meta_rows(n_samples, seed)
+	with open(filename_meta, 'w', newline = '') as meta_file :
+		metadata_writer = csv.writer(meta_file, delimiter = ',')
+		for row in rows :
+			metadata_writer.writerow(row)
+
+	return rows
+
+# a cohort folder laid out like a TCGA download, <file_id>/<file_name>
+# per sample, with the metadata csv describing it
+
+def write_synthetic_cohort(folder_cohort, filename_meta, cg_index, n_samples, n_probes, seed = 0) :
+	rows = write_synthetic_metadata(filename_meta, n_samples, seed)
+	platform = synthetic_platform(cg_index, n_probes, seed)
+	for i, row in enumerate(rows) :
+		folder_sample = os.path.join(folder_cohort, row[0])
+		if not os.path.isdir(folder_sample) :
+			os.makedirs(folder_sample)
+		write_synthetic_methylation(os.path.join(folder_sample, row[1]), platform, seed + 1 + i)
+
+	return rows
+
+def parse_chromosome_sizes(value) :
+	chromosome_sizes = []
+	for item in value.split(',') :
+		chrname, _, length = item.partition(':')
+		chromosome_sizes += [(chrname, int(float(length)))]
+
+	return chromosome_sizes
+
+if __name__ == "__main__":
+	from cg_index import load_cg_index
+
+	# command line arguments
+
+	parser = argparse.ArgumentParser(description = "Generate synthetic reference, methylation & metadata files")
+	parser.add_argument("--fasta", dest = "fasta", required = False,
+		help = "write a synthetic reference fasta", metavar = "FILE")
+	parser.add_argument("--chromosomes", dest = "chromosomes", required = False, default = 'chr1:4e6,chr2:2e6,chrX:1e6',
+		help = "chromosome sizes of the fasta", metavar = "CHR:LEN,...")
+	parser.add_argument("--cg-density", dest = "cg_density", required = False, type = float, default = 0.01,
+		help = "CpGs per base of the fasta", metavar = "FLOAT")
+	parser.add_argument("--fai", dest = "fai", required = False, action = 'store_true',
+		help = "also write a .fai index of the fasta")
+	parser.add_argument("-d", "--index", dest = "index", required = False,
+		help = "cg index the methylation probes are placed on", metavar = "FILE")
+	parser.add_argument("-o", "--output", dest = "output", required = False,
+		help = "write a synthetic cohort into this folder (needs -d)", metavar = "FOLDER")
+	parser.add_argument("-m", "--meta", dest = "meta", required = False,
+		help = "metadata csv filename", metavar = "FILE")
+	parser.add_argument("-n", "--samples", dest = "samples", required = False, type = int, default = 8,
+		help = "number of samples", metavar = "INTEGER")
+	parser.add_argument("--probes", dest = "probes", required = False, type = int, default = 485577,
+		help = "probes per methylation file", metavar = "INTEGER")
+	parser.add_argument("--seed", dest = "seed", required = False, type = int, default = 0,
+		help = "random seed", metavar = "INTEGER")
+
+	args = parser.parse_args()
+
+	if args.fasta != None :
+		write_synthetic_fasta(args.fasta, parse_chromosome_sizes(args.chromosomes), args.cg_density, args.seed, args.fai)
+		print('[*] {0} written'.format(args.fasta))
+
+	if args.output != None :
+		if args.index == None or not os.path.exists(args.index) :
+			print('[~] a synthetic cohort needs an existing -d cg index!')
+			exit(-1)
+		filename_meta = args.meta if args.meta != None else os.path.join(args.output, 'meta.csv')
+		if not os.path.isdir(args.output) :
+			os.makedirs(args.output)
+		write_synthetic_cohort(args.output, filename_meta, load_cg_index(args.index), args.samples, args.probes, args.seed)
+		print('[*] {0} samples written to {1}, metadata {2}'.format(args.samples, args.output, filename_meta))
+	elif args.meta != None :
+		write_synthetic_metadata(args.meta, args.samples, args.seed)
+		print('[*] {0} written'.format(args.meta))
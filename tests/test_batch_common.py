@@ -0,0 +1,40 @@
+import os
+import numpy as np
+
+from meta_data import META_DTYPE
+from batch_manifest import load_manifest, record_output
+from batch_common import stale_samples, meth_input_signature, meth_input_size, sample_folder, process_count
+
+def make_meta_data(file_ids) :
+	meta_data = np.zeros(len(file_ids), dtype = META_DTYPE)
+	meta_data['file_id'] = file_ids
+	meta_data['file_name'] = [file_id + b'.txt' for file_id in file_ids]
+
+	return meta_data
+
+def test_stale_samples(tmp_path) :
+	folder_input = str(tmp_path / 'in')
+	folder_output = str(tmp_path / 'out')
+	meta_data = make_meta_data([b'a', b'b', b'c'])
+	for meta, text in zip(meta_data[:2], ('x' * 10, 'y' * 20)) :
+		folder_meta = sample_folder(folder_input, meta)
+		with open(os.path.join(folder_meta, meta['file_name'].decode()), 'w') as meth_file :
+			meth_file.write(text)
+	os.makedirs(folder_output)
+
+	params = {'index' : 1}
+	input_signature = meth_input_signature(folder_input)
+	rows, sizes = stale_samples(meta_data, {}, params, input_signature, meth_input_size(folder_input))
+	assert [row for row, meta in rows] == [0, 1, 2] and sizes == [10, 20, 0]
+
+	# a sample recorded with the same inputs & params is up to date, one
+	# with other params or without an input file is not
+
+	record_output(folder_output, 'a', input_signature(meta_data[0]), params, [])
+	record_output(folder_output, 'b', input_signature(meta_data[1]), {'index' : 2}, [])
+	rows, sizes = stale_samples(meta_data, load_manifest(folder_output), params, input_signature, meth_input_size(folder_input))
+	assert [row for row, meta in rows] == [1, 2] and sizes == [20, 0]
+
+def test_process_count() :
+	assert process_count(3) == 3
+	assert process_count(None) >= 1
@@ -0,0 +1,57 @@
+import os
+import json
+
+from batch_manifest import MANIFEST_NAME, file_signature, load_manifest, is_up_to_date, record_output, compact_manifest
+
+def write(filename, text) :
+	with open(filename, 'w') as output_file :
+		output_file.write(text)
+
+def test_manifest_staleness(tmp_path) :
+	folder = str(tmp_path)
+	filename_input = os.path.join(folder, 'in.txt')
+	filename_output = os.path.join(folder, 'out.png')
+	write(filename_input, 'abc')
+	write(filename_output, 'png')
+	params = {'resolution' : 10, 'N' : 300}
+
+	inputs = {'meth' : file_signature(filename_input)}
+	assert not is_up_to_date(load_manifest(folder).get('s1'), inputs, params)
+
+	record_output(folder, 's1', inputs, params, [filename_output])
+	record = load_manifest(folder)['s1']
+	assert is_up_to_date(record, inputs, params)
+
+	# other parameters, a changed input or a missing output make it stale
+
+	assert not is_up_to_date(record, inputs, {'resolution' : 9, 'N' : 300})
+	write(filename_input, 'abcd')
+	assert not is_up_to_date(record, {'meth' : file_signature(filename_input)}, params)
+	os.unlink(filename_output)
+	assert not is_up_to_date(record, inputs, params)
+
+def test_manifest_last_record_wins_and_cut_lines_are_skipped(tmp_path) :
+	folder = str(tmp_path)
+	record_output(folder, 's1', {'meth' : [1, 1]}, {}, [])
+	record_output(folder, 's2', {'meth' : [2, 2]}, {}, [])
+	record_output(folder, 's1', {'meth' : [3, 3]}, {}, [])
+	with open(os.path.join(folder, MANIFEST_NAME), 'a') as manifest_file :
+		manifest_file.write('{"key" : "s3", "inp')
+
+	manifest = load_manifest(folder)
+	assert sorted(manifest) == ['s1', 's2']
+	assert manifest['s1']['inputs'] == {'meth' : [3, 3]}
+
+	compact_manifest(folder)
+	with open(os.path.join(folder, MANIFEST_NAME), 'r') as manifest_file :
+		lines = [json.loads(line) for line in manifest_file]
+	assert [record['key'] for record in lines] == ['s1', 's2']
+	assert load_manifest(folder) == manifest
+
+def test_folder_signature_follows_its_files(tmp_path) :
+	folder = str(tmp_path / 'store')
+	os.makedirs(folder)
+	write(os.path.join(folder, 'a.npy'), 'a')
+	signature = file_signature(folder)
+	write(os.path.join(folder, 'b.npy'), 'b')
+	assert file_signature(folder) != signature
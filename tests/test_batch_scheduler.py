@@ -0,0 +1,43 @@
+import os
+import signal
+
+from batch_scheduler import run_tasks, report_failures, FAILURES_NAME
+
+def task(key, order_file) :
+	with open(order_file, 'a') as log_file :
+		log_file.write(key + '\n')
+	if key == 'raise' :
+		raise IOError('cannot read input')
+	if key == 'report' :
+		return [(key, 'bad rows')]
+	if key == 'kill' :
+		os.kill(os.getpid(), signal.SIGKILL)
+	return None
+
+def test_failures_are_collected_largest_first(tmp_path) :
+	order_file = str(tmp_path / 'order.txt')
+	keys = ['small', 'raise', 'report', 'big']
+	tasks = [(key, (key, order_file)) for key in keys]
+	failures = run_tasks(task, tasks, 1, sizes = [1, 3, 2, 4])
+
+	with open(order_file) as log_file :
+		assert log_file.read().split() == ['big', 'raise', 'report', 'small']
+	reasons = dict(failures)
+	assert sorted(reasons) == ['raise', 'report']
+	assert reasons['raise'].startswith('OSError: cannot read input')
+	assert reasons['report'] == 'bad rows'
+
+	assert report_failures(failures, len(tasks), str(tmp_path)) == 2
+	assert os.path.isfile(str(tmp_path / FAILURES_NAME))
+	assert report_failures([], len(tasks), str(tmp_path)) == 0
+	assert not os.path.isfile(str(tmp_path / FAILURES_NAME))
+
+def test_killed_worker_fails_its_task(tmp_path) :
+	order_file = str(tmp_path / 'order.txt')
+	keys = ['a', 'kill', 'b', 'c', 'd']
+	failures = run_tasks(task, [(key, (key, order_file)) for key in keys], 2)
+
+	assert [key for key, reason in failures] == ['kill']
+	assert 'died' in failures[0][1]
+	with open(order_file) as log_file :
+		assert sorted(log_file.read().split()) == sorted(keys)
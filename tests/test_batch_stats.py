@@ -0,0 +1,43 @@
+import os
+import numpy as np
+
+import batch_meth_data as bmd
+from cg_index import make_cg_index, generate_cg_meth
+from meth_io import read_meth_data
+from batch_stats import new_stats, timed, add_read, record_stats, load_stats, STATS_NAME
+
+def test_stages_add_up_and_none_times_nothing(tmp_path) :
+	stats = new_stats('a')
+	for i in range(3) :
+		with timed(stats, 'parse') :
+			pass
+	with timed(None, 'parse') :
+		pass
+	add_read(stats, 10)
+	add_read(None, 10)
+	assert list(stats['stages']) == ['parse'] and stats['bytes_read'] == 10
+
+	record_stats(str(tmp_path), stats)
+	with open(str(tmp_path / STATS_NAME), 'a') as stats_file :
+		stats_file.write('{"key" : "cut')
+	records = load_stats(str(tmp_path))
+	assert [record['key'] for record in records] == ['a']
+	assert records[0]['peak_rss'] > 0 and records[0]['total'] == stats['stages']['parse']
+
+def test_sample_data_stages(tmp_path) :
+	filename_meth = str(tmp_path / 'meth.txt')
+	with open(filename_meth, 'w') as meth_file :
+		meth_file.write('Composite Element REF\tBeta_value\tChromosome\tStart\n')
+		meth_file.write('cg1\t0.5\tchr1\t10\ncg2\tNA\tchr1\t20\ncg3\t0.25\t*\t0\ncg4\t0.75\tchr1\t30\n')
+	cg_index = make_cg_index([('chr1', 0, 100, np.array([10, 20, 30]))])
+	bmd.set_worker_state(cg_index, None)
+	try :
+		stats = new_stats('meth')
+		meth_data, cg_meth = bmd.generate_sample_data(filename_meth, stats)
+	finally :
+		bmd.set_worker_state(None, None)
+
+	assert sorted(stats['stages']) == ['filter', 'map', 'parse']
+	assert stats['bytes_read'] == os.path.getsize(filename_meth)
+	assert np.array_equal(meth_data, read_meth_data(filename_meth))
+	assert cg_meth.tolist() == generate_cg_meth(cg_index, meth_data).tolist() == [0.5, 0.0, 0.75]
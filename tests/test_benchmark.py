@@ -0,0 +1,29 @@
+import os
+import signal
+import pytest
+
+from benchmark import run_stage, stage_record, StageError
+
+def count_stage(count) :
+	return {'items' : count}
+
+def failing_stage() :
+	raise ValueError('bad input')
+
+def killed_stage() :
+	os.kill(os.getpid(), signal.SIGKILL)
+
+def test_stage_counts_and_rates() :
+	record = stage_record('count', {'n' : 5}, run_stage(count_stage, (5, ), repeat = 2))
+	assert record['items'] == 5 and record['peak_rss'] > 0
+	assert record['items_per_s'] == None or record['items_per_s'] > 0
+
+def test_stage_exception_fails_the_stage() :
+	with pytest.raises(StageError) as e :
+		run_stage(failing_stage, ())
+	assert 'ValueError: bad input' in str(e.value) and e.value.exitcode == None
+
+def test_dead_stage_process_fails_the_stage() :
+	with pytest.raises(StageError) as e :
+		run_stage(killed_stage, ())
+	assert e.value.exitcode == -signal.SIGKILL
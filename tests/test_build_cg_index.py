@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from build_cg_index import read_fasta, find_cg_indexes, build_cg_index, scan_fasta_records, find_cg_indexes_range
+from cg_index import load_cg_index, cg_index_to_dict
+
+RECORDS = [('chr1', 'ACGTTcgAAcG' * 7), ('chr2', 'cccgggCG'), ('chrM', ''), ('chrUn_x', 'NNNNCGNN' * 20)]
+
+# fasta text with line width 10, descriptions after the record names
+
+def fasta_text(records, newline = '\n') :
+	lines = []
+	for chrname, seq in records :
+		lines += ['>{0} AC:CM000663.2 LN:{1} rl:Chromosome'.format(chrname, len(seq))]
+		lines += [seq[i : i + 10] for i in range(0, len(seq), 10)]
+
+	return newline.join(lines) + newline
+
+def brute_force_cg_positions(seq) :
+	seq = seq.upper()
+	return [i + 1 for i in range(len(seq) - 1) if seq[i : i + 2] == 'CG']
+
+def write_fasta(tmp_path, newline = '\n') :
+	filename_fasta = str(tmp_path / 'ref.fa')
+	with open(filename_fasta, 'w', newline = '') as fasta_file :
+		fasta_file.write(fasta_text(RECORDS, newline))
+
+	return filename_fasta
+
+@pytest.mark.parametrize('newline', ['\n', '\r\n'])
+def test_read_fasta_names_and_sequences(tmp_path, newline) :
+	records = list(read_fasta(write_fasta(tmp_path, newline)))
+	assert [chrname for chrname, seq in records] == [chrname for chrname, seq in RECORDS]
+	for (chrname, seq), (_, expected) in zip(records, RECORDS) :
+		assert seq.tobytes() == expected.upper().encode()
+		assert find_cg_indexes(seq).tolist() == brute_force_cg_positions(expected)
+
+def test_build_cg_index(tmp_path) :
+	folder_index = build_cg_index(write_fasta(tmp_path), str(tmp_path / 'ref.cgidx'), 1)
+	dict_cg_indexes = cg_index_to_dict(load_cg_index(folder_index))
+
+	offset = 0
+	for chrname, seq in RECORDS :
+		assert dict_cg_indexes[chrname][:2] == [offset, len(seq)]
+		assert dict_cg_indexes[chrname][2].tolist() == brute_force_cg_positions(seq)
+		offset += len(seq)
+
+# samtools faidx of fasta_text, names are the first word of the header
+
+def write_fai(filename_fasta) :
+	with open(filename_fasta, 'rb') as fasta_file :
+		text = fasta_file.read()
+	with open(filename_fasta + '.fai', 'w') as fai_file :
+		for chrname, seq in RECORDS :
+			offset = text.index(b'\n', text.index(('>' + chrname + ' ').encode())) + 1
+			fai_file.write('{0}\t{1}\t{2}\t10\t11\n'.format(chrname, len(seq), offset))
+
+def test_fai_and_streamed_indexes_are_the_same(tmp_path) :
+	filename_fasta = write_fasta(tmp_path)
+	streamed = load_cg_index(build_cg_index(filename_fasta, str(tmp_path / 'streamed.cgidx'), 1))
+	write_fai(filename_fasta)
+	indexed = load_cg_index(build_cg_index(filename_fasta, str(tmp_path / 'indexed.cgidx'), 1))
+
+	assert np.array_equal(streamed.chromosomes, indexed.chromosomes)
+	assert np.array_equal(streamed.positions, indexed.positions)
+
+# pool workers read their own record, by byte range without a .fai
+
+@pytest.mark.parametrize('with_fai', [False, True])
+def test_pool_build_matches_sequential_build(tmp_path, with_fai) :
+	filename_fasta = write_fasta(tmp_path)
+	if with_fai :
+		write_fai(filename_fasta)
+	sequential = load_cg_index(build_cg_index(filename_fasta, str(tmp_path / 'sequential.cgidx'), 1))
+	pooled = load_cg_index(build_cg_index(filename_fasta, str(tmp_path / 'pooled.cgidx'), 3))
+
+	assert np.array_equal(sequential.chromosomes, pooled.chromosomes)
+	assert np.array_equal(sequential.positions, pooled.positions)
+
+@pytest.mark.parametrize('text', [b'', b'ACGT\n', b'>a', b'>a\nACG\n>b\n>c x\ncg\ncg', b'junk\n>a d\nAC\nGT\n\n>b\nCCGG\n'])
+def test_scanned_records_match_the_stream(tmp_path, text) :
+	filename_fasta = str(tmp_path / 'ref.fa')
+	with open(filename_fasta, 'wb') as fasta_file :
+		fasta_file.write(text)
+
+	scanned = [(chrname, ) + find_cg_indexes_range(filename_fasta, seq_start, seq_end)
+		for chrname, seq_start, seq_end in scan_fasta_records(filename_fasta)]
+	streamed = list(read_fasta(filename_fasta))
+	assert [item[:2] for item in scanned] == [(chrname, len(seq)) for chrname, seq in streamed]
+	for item, (chrname, seq) in zip(scanned, streamed) :
+		assert np.array_equal(item[2], find_cg_indexes(seq))
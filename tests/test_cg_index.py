@@ -0,0 +1,97 @@
+import os
+import collections
+import numpy as np
+import pytest
+
+from cg_index import make_cg_index, save_cg_index, load_cg_index, convert_cg_index, cg_index_to_dict
+from cg_index import find_cg_slots, generate_cg_meth
+
+def random_index(rng, chromosome_sizes = (('chr1', 5000), ('chr2', 3000), ('chrX', 2000))) :
+	list_cg_indexes = []
+	offset = 0
+	for chrname, length in chromosome_sizes :
+		positions = np.sort(rng.choice(np.arange(1, length), size = length // 20, replace = False))
+		list_cg_indexes += [(chrname, offset, length, positions)]
+		offset += length
+
+	return list_cg_indexes
+
+def write_legacy_index(filename, list_cg_indexes) :
+	dict_cg_indexes = collections.OrderedDict()
+	for chrname, offset, length, positions in list_cg_indexes :
+		dict_cg_indexes[chrname] = [offset, length, positions]
+	np.savez(filename, indexes = dict_cg_indexes)
+
+def test_cg_index_folder_round_trip(tmp_path) :
+	list_cg_indexes = random_index(np.random.default_rng(0))
+	cg_index = make_cg_index(list_cg_indexes)
+	folder_index = save_cg_index(cg_index, str(tmp_path / 'ref.cgidx'))
+
+	loaded = load_cg_index(folder_index)
+	assert isinstance(loaded.positions, np.memmap)
+	assert np.array_equal(loaded.chromosomes, cg_index.chromosomes)
+	assert np.array_equal(loaded.positions, cg_index.positions)
+	for (chrname, offset, length, positions), (name, item) in zip(list_cg_indexes, cg_index_to_dict(loaded).items()) :
+		assert name == chrname
+		assert item[:2] == [offset, length]
+		assert np.array_equal(item[2], positions)
+
+def test_legacy_index_conversion(tmp_path) :
+	list_cg_indexes = random_index(np.random.default_rng(1))
+	filename_legacy = str(tmp_path / 'ref.cgidx.npz')
+	write_legacy_index(filename_legacy, list_cg_indexes)
+
+	folder_index = convert_cg_index(filename_legacy, None)
+	assert folder_index == str(tmp_path / 'ref.cgidx')
+	converted = load_cg_index(folder_index)
+	legacy = load_cg_index(filename_legacy)
+	assert np.array_equal(converted.chromosomes, legacy.chromosomes)
+	assert np.array_equal(converted.positions, legacy.positions)
+	assert np.array_equal(converted.positions, np.concatenate([item[3] for item in list_cg_indexes]))
+
+def test_folder_without_version_is_not_an_index(tmp_path) :
+	os.makedirs(str(tmp_path / 'empty'))
+	with pytest.raises(ValueError) :
+		load_cg_index(str(tmp_path / 'empty'))
+
+# the per-chromosome dense array join the cg data was built with before
+# the sorted position join
+
+def dict_join_cg_meth(list_cg_indexes, meth_data) :
+	cg_meth = np.array([], dtype = '<f8')
+	for chrname, offset, length, positions in list_cg_indexes :
+		meth = np.zeros(length)
+		chr_meth_data = meth_data[meth_data['chr'] == chrname.encode()]
+		meth[chr_meth_data['pos'] - 1] = chr_meth_data['beta']
+		cg_meth = np.append(cg_meth, meth[positions - 1])
+
+	return cg_meth
+
+def random_meth_data(rng, list_cg_indexes, count) :
+	probes = []
+	for chrname, offset, length, positions in list_cg_indexes :
+		on_cg = rng.choice(positions, size = len(positions) // 2, replace = False)
+		off_cg = np.setdiff1d(rng.choice(np.arange(1, length), size = 50, replace = False), positions)
+		for pos in np.concatenate((on_cg, off_cg)) :
+			probes += [(chrname, pos)]
+	probes += [('chrUn', 10), ('chrUn', 20)]
+
+	order = rng.permutation(len(probes))[:count]
+	meth_data = np.zeros(len(order), dtype = [('ref', '|S12'), ('beta', '<f8'), ('chr', '|S8'), ('pos', '<u8')])
+	meth_data['chr'] = [probes[i][0] for i in order]
+	meth_data['pos'] = [probes[i][1] for i in order]
+	meth_data['beta'] = rng.random(len(order))
+
+	return meth_data
+
+def test_searchsorted_join_matches_dict_join() :
+	rng = np.random.default_rng(2)
+	list_cg_indexes = random_index(rng)
+	cg_index = make_cg_index(list_cg_indexes)
+	meth_data = random_meth_data(rng, list_cg_indexes, 400)
+
+	assert np.array_equal(generate_cg_meth(cg_index, meth_data), dict_join_cg_meth(list_cg_indexes, meth_data))
+
+def test_find_cg_slots() :
+	cg_index = make_cg_index([('chr1', 0, 100, np.array([10, 20, 30])), ('chr2', 100, 50, np.array([5, 7]))])
+	assert find_cg_slots(cg_index, ['chr1', 'chr1', 'chr2', 'chr3', 'chr2'], [20, 21, 7, 7, 5]).tolist() == [1, -1, 4, -1, 3]
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from cohort_store import create_cohort_store, open_cohort_store, cohort_store_matches, is_cohort_store
+from cohort_store import write_cohort_row, read_cohort_sample
+
+def test_cohort_store_round_trip(tmp_path) :
+	folder_store = str(tmp_path / 'cohort')
+	file_ids = [b'id0', b'id1', b'id2']
+	create_cohort_store(folder_store, file_ids, [b'a.txt', b'b.txt', b'c.txt'], 50)
+	assert is_cohort_store(folder_store)
+
+	rng = np.random.default_rng(0)
+	rows = {0 : rng.random(50), 2 : rng.random(50)}
+	for row, cg_meth in rows.items() :
+		assert write_cohort_row(folder_store, row, cg_meth) == 50 * 4
+
+	store = open_cohort_store(folder_store)
+	assert store.file_ids == ['id0', 'id1', 'id2'] and store.file_names == ['a.txt', 'b.txt', 'c.txt']
+	assert np.allclose(read_cohort_sample(store, b'id0'), rows[0].astype(np.float32))
+	assert np.allclose(read_cohort_sample(store, 'id2', 10, 20), rows[2][10:20].astype(np.float32))
+
+	# rows not written yet & samples not in the store
+
+	assert read_cohort_sample(store, 'id1') is None
+	assert read_cohort_sample(store, 'id9') is None
+
+def test_cohort_store_reuse(tmp_path) :
+	folder_store = str(tmp_path / 'cohort')
+	assert not cohort_store_matches(folder_store, ['id0'], 10)
+	create_cohort_store(folder_store, ['id0', 'id1'], ['a', 'b'], 10)
+	assert cohort_store_matches(folder_store, [b'id0', b'id1'], 10)
+	assert not cohort_store_matches(folder_store, ['id0', 'id1'], 11)
+	assert not cohort_store_matches(folder_store, ['id1', 'id0'], 10)
+
+def test_recreated_store_is_written_through_new_maps(tmp_path) :
+	folder_store = str(tmp_path / 'cohort')
+	create_cohort_store(folder_store, ['id0'], ['a'], 10)
+	write_cohort_row(folder_store, 0, np.full(10, 0.5))
+
+	create_cohort_store(folder_store, ['id0', 'id1'], ['a', 'b'], 20)
+	write_cohort_row(folder_store, 1, np.full(20, 0.25))
+	store = open_cohort_store(folder_store)
+	assert read_cohort_sample(store, 'id0') is None
+	assert np.all(read_cohort_sample(store, 'id1') == 0.25)
+
+def test_row_width_is_checked(tmp_path) :
+	folder_store = str(tmp_path / 'cohort')
+	create_cohort_store(folder_store, ['id0'], ['a'], 10)
+	with pytest.raises(ValueError) :
+		write_cohort_row(folder_store, 0, np.zeros(11))
@@ -0,0 +1,44 @@
+import io
+import json
+import pytest
+
+from extract_tcga_metadata import iter_json_array, extract_tcga_metadata
+
+def metadata_item(i) :
+	return {
+		'file_id' : 'id{0}'.format(i),
+		'file_name' : 'file {0} "quoted" ]}}, [{{.txt'.format(i),
+		'cases' : [{
+			'primary_site' : 'Lung',
+			'disease_type' : 'Adenomas and Adenocarcinomas',
+			'demographic' : {'gender' : 'male' if i % 2 else 'female', 'race' : 'white'},
+			'diagnoses' : [{'age_at_diagnosis' : 20000 + i}],
+			'samples' : [{'sample_type_id' : '01' if i % 3 else '11', 'sample_type' : 'Primary Tumor', 'state' : 'live'}]}]}
+
+ITEMS = [metadata_item(i) for i in range(20)] + [{'file_id' : 'big', 'file_name' : 'x' * 5000}]
+
+# every read size cuts items at a different place of the buffer, one
+# character reads cut every item and every separator
+
+@pytest.mark.parametrize('read_size', [1, 2, 7, 64, 333, 1 << 16])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_items_cut_at_the_buffer_edge(read_size, indent) :
+	text = '\n  ' + json.dumps(ITEMS, indent = indent) + '\n'
+	assert list(iter_json_array(io.StringIO(text), read_size)) == ITEMS
+
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '\n[\n]\n'])
+def test_empty_array(text) :
+	assert list(iter_json_array(io.StringIO(text), 1)) == []
+
+@pytest.mark.parametrize('text', ['{"file_id" : "a"}', '', '[{"file_id" : "a"}, {"file_id" : ', '[{"file_id" : "a"}'])
+def test_not_an_array_or_truncated(text) :
+	with pytest.raises(ValueError) :
+		list(iter_json_array(io.StringIO(text), 4))
+
+def test_rows_and_skipped_items() :
+	table_rows = []
+	total_count, success_count, skipped = extract_tcga_metadata(iter_json_array(io.StringIO(json.dumps(ITEMS)), 50), table_rows = table_rows)
+	assert (total_count, success_count) == (21, 20)
+	assert skipped == {'cases info missing' : 1}
+	assert table_rows[1][:2] == ['id1', ITEMS[1]['file_name']]
+	assert table_rows[0][7] == False and table_rows[1][7] == True
@@ -0,0 +1,206 @@
+import os
+import math
+import numpy as np
+import pytest
+
+import hilbert as hb
+
+# scalar transforms as they were before vectorization, the reference
+
+def scalar_hilbert_index_to_xy(z, r) :
+    if r <= 0 :
+        return -1, -1
+
+    positions = ([0, 0], [0, 1], [1, 1], [1, 0])
+    quadrant = z & 0x03
+    z >>= 2
+    rmin = 1
+    w = 2
+    x, y = positions[quadrant]
+    while z > 0 :
+        quadrant = z & 0x03
+        if quadrant == 0 :
+            x, y = y, x
+        elif quadrant == 1 :
+            x, y = x, y + w
+        elif quadrant == 2 :
+            x, y = x + w, y + w
+        elif quadrant == 3 :
+            x, y = w * 2 - y - 1, w - x - 1
+        z >>= 2
+        rmin += 1
+        w <<= 1
+
+    if (rmin ^ r) & 0x01 :
+        x, y = y, x
+
+    return x, y
+
+def scalar_xy_to_hilbert_index(x, y, r) :
+    quadrants = [0, 1, 3, 2]
+    rmin = int(math.floor(math.log(max(x, y), 2))) + 1
+    if r < rmin :
+        return -1
+    if (rmin ^ r) & 0x01 :
+        x, y = y, x
+
+    w = 1 << (rmin - 1)
+    z = 0
+    while rmin > 0 :
+        quadrant = quadrants[(int(x / w) << 1) | int(y / w)]
+        if quadrant == 0 :
+            x, y = y, x
+        elif quadrant == 1 :
+            x, y = x, y - w
+        elif quadrant == 2 :
+            x, y = x - w, y - w
+        elif quadrant == 3 :
+            x, y = w - y - 1, w * 2 - x - 1
+        w >>= 1
+        z <<= 2
+        z |= quadrant
+        rmin -= 1
+
+    return z
+
+def scalar_hilbert_map(n, r) :
+    coordinates = [scalar_hilbert_index_to_xy(i, r) for i in range(4 ** r)]
+    coords = []
+    for i in range(n) :
+        x = i * 1.0 * (4 ** r - 1) / (n - 1)
+        start, end = int(math.floor(x)), int(math.ceil(x))
+        x1, y1 = coordinates[start]
+        x2, y2 = coordinates[end]
+        coords += [(x1 + (x2 - x1) * (x - start), y1 + (y2 - y1) * (x - start))]
+
+    return np.array(coords)
+
+@pytest.mark.parametrize('r', range(1, 7))
+def test_index_to_xy_matches_scalar(r) :
+    z = np.arange(4 ** r)
+    x, y = hb.hilbert_index_to_xy_array(z, r)
+    expected = np.array([scalar_hilbert_index_to_xy(int(i), r) for i in z])
+    assert np.array_equal(x, expected[:, 0])
+    assert np.array_equal(y, expected[:, 1])
+    assert hb.hilbert_index_to_xy(int(z[-1]), r) == tuple(expected[-1])
+
+@pytest.mark.parametrize('r', range(1, 7))
+def test_xy_to_index_matches_scalar(r) :
+    y, x = np.mgrid[0:2 ** r, 0:2 ** r]
+    z = hb.xy_to_hilbert_index_array(x.ravel(), y.ravel(), r)
+    for i, j, k in zip(x.ravel(), y.ravel(), z) :
+        if i or j :
+            assert k == scalar_xy_to_hilbert_index(int(i), int(j), r)
+    assert z[0] == 0
+
+def test_xy_to_index_inverts_index_to_xy() :
+    r = 7
+    z = np.arange(4 ** r)
+    assert np.array_equal(hb.xy_to_hilbert_index_array(*hb.hilbert_index_to_xy_array(z, r), r), z)
+
+def test_xy_outside_the_square_is_minus_one() :
+    assert list(hb.xy_to_hilbert_index_array([-1, 4, 0, 3], [0, 0, 4, 3], 2)) == [-1, -1, -1, 10]
+
+@pytest.mark.parametrize('n, r', [(2, 1), (50, 2), (1000, 3), (77, 4)])
+def test_hilbert_map_matches_scalar(n, r) :
+    assert np.allclose(hb.hilbert_map(n, r), scalar_hilbert_map(n, r))
+
+# cache
+
+def test_cached_map_is_kept_in_process() :
+    hb.clear_cache()
+    first = hb.cached_hilbert_map(300, 3)
+    assert hb.cached_hilbert_map(300, 3) is first
+    assert not first.flags.writeable
+    assert np.allclose(first, hb.hilbert_map(300, 3))
+
+def test_cache_lru_evicts_oldest() :
+    hb.clear_cache()
+    first = hb.cached_hilbert_map(100, 2)
+    for n in range(101, 101 + hb.CACHE_SIZE) :
+        hb.cached_hilbert_map(n, 2)
+    assert hb.cached_hilbert_map(100, 2) is not first
+
+def test_cache_folder_round_trip(tmp_path) :
+    folder_cache = str(tmp_path / 'cache')
+    previous = hb.get_cache_dir()
+    hb.set_cache_dir(folder_cache)
+    try :
+        hb.clear_cache()
+        built = np.array(hb.cached_hilbert_map(500, 3))
+        assert os.path.isfile(os.path.join(folder_cache, 'hilbert.map.n500.r3.npy'))
+        hb.clear_cache()
+        loaded = hb.cached_hilbert_map(500, 3)
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(loaded, built)
+        assert np.array_equal(hb.cached_hilbert_indexes(3), hb.hilbert_indexes(3))
+        assert not [name for name in os.listdir(folder_cache) if 'tmp' in name]
+    finally :
+        hb.set_cache_dir(previous)
+        hb.clear_cache()
+
+# binning
+
+def brute_force_bin(v, r, stat = 'mean') :
+    n = len(v)
+    image = np.full((2 ** r, 2 ** r), np.nan if stat != 'count' else 0.0)
+    cells = np.arange(n) * 4 ** r // n
+    for cell in range(4 ** r) :
+        values = v[(cells == cell) & ~np.isnan(v)]
+        x, y = scalar_hilbert_index_to_xy(cell, r)
+        if stat == 'count' :
+            image[y, x] = len(values)
+        elif len(values) :
+            image[y, x] = values.mean() if stat == 'mean' else values.max()
+
+    return image
+
+@pytest.mark.parametrize('n', [5, 64, 1000, 3001])
+def test_pyramid_levels_are_cell_means(n) :
+    rng = np.random.default_rng(n)
+    v = rng.random(n)
+    v[rng.random(n) < 0.1] = np.nan
+    r = 5
+    images = hb.hilbert_pyramid(v, r, r + 1)
+    assert len(images) == r + 1
+    for k, image in zip(range(r, -1, -1), images) :
+        assert image.shape == (2 ** k, 2 ** k)
+        assert np.allclose(image, brute_force_bin(v, k), equal_nan = True)
+
+@pytest.mark.parametrize('stat', hb.HILBERT_STATS)
+@pytest.mark.parametrize('n', [5, 64, 1000, 4099])
+def test_hilbert_bin_matches_brute_force(n, stat) :
+    rng = np.random.default_rng(n)
+    v = rng.random(n)
+    v[rng.random(n) < 0.2] = np.nan
+    assert np.allclose(hb.hilbert_bin(v, 4, stat), brute_force_bin(v, 4, stat), equal_nan = True)
+
+@pytest.mark.parametrize('stat', hb.HILBERT_STATS)
+def test_pyramid_levels_equal_direct_binning(stat) :
+    rng = np.random.default_rng(1)
+    v = rng.random(3001)
+    v[rng.random(len(v)) < 0.1] = np.nan
+    r = 5
+    images = hb.hilbert_pyramid(v, r, r + 1, stat)
+    for k, image in zip(range(r, -1, -1), images) :
+        assert np.allclose(image, hb.hilbert_bin(v, k, stat), equal_nan = True)
+
+def test_bin_cells_of_a_slot_range() :
+    rng = np.random.default_rng(2)
+    v = rng.random(500)
+    cells = hb.hilbert_cells(len(v), 3, 100, 300)
+    values = hb.bin_cells(v[100:300], cells - cells[0], cells[-1] - cells[0] + 1)
+    full = hb.bin_cells(v, hb.hilbert_cells(len(v), 3), 64)
+    assert np.allclose(values[1:-1], full[cells[0] + 1 : cells[-1]])
+
+def test_cell_slots_invert_cells() :
+    n, r = 1234, 4
+    cells = hb.hilbert_cells(n, r)
+    starts = hb.hilbert_cell_slots(np.arange(4 ** r + 1), n, r)
+    for cell in range(4 ** r) :
+        assert np.all(cells[starts[cell] : starts[cell + 1]] == cell)
+    assert starts[-1] == n
+
+def test_unknown_statistic() :
+    with pytest.raises(ValueError) :
+        hb.hilbert_bin(np.zeros(4), 1, 'median')
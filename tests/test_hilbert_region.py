@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+import hilbert as hb
+from cg_index import make_cg_index, locate_cg_slots, cg_slot_coordinates
+from hilbert_region import slots_to_pixels, pixels_to_slots, genome_to_pixels, pixels_to_genome, slots_tile, region_tile
+
+# slot -> pixel -> slot range holds the slot, for binned and interpolated
+# images of meshes finer and coarser than the curve
+
+@pytest.mark.parametrize('n, r, N', [
+    (1000, 3, None), (4099, 5, None),
+    (1000, 3, 9), (1000, 3, 17), (3000, 5, 300), (500, 7, 257), (20000, 5, 65), (777, 4, 5)])
+def test_slot_pixel_round_trip(n, r, N) :
+    slots = np.arange(n)
+    x, y = slots_to_pixels(slots, n, r, N)
+    slot_start, slot_end = pixels_to_slots(x, y, n, r, N)
+    assert np.all((slot_start <= slots) & (slots < slot_end))
+
+@pytest.mark.parametrize('n, r, N', [(1000, 3, None), (1000, 3, 9), (500, 7, 257)])
+def test_pixel_ranges_cover_only_drawn_pixels(n, r, N) :
+    size = 2 ** r if N == None else N
+    y, x = np.mgrid[0:size, 0:size]
+    slot_start, slot_end = pixels_to_slots(x.ravel(), y.ravel(), n, r, N)
+    drawn = np.zeros(size * size, dtype = bool)
+    px, py = slots_to_pixels(np.arange(n), n, r, N)
+    drawn[py * size + px] = True
+    assert np.array_equal(slot_end > slot_start, drawn)
+
+def test_binned_pixels_hold_their_cell() :
+    n, r = 1000, 3
+    slot_start, slot_end = pixels_to_slots(*hb.hilbert_index_to_xy_array(np.arange(4 ** r), r), n, r)
+    assert np.array_equal(slot_start[1:], slot_end[:-1])
+    assert (slot_start[0], slot_end[-1]) == (0, n)
+
+def test_pixels_off_the_image() :
+    slot_start, slot_end = pixels_to_slots([-1, 9, 0], [0, 0, 9], 100, 3, 9)
+    assert slot_start.tolist() == [-1, -1, -1] and slot_end.tolist() == [-1, -1, -1]
+    x, y = slots_to_pixels([-1, 100], 100, 3)
+    assert x.tolist() == [-1, -1] and y.tolist() == [-1, -1]
+
+def test_genome_pixel_lookup() :
+    cg_index = make_cg_index([('chr1', 0, 10000, np.arange(10, 10000, 10)), ('chr2', 10000, 5000, np.arange(7, 5000, 7))])
+    n = len(cg_index.positions)
+    for N in (None, 33) :
+        x, y = genome_to_pixels(cg_index, ['chr1', 'chr2'], [500, 70], 4, N)
+        ranges = pixels_to_genome(cg_index, x, y, 4, N)
+        assert ranges['chr_start'][0] == 'chr1' and ranges['pos_start'][0] <= 500 <= ranges['pos_end'][0]
+        assert ranges['chr_start'][1] == 'chr2' or ranges['chr_end'][1] == 'chr2'
+        assert np.all(ranges['slot_end'] <= n)
+
+def test_locate_and_slot_coordinates() :
+    cg_index = make_cg_index([('chr1', 0, 100, np.array([10, 20, 30])), ('chr2', 100, 50, np.array([5, 7]))])
+    assert locate_cg_slots(cg_index, ['chr1', 'chr1', 'chr2', 'chr3'], [1, 31, 6, 1]).tolist() == [0, 3, 4, -1]
+
+    names, positions = cg_slot_coordinates(cg_index, [0, 2, 3, 4])
+    assert list(names) == ['chr1', 'chr1', 'chr2', 'chr2']
+    assert positions.tolist() == [10, 30, 5, 7]
+
+# positions between CpGs snap to the next CpG, past the last CpG of a
+# chromosome they are off the image instead of on the next chromosome
+
+def test_genome_to_pixels_stays_on_the_chromosome() :
+    cg_index = make_cg_index([('chr1', 0, 100, np.array([10, 20, 30])), ('chr2', 100, 50, np.array([5, 7]))])
+    n, r = len(cg_index.positions), 2
+    x, y = genome_to_pixels(cg_index, ['chr1', b'chr1', 'chr1', 'chr2', 'chr2', 'chr3'], [15, 20, 31, 1, 8, 1], r)
+    expected_x, expected_y = slots_to_pixels([1, 1, -1, 3, -1, -1], n, r)
+    assert x.tolist() == expected_x.tolist() and y.tolist() == expected_y.tolist()
+    assert x[2] == -1 and y[2] == -1
+
+@pytest.mark.parametrize('slot_start, slot_end', [(0, 1000), (100, 140), (513, 514), (250, 750)])
+def test_slots_tile_is_a_crop_of_the_binned_image(slot_start, slot_end) :
+    v = np.random.default_rng(slot_start).random(1000)
+    r = 4
+    tile = slots_tile(v, slot_start, slot_end, r)
+    size = 2 ** tile.level
+    image = hb.hilbert_bin(v, r)
+    assert np.allclose(tile.image, image[tile.y : tile.y + size, tile.x : tile.x + size], equal_nan = True)
+    assert tile.slot_start <= slot_start and slot_end <= tile.slot_end
+
+def test_region_without_cpgs() :
+    cg_index = make_cg_index([('chr1', 0, 1000, np.arange(10, 1000, 10))])
+    with pytest.raises(ValueError) :
+        region_tile(cg_index, np.zeros(99), 'chr1', 991, 999, 3)
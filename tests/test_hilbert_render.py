@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+import hilbert as hb
+
+pytest.importorskip('scipy')
+import hilbert_render as hr
+from scipy.interpolate import griddata
+
+# the interpolated image griddata gives on the same mesh, rows along y
+
+def griddata_image(v, r, N) :
+    points = np.asarray(hb.hilbert_map(len(v), r))
+    xs, ys = np.mgrid[0:2 ** r:complex(N), 0:2 ** r:complex(N)]
+    return griddata((points[:, 0], points[:, 1]), v, (xs, ys), method = 'linear').T
+
+@pytest.mark.parametrize('n, r, N', [(200, 3, 17), (1000, 4, 33), (5000, 5, 40), (300, 4, 100)])
+def test_render_plan_matches_griddata(n, r, N) :
+    v = np.random.default_rng(n).random(n)
+    zs = hr.render_hilbert_map(v, r, N, hr.build_render_plan(n, r, N))
+    assert zs.shape == (N, N)
+    assert np.allclose(zs, griddata_image(v, r, N), equal_nan = True)
+
+def test_render_plan_save_load(tmp_path) :
+    plan = hr.build_render_plan(300, 3, 20)
+    filename = str(tmp_path / 'plan.npz')
+    hr.save_render_plan(plan, filename)
+    loaded = hr.load_render_plan(filename)
+    assert (loaded.n, loaded.r, loaded.N) == (300, 3, 20)
+    assert (loaded.matrix != plan.matrix).nnz == 0
+    assert np.array_equal(loaded.outside, plan.outside)
+
+def test_plans_are_cached_in_the_cache_folder(tmp_path) :
+    previous = hb.get_cache_dir()
+    hb.set_cache_dir(str(tmp_path))
+    try :
+        hr._plans.clear()
+        plan = hr.get_render_plan(200, 3, 12)
+        assert hr.get_render_plan(200, 3, 12) is plan
+        hr._plans.clear()
+        loaded = hr.get_render_plan(200, 3, 12)
+        assert loaded is not plan and (loaded.matrix != plan.matrix).nnz == 0
+    finally :
+        hb.set_cache_dir(previous)
+        hr._plans.clear()
+
+def test_render_hilbert_maps_stacks_single_renders() :
+    n, r, N = 700, 4, 25
+    V = np.random.default_rng(3).random((3, n))
+    plan = hr.build_render_plan(n, r, N)
+    zs = hr.render_hilbert_maps(V, r, N, plan)
+    for i in range(len(V)) :
+        assert np.allclose(zs[i], hr.render_hilbert_map(V[i], r, N, plan), equal_nan = True)
+
+# uint8 images keep 255 for missing pixels, beta 0 stays 0
+
+def test_uint8_images_keep_missing_apart_from_zero() :
+    zs = np.array([[0.0, 0.5], [1.2, np.nan]])
+    images = hr.to_image_dtype(zs, np.uint8)
+    assert images.tolist() == [[0, 127], [254, hr.UINT8_MISSING]]
+    back = hr.from_image_dtype(images)
+    assert np.isnan(back[1, 1]) and back[0, 0] == 0 and back[1, 0] == 1
+    assert abs(back[0, 1] - 0.5) <= 0.5 / 254
+
+def test_float_images_round_trip() :
+    zs = np.array([[0.25, np.nan]])
+    assert np.allclose(hr.from_image_dtype(hr.to_image_dtype(zs, np.float32)), zs, equal_nan = True)
+
+def test_new_image_store_rows_are_missing(tmp_path) :
+    from batch_hilbert_img import create_image_store
+
+    meta_data = np.array([(b'a', b'a.txt'), (b'b', b'b.txt')], dtype = [('file_id', 'S8'), ('file_name', 'S8')])
+    for dtype in ('float32', 'uint8') :
+        filename_store = str(tmp_path / 'store.{0}.npy'.format(dtype))
+        create_image_store(filename_store, meta_data, 4, dtype)
+        assert np.all(np.isnan(hr.from_image_dtype(np.load(filename_store))))
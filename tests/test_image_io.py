@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from image_io import gray_r_image, write_png, save_hilbert_image
+
+def test_gray_r_image_levels() :
+    zs = np.array([[0.0, 1.0], [0.5, np.nan]])
+    assert gray_r_image(zs).tolist() == [[255, 0], [127, 255]]
+    assert gray_r_image(zs, 16).tolist() == [[65535, 0], [32768, 65535]]
+
+def test_write_png_rejects_other_arrays(tmp_path) :
+    with pytest.raises(ValueError) :
+        write_png(str(tmp_path / 'x.png'), np.zeros((2, 2), dtype = np.float32))
+
+# the png gray levels are the colors plt.imsave(cmap = gray_r) writes
+
+def test_png_matches_matplotlib(tmp_path) :
+    matplotlib = pytest.importorskip('matplotlib')
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.cm as cm
+
+    zs = np.random.default_rng(0).random((37, 53))
+    zs[0, :5] = [0.0, 1.0, 1 / 256.0, 255 / 256.0, 0.5]
+    save_hilbert_image(str(tmp_path / 'a.png'), zs, 'png')
+    plt.imsave(str(tmp_path / 'b.png'), zs, cmap = cm.gray_r, vmin = 0, vmax = 1)
+
+    ours = plt.imread(str(tmp_path / 'a.png'))
+    theirs = plt.imread(str(tmp_path / 'b.png'))
+    assert ours.shape == zs.shape
+    assert np.array_equal(np.rint(ours * 255), np.rint(theirs[:, :, 0] * 255))
+
+def test_png16_and_npy(tmp_path) :
+    matplotlib = pytest.importorskip('matplotlib')
+    import matplotlib.pyplot as plt
+
+    zs = np.random.default_rng(1).random((8, 8))
+    save_hilbert_image(str(tmp_path / 'a.png'), zs, 'png16')
+    assert np.allclose(plt.imread(str(tmp_path / 'a.png')), 1 - zs, atol = 1 / 65535.0)
+
+    zs[2, 3] = np.nan
+    save_hilbert_image(str(tmp_path / 'a.npy'), zs, 'npy')
+    assert np.allclose(np.load(str(tmp_path / 'a.npy')), zs.astype(np.float32), equal_nan = True)
+
+def test_unknown_format(tmp_path) :
+    with pytest.raises(ValueError) :
+        save_hilbert_image(str(tmp_path / 'a.tif'), np.zeros((2, 2)), 'tif')
@@ -0,0 +1,70 @@
+import os
+import numpy as np
+import pytest
+
+from meta_data import load_meta_data, meta_table_cache_name, filter_meta_data, parse_meta_filters
+
+ROWS = [
+	'fid0,s0.txt,Lung,LUAD,True,60.0,white,False,11,Solid Tissue Normal,True',
+	'fid1,"s1, copy.txt",Lung,LUAD,False,,white,True,1,Primary Tumor,True',
+	'fid2,s2.txt,Kidney,KIRC,True,None,asian,True,1,Primary Tumor,False']
+
+def write_meta_csv(filename_meta, rows, mtime_ns = None) :
+	with open(filename_meta, 'w') as meta_file :
+		meta_file.write('\n'.join(rows) + '\n')
+	if mtime_ns != None :
+		os.utime(filename_meta, ns = (mtime_ns, mtime_ns))
+
+def test_meta_csv_is_parsed_and_cached(tmp_path) :
+	filename_meta = str(tmp_path / 'meta.csv')
+	write_meta_csv(filename_meta, ROWS)
+
+	meta_data = load_meta_data(filename_meta)
+	assert meta_data['file_id'].tolist() == [b'fid0', b'fid1', b'fid2']
+	assert meta_data['file_name'][1] == b's1, copy.txt'
+	assert np.isnan(meta_data['age'][1]) and np.isnan(meta_data['age'][2])
+	assert meta_data['sample_type_id'].tolist() == [11, 1, 1]
+
+	filename_table = meta_table_cache_name(filename_meta)
+	assert os.stat(filename_table).st_mtime_ns == os.stat(filename_meta).st_mtime_ns
+	cached = load_meta_data(filename_meta)
+	assert isinstance(cached, np.memmap)
+	assert cached.tobytes() == meta_data.tobytes()
+
+def test_edited_meta_csv_invalidates_the_cache(tmp_path) :
+	filename_meta = str(tmp_path / 'meta.csv')
+	write_meta_csv(filename_meta, ROWS, 10 ** 18)
+	assert len(load_meta_data(filename_meta)) == 3
+
+	write_meta_csv(filename_meta, ROWS[:2], 10 ** 18 + 10 ** 9)
+	meta_data = load_meta_data(filename_meta)
+	assert meta_data['file_id'].tolist() == [b'fid0', b'fid1']
+	assert os.stat(meta_table_cache_name(filename_meta)).st_mtime_ns == 10 ** 18 + 10 ** 9
+
+	# a csv set back to an older mtime is parsed again as well
+
+	write_meta_csv(filename_meta, ROWS[2:], 10 ** 18)
+	assert load_meta_data(filename_meta)['file_id'].tolist() == [b'fid2']
+
+def test_cache_of_another_layout_is_rebuilt(tmp_path) :
+	filename_meta = str(tmp_path / 'meta.csv')
+	write_meta_csv(filename_meta, ROWS)
+	mtime_ns = os.stat(filename_meta).st_mtime_ns
+	filename_table = meta_table_cache_name(filename_meta)
+	np.save(filename_table, np.zeros(3, dtype = [('file_id', 'S8')]))
+	os.utime(filename_table, ns = (mtime_ns, mtime_ns))
+
+	assert load_meta_data(filename_meta)['file_name'].tolist() == [b's0.txt', b's1, copy.txt', b's2.txt']
+
+def test_meta_filters(tmp_path) :
+	filename_meta = str(tmp_path / 'meta.csv')
+	write_meta_csv(filename_meta, ROWS)
+	meta_data = load_meta_data(filename_meta)
+
+	filters = parse_meta_filters(['is_tumor=True', 'primary_site=Lung,Kidney'])
+	assert filters == {'is_tumor' : [True], 'primary_site' : [b'Lung', b'Kidney']}
+	assert filter_meta_data(meta_data, filters)['file_id'].tolist() == [b'fid1', b'fid2']
+	assert filter_meta_data(meta_data, parse_meta_filters(['sample_type_id=11']))['file_id'].tolist() == [b'fid0']
+
+	with pytest.raises(ValueError) :
+		parse_meta_filters(['bogus=1'])
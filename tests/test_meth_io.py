@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from meth_io import METH_DTYPE, read_meth_data, read_meth_betas, _parse_chunk
+from meth_io import write_clean_meth_data, read_clean_meth_data
+
+# the genfromtxt reader the chunked parser replaced, the reference
+
+def genfromtxt_meth_data(filename_meth) :
+	meth_data = np.genfromtxt(filename_meth, delimiter = '\t', skip_header = 1,
+		usecols = (0, 1, 2, 3), autostrip = True,
+		dtype = ('|S12', '<f8', '|S8', '<u8'),
+		names = ('ref', 'beta', 'chr', 'pos'))
+
+	meth_data = meth_data[meth_data['chr'] != b'*']
+
+	return meth_data[~np.isnan(meth_data['beta'])]
+
+def write_random_meth_file(filename, rng, count) :
+	with open(filename, 'w') as meth_file :
+		meth_file.write('Composite Element REF\tBeta_value\tChromosome\tStart\tEnd\tGene_Symbol\n')
+		for i in range(count) :
+			beta = 'NA' if rng.random() < 0.1 else '{0:.6f}'.format(rng.random())
+			if rng.random() < 0.05 :
+				chrname, pos = '*', 0
+			else :
+				chrname, pos = 'chr{0}'.format(rng.integers(1, 23)), int(rng.integers(1, 10 ** 8))
+			meth_file.write('cg{0:08d}\t{1}\t{2}\t{3}\t{4}\tGENE;OTHER\n'.format(i, beta, chrname, pos, pos + 1))
+			if i % 97 == 0 :
+				meth_file.write('\n')
+
+@pytest.mark.parametrize('chunk_rows', [1, 7, 1000, 1 << 16])
+def test_read_meth_data_matches_genfromtxt(tmp_path, chunk_rows) :
+	filename_meth = str(tmp_path / 'meth.txt')
+	write_random_meth_file(filename_meth, np.random.default_rng(chunk_rows), 2500)
+
+	meth_data = read_meth_data(filename_meth, chunk_rows = chunk_rows)
+	expected = genfromtxt_meth_data(filename_meth)
+	for field in ('ref', 'beta', 'chr', 'pos') :
+		assert np.array_equal(meth_data[field], expected[field])
+
+def test_unclean_rows_and_betas(tmp_path) :
+	filename_meth = str(tmp_path / 'meth.txt')
+	write_random_meth_file(filename_meth, np.random.default_rng(5), 300)
+
+	meth_data = read_meth_data(filename_meth, clean = False, chunk_rows = 64)
+	assert len(meth_data) == 300
+	assert np.all(meth_data['pos'][meth_data['chr'] == b'*'] == 0)
+
+	refs, betas = read_meth_betas(filename_meth, chunk_rows = 64)
+	assert np.array_equal(refs, meth_data['ref'])
+	assert np.array_equal(betas, meth_data['beta'], equal_nan = True)
+
+def test_parse_chunk_missing_values() :
+	chunk = _parse_chunk(['cg1\tNA\tchr1\t5\n', 'cg2\t\tchrX\tNA\n', 'cg3\t0.25\t*\t*\n', 'cg4\tNaN\tchr2\t-1\n'])
+	assert chunk['ref'].tolist() == [b'cg1', b'cg2', b'cg3', b'cg4']
+	assert np.isnan(chunk['beta'][[0, 1, 3]]).all() and chunk['beta'][2] == 0.25
+	assert chunk['pos'].tolist() == [5, 0, 0, 0]
+
+def test_empty_file(tmp_path) :
+	filename_meth = str(tmp_path / 'meth.txt')
+	with open(filename_meth, 'w') as meth_file :
+		meth_file.write('Composite Element REF\tBeta_value\tChromosome\tStart\n')
+	assert len(read_meth_data(filename_meth)) == 0
+	assert len(read_meth_betas(filename_meth)[0]) == 0
+
+# cleaned methylation files
+
+def random_clean_data(rng, count, chr_count) :
+	meth_data = np.zeros(count, dtype = METH_DTYPE)
+	meth_data['ref'] = ['cg{0:08d}'.format(i) for i in range(count)]
+	meth_data['beta'] = rng.random(count)
+	meth_data['chr'] = ['chr{0}'.format(i) for i in rng.integers(0, chr_count, size = count)]
+	meth_data['pos'] = rng.integers(1, 2 ** 31, size = count)
+
+	return meth_data
+
+@pytest.mark.parametrize('chr_count', [1, 24, 300])
+def test_clean_npz_round_trip(tmp_path, chr_count) :
+	meth_data = random_clean_data(np.random.default_rng(chr_count), 1000, chr_count)
+	filename_clean = str(tmp_path / 'sample.clean.npz')
+	write_clean_meth_data(meth_data, filename_clean)
+
+	chr_code = np.load(filename_clean)['chr_code']
+	assert chr_code.dtype == (np.uint8 if chr_count <= 256 else np.uint16)
+
+	loaded = read_clean_meth_data(filename_clean)
+	for field in ('ref', 'chr', 'pos') :
+		assert np.array_equal(loaded[field], meth_data[field])
+	assert np.array_equal(loaded['beta'], meth_data['beta'].astype(np.float32))
+
+def test_clean_csv_round_trip(tmp_path) :
+	meth_data = random_clean_data(np.random.default_rng(0), 100, 5)
+	filename_clean = str(tmp_path / 'sample.clean.csv')
+	write_clean_meth_data(meth_data, filename_clean)
+	loaded = read_clean_meth_data(filename_clean)
+	for field in ('ref', 'chr', 'pos') :
+		assert np.array_equal(loaded[field], meth_data[field])
+	assert np.allclose(loaded['beta'], meth_data['beta'], atol = 1e-6)
+
+def test_empty_clean_npz(tmp_path) :
+	filename_clean = str(tmp_path / 'sample.clean.npz')
+	write_clean_meth_data(np.zeros(0, dtype = METH_DTYPE), filename_clean)
+	assert len(read_clean_meth_data(filename_clean)) == 0
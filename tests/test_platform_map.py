@@ -0,0 +1,64 @@
+import numpy as np
+
+from cg_index import make_cg_index
+from platform_map import build_platform_map, save_platform_map, load_platform_map, find_platform_rows, apply_platform_map
+
+def write_meth_file(filename, probes) :
+	with open(filename, 'w') as meth_file :
+		meth_file.write('Composite Element REF\tBeta_value\tChromosome\tStart\tGene\n')
+		for ref, beta, chrname, pos in probes :
+			meth_file.write('{0}\t{1}\t{2}\t{3}\tG\n'.format(ref, beta, chrname, pos))
+
+PROBES = [('cg03', '0.3', 'chr1', 30), ('cg01', '0.1', 'chr1', 10), ('cg02', 'NA', 'chr1', 20),
+	('cg05', '0.5', 'chr2', 6), ('cg04', '0.4', 'chr1', 31), ('cg06', '0.6', '*', 0)]
+
+def make_platform(tmp_path) :
+	cg_index = make_cg_index([('chr1', 0, 100, np.array([10, 20, 30])), ('chr2', 100, 50, np.array([5, 6]))])
+	filename_manifest = str(tmp_path / 'manifest.txt')
+	write_meth_file(filename_manifest, PROBES)
+
+	return cg_index, build_platform_map(cg_index, filename_manifest)
+
+def test_platform_map_save_load(tmp_path) :
+	cg_index, platform_map = make_platform(tmp_path)
+	assert platform_map.refs.tolist() == [probe[0].encode() for probe in PROBES]
+	assert platform_map.slots.tolist() == [2, 0, 1, 4, -1, -1]
+
+	filename_platform = str(tmp_path / 'platform.npz')
+	save_platform_map(platform_map, filename_platform)
+	loaded = load_platform_map(filename_platform)
+	for field in ('refs', 'chrs', 'pos', 'slots', 'order', 'sorted_refs') :
+		assert np.array_equal(getattr(loaded, field), getattr(platform_map, field))
+	assert loaded.cg_count == len(cg_index.positions)
+
+def test_rows_of_files_in_and_off_the_layout(tmp_path) :
+	_, platform_map = make_platform(tmp_path)
+	rows, off_layout_count = find_platform_rows(platform_map, platform_map.refs.copy())
+	assert rows.tolist() == list(range(len(PROBES))) and off_layout_count == 0
+
+	# one probe missing from the map, the rest at their own row except two
+	# swapped ones
+
+	refs = np.array([b'cg03', b'cg02', b'cg01', b'cg05', b'cg99'])
+	rows, off_layout_count = find_platform_rows(platform_map, refs)
+	assert rows.tolist() == [0, 2, 1, 3, -1]
+	assert off_layout_count == 3
+
+	# a truncated file in the platform order is on the layout
+
+	rows, off_layout_count = find_platform_rows(platform_map, platform_map.refs[:4].copy())
+	assert rows.tolist() == [0, 1, 2, 3] and off_layout_count == 0
+
+def test_apply_platform_map_matches_the_full_parse(tmp_path) :
+	_, platform_map = make_platform(tmp_path)
+	refs = np.array([b'cg05', b'cg01', b'cg02', b'cg06', b'cg99', b'cg03'])
+	betas = np.array([0.5, 0.1, np.nan, 0.6, 0.9, 0.3])
+	rows, _ = find_platform_rows(platform_map, refs)
+	meth_data, cg_meth = apply_platform_map(platform_map, rows, betas)
+
+	# nan betas, unknown probes and probes without a chromosome are dropped
+
+	assert meth_data['ref'].tolist() == [b'cg05', b'cg01', b'cg03']
+	assert meth_data['chr'].tolist() == [b'chr2', b'chr1', b'chr1']
+	assert meth_data['pos'].tolist() == [6, 10, 30]
+	assert cg_meth.tolist() == [0.1, 0.0, 0.3, 0.0, 0.5]
@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import pytest
+
+from meth_io import METH_DTYPE, read_meth_data, read_clean_meth_data
+from split_methylation_data import partition_by_chr, split_methylation_file
+
+def random_meth_data(rng, count, chr_count) :
+	meth_data = np.zeros(count, dtype = METH_DTYPE)
+	meth_data['ref'] = ['cg{0:08d}'.format(i) for i in range(count)]
+	meth_data['beta'] = rng.random(count)
+	meth_data['chr'] = ['chr{0}'.format(i) for i in rng.integers(0, chr_count, size = count)]
+	meth_data['pos'] = rng.integers(1, 10 ** 8, size = count)
+
+	return meth_data
+
+# the shards must be what one boolean mask per chr (the split before the
+# single sort) gives, rows in file order
+
+@pytest.mark.parametrize('chr_count', [1, 24, 400])
+def test_partition_matches_masks(chr_count) :
+	meth_data = random_meth_data(np.random.default_rng(chr_count), 5000, chr_count)
+	shards = partition_by_chr(meth_data)
+
+	assert [chrname for chrname, _ in shards] == sorted(set(meth_data['chr']))
+	for chrname, chr_data in shards :
+		assert np.array_equal(chr_data, meth_data[meth_data['chr'] == chrname])
+
+def test_partition_of_no_rows() :
+	assert partition_by_chr(np.zeros(0, dtype = METH_DTYPE)) == []
+
+@pytest.mark.parametrize('as_csv, n_threads', [(False, 1), (False, 4), (True, 2)])
+def test_split_file_shards(tmp_path, as_csv, n_threads) :
+	filename_meth = str(tmp_path / 'meth.txt')
+	with open(filename_meth, 'w') as meth_file :
+		meth_file.write('Composite Element REF\tBeta_value\tChromosome\tStart\n')
+		for i, (beta, chrname, pos) in enumerate([('0.1', 'chr2', 5), ('NA', 'chr1', 7), ('0.3', 'chr1', 9),
+			('0.4', '*', 0), ('0.5', 'chrX', 1), ('0.6', 'chr2', 3)]) :
+			meth_file.write('cg{0}\t{1}\t{2}\t{3}\n'.format(i, beta, chrname, pos))
+
+	folder_output = str(tmp_path / 'out')
+	os.makedirs(folder_output)
+	split_methylation_file(filename_meth, folder_output, as_csv, n_threads)
+
+	extension = '.csv' if as_csv else '.clean.npz'
+	assert sorted(os.listdir(folder_output)) == sorted(chrname + extension for chrname in ('chr1', 'chr2', 'chrX'))
+	meth_data = read_meth_data(filename_meth)
+	for chrname in (b'chr1', b'chr2', b'chrX') :
+		shard = read_clean_meth_data(os.path.join(folder_output, chrname.decode() + extension))
+		expected = meth_data[meth_data['chr'] == chrname]
+		assert shard['ref'].tolist() == expected['ref'].tolist()
+		assert shard['pos'].tolist() == expected['pos'].tolist()